@@ -1,29 +1,136 @@
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
+from core.trace import traced
+from core.registry_store import ABUNDANCE_XLSX, read_abundance_weights, registry_table
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
-ABUNDANCE_XLSX = PROJECT_ROOT / "data" / "registry" / "обилие.xlsx"
 
 
 def load_abundance_weights(xlsx_path: Path = ABUNDANCE_XLSX) -> dict[str, float]:
-    df = pd.read_excel(xlsx_path)
-    code_col = df.columns[0]
-    w_col = df.columns[1]
-
-    weights = (
-        df[[code_col, w_col]]
-        .dropna()
-        .assign(
-            code=lambda x: x[code_col].astype("string").str.strip(),
-            w=lambda x: pd.to_numeric(x[w_col], errors="coerce"),
-        )
-        .dropna(subset=["code", "w"])
-    )
+    # стандартная книга — из скомпилированного реестра (core.registry_store)
+    if Path(xlsx_path) == ABUNDANCE_XLSX:
+        weights = registry_table("abundance")
+    else:
+        weights = read_abundance_weights(xlsx_path)
     return dict(zip(weights["code"], weights["w"]))
 
 
+@traced()
 def attach_weights(df: pd.DataFrame, abundance_col: str = "abundance_class", out_col: str = "w") -> pd.DataFrame:
     weights = load_abundance_weights()
     out = df.copy()
     out[out_col] = out[abundance_col].astype("string").str.strip().map(weights)
     return out
+
+
+# ----------------------------
+# Реестр схем взвешивания: все схемы сразу (матрица весов)
+# ----------------------------
+
+# шкала Друде по возрастанию; переходные классы ("sol-sp", "cop1-2") — между соседями,
+# суффикс "gr" (группами) на вес не влияет
+DRUDE_CLASSES = ["un", "sol", "sp", "cop1", "cop2", "cop3", "soc"]
+DRUDE_ORDINAL = {c: 2 * i + 1 for i, c in enumerate(DRUDE_CLASSES)}  # un=1, sol=3, ..., cop3=11
+# середины классов проективного покрытия (%) по соответствию Друде -> Браун-Бланке:
+# un ~ r, sol ~ +, sp ~ 1 (1-5), cop1 ~ 2 (5-25), cop2 ~ 3 (25-50), cop3 ~ 4 (50-75), soc ~ 5 (75-100)
+DRUDE_COVER_MIDPOINT = {"un": 0.1, "sol": 0.5, "sp": 3.0, "cop1": 15.0, "cop2": 37.5, "cop3": 62.5, "soc": 87.5}
+
+def parse_drude_class(code: str) -> tuple[str, ...] | None:
+    """
+    "cop1-2" -> ("cop1", "cop2"), "solgr-sp" -> ("sol", "sp"), "un" -> ("un",).
+    Неизвестный код -> None.
+    """
+    if code is None or pd.isna(code):
+        return None
+    parts = str(code).strip().lower().replace("gr", "").split("-")
+    out = []
+    for p in parts:
+        p = p.strip()
+        if p.isdigit() and out and out[-1].startswith("cop"):
+            p = f"cop{p}"  # "cop1-2" -> вторая часть "2" = cop2
+        if p not in DRUDE_ORDINAL:
+            return None
+        out.append(p)
+    return tuple(out) or None
+
+
+def _mean_of_parts(table: dict[str, float], parts: tuple[str, ...] | None) -> float:
+    if parts is None:
+        return float("nan")
+    return float(sum(table[p] for p in parts) / len(parts))
+
+
+def _presence(code: str, parts: tuple[str, ...] | None) -> float:
+    return 1.0 if parts is not None else float("nan")
+
+
+def _ordinal(code: str, parts: tuple[str, ...] | None) -> float:
+    return _mean_of_parts(DRUDE_ORDINAL, parts)
+
+
+def _cover_midpoint(code: str, parts: tuple[str, ...] | None) -> float:
+    return _mean_of_parts(DRUDE_COVER_MIDPOINT, parts)
+
+
+def _log_cover(code: str, parts: tuple[str, ...] | None) -> float:
+    return float(np.log1p(_cover_midpoint(code, parts)))
+
+
+# схема: fn(класс обилия как в данных, разобранный класс Друде) -> вес (NaN = не определён)
+WEIGHT_SCHEMES = {
+    "registry": None,  # как attach_weights: веса из обилие.xlsx (подставляются в weight_scheme_table)
+    "presence": _presence,
+    "ordinal": _ordinal,
+    "cover_midpoint": _cover_midpoint,
+    "log_cover": _log_cover,
+}
+
+
+def register_weight_scheme(name: str, fn) -> None:
+    """Добавить схему: fn(code: str, parts: tuple | None) -> float (NaN = вес не определён)."""
+    WEIGHT_SCHEMES[name] = fn
+
+
+def weight_scheme_table(codes, schemes=None) -> pd.DataFrame:
+    """
+    Таблица весов: строка = класс обилия (как в данных), колонка = схема.
+    """
+    schemes = list(schemes or WEIGHT_SCHEMES)
+    unknown = [s for s in schemes if s not in WEIGHT_SCHEMES]
+    if unknown:
+        raise KeyError(f"Unknown weight schemes: {unknown}. Available: {list(WEIGHT_SCHEMES)}")
+
+    codes = pd.Index(pd.Series(codes, dtype="string").str.strip().dropna().unique())
+    table = pd.DataFrame(index=codes)
+    parts = [parse_drude_class(c) for c in codes]
+    for s in schemes:
+        if s == "registry":
+            table[s] = codes.to_series().map(load_abundance_weights()).to_numpy(dtype=float, na_value=np.nan)
+        else:
+            table[s] = [WEIGHT_SCHEMES[s](c, p) for c, p in zip(codes, parts)]
+    return table
+
+
+def weight_column(scheme: str, prefix: str = "w_") -> str:
+    return f"{prefix}{scheme}"
+
+
+@traced()
+def attach_weight_matrix(
+    df: pd.DataFrame,
+    schemes=None,
+    abundance_col: str = "abundance_class",
+    prefix: str = "w_",
+) -> pd.DataFrame:
+    """
+    Как attach_weights, но сразу все схемы: колонки w_registry, w_presence, w_ordinal,
+    w_cover_midpoint, w_log_cover (или только перечисленные в schemes).
+    """
+    out = df.copy()
+    codes = out[abundance_col].astype("string").str.strip()
+    table = weight_scheme_table(codes, schemes)
+    for s in table.columns:
+        out[weight_column(s, prefix)] = codes.map(table[s]).to_numpy(dtype=float, na_value=np.nan)
+    return out
@@ -6,6 +6,8 @@ from typing import Any, Callable
 
 import pandas as pd
 
+from core.trace import traced
+
 # import normalize  # твой normalize.py (с функциями load_observations/load_metadata)
 
 
@@ -87,6 +89,7 @@ FilterValue = Any
 FilterSpec = dict[str, FilterValue]
 
 
+@traced()
 def apply_filters(df: pd.DataFrame, filters: FilterSpec | None) -> pd.DataFrame:
     """
     filters supports:
@@ -155,6 +158,7 @@ def to_descriptions(df: pd.DataFrame) -> pd.DataFrame:
     return df.drop_duplicates(subset=DESCRIPTION_KEYS, keep="first").copy()
 
 
+@traced()
 def aggregate_descriptions(
     df: pd.DataFrame,
     *,
@@ -232,6 +236,7 @@ def add_profile_attributes(merged: pd.DataFrame, reg: pd.DataFrame) -> pd.DataFr
 # Build merged from RAW (multiple .xlsm)
 # ----------------------------
 
+@traced()
 def load_processed() -> pd.DataFrame:
     if not OBS_FILE.exists():
         raise FileNotFoundError(f"Missing {OBS_FILE}. Run normalize.py first.")
@@ -0,0 +1,167 @@
+# core/async_runner.py
+"""
+asyncio-обёртка над run_scenario для неблокирующих вызывающих (UI, сервисный слой).
+
+Сценарий раскладывается на те же стадии, что и в core.scenario_dag (compile_plan
+из одной спеки: eco_desc -> eco_year -> eco_vs_climate и т.д.), каждая стадия
+уходит в executor (по умолчанию — пул потоков этого модуля), а между стадиями
+проверяется отмена: task.cancel() прерывает сценарий на ближайшей границе стадий
+(уже запущенная стадия досчитывается в фоне, её результат оседает в кеше).
+
+    async for ev in scenario_events(spec):        # события по стадиям + результат
+        print(ev)
+    df, plot_path = await run_scenario_async(spec, on_progress=print)
+    results = await run_scenarios_async(specs)    # несколько сценариев сразу
+
+LatestRunner — "актуален только последний запрос" по ключу (например, по вкладке UI):
+новый запуск с тем же ключом отменяет предыдущий, ещё не закончившийся.
+
+Стадии нескольких сценариев (в том числе с графиками) идут в пуле потоков одновременно:
+core.plotting рисует в собственный Figure на вызов (без глобального состояния pyplot)
+и пишет PNG атомарно, так что совпадающие out_name не портят друг друга.
+
+Executor можно передать свой (ThreadPoolExecutor с другим числом потоков,
+ProcessPoolExecutor — тогда спеки и промежуточные таблицы передаются через pickle,
+а кеш в памяти у каждого процесса свой).
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Optional
+
+from core.scenario_dag import compile_plan, plan_status, run_node
+
+DEFAULT_ASYNC_WORKERS = 4
+
+_EXECUTOR: Optional[Executor] = None
+
+
+def default_executor() -> Executor:
+    """Общий пул потоков модуля (создаётся при первом обращении)."""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=DEFAULT_ASYNC_WORKERS, thread_name_prefix="scenario")
+    return _EXECUTOR
+
+
+def set_default_executor(executor: Optional[Executor]) -> None:
+    """Заменить пул по умолчанию (None — создать заново при следующем вызове). Старый не закрывается."""
+    global _EXECUTOR
+    _EXECUTOR = executor
+
+
+@dataclass
+class ScenarioEvent:
+    scenario: str
+    kind: str                  # "stage_start" | "stage_done" | "done"
+    stage: str = ""
+    step: int = 0              # номер стадии (с 1)
+    total: int = 0             # сколько стадий будет выполнено (взятые из кеша предки не считаются)
+    cache: str = ""            # "memory" | "disk" | "compute" — по плану (см. plan_status)
+    seconds: float = 0.0       # длительность стадии / всего сценария для "done"
+    result: Any = None         # только у "done": (df, plot_path)
+
+    def __str__(self) -> str:
+        if self.kind == "done":
+            return f"{self.scenario}: done in {self.seconds:.2f} s"
+        tail = f" {self.seconds:.2f} s" if self.kind == "stage_done" else ""
+        return f"{self.scenario}: [{self.step}/{self.total}] {self.stage} ({self.cache}) {self.kind}{tail}"
+
+
+async def scenario_events(spec: Any, executor: Optional[Executor] = None) -> AsyncIterator[ScenarioEvent]:
+    """
+    Выполняет сценарий по стадиям и отдаёт события; последнее (kind="done") несёт результат.
+    Отмена задачи (CancelledError) срабатывает на ожидании текущей стадии — следующие не запускаются.
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or default_executor()
+    name = getattr(spec, "name", "scenario")
+
+    # компиляция плана смотрит в кеш (stat файлов) — тоже не в цикле событий
+    plan = await loop.run_in_executor(executor, compile_plan, [spec])
+    status = await loop.run_in_executor(executor, plan_status, plan)
+    steps = [n for n in plan.nodes if status[n] != "skip"]
+
+    t_start = time.perf_counter()
+    results: Dict[str, Any] = {}
+    for i, node_id in enumerate(steps, start=1):
+        stage = plan.nodes[node_id].stage
+        yield ScenarioEvent(name, "stage_start", stage, i, len(steps), status[node_id])
+        t0 = time.perf_counter()
+        results[node_id] = await loop.run_in_executor(executor, run_node, plan, node_id, dict(results))
+        yield ScenarioEvent(name, "stage_done", stage, i, len(steps), status[node_id], time.perf_counter() - t0)
+
+    output = results[plan.outputs[name]]
+    yield ScenarioEvent(name, "done", seconds=time.perf_counter() - t_start, result=output)
+
+
+async def run_scenario_async(
+    spec: Any,
+    *,
+    executor: Optional[Executor] = None,
+    on_progress: Optional[Callable[[ScenarioEvent], None]] = None,
+):
+    """Асинхронный run_scenario: возвращает (df, plot_path); on_progress получает события стадий."""
+    result = None
+    async for ev in scenario_events(spec, executor):
+        if on_progress:
+            on_progress(ev)
+        if ev.kind == "done":
+            result = ev.result
+    return result
+
+
+async def run_scenarios_async(
+    specs: list[Any],
+    *,
+    executor: Optional[Executor] = None,
+    on_progress: Optional[Callable[[ScenarioEvent], None]] = None,
+    return_exceptions: bool = True,
+) -> list[Any]:
+    """
+    Несколько сценариев одновременно (общий executor; одинаковые ключи кеша считаются
+    один раз — single-flight в core.cache). Результаты — в порядке specs; при
+    return_exceptions=True ошибка сценария возвращается на его месте, остальные не страдают.
+    """
+    return await asyncio.gather(
+        *(run_scenario_async(s, executor=executor, on_progress=on_progress) for s in specs),
+        return_exceptions=return_exceptions,
+    )
+
+
+class LatestRunner:
+    """
+    Последний запрос по ключу побеждает:
+
+        runner = LatestRunner()
+        df, plot = await runner.run("eco_tab", spec)   # предыдущий запуск "eco_tab" отменён
+
+    Отменённый вызов получает asyncio.CancelledError.
+    """
+
+    def __init__(self, executor: Optional[Executor] = None) -> None:
+        self.executor = executor
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def cancel(self, key: Hashable) -> None:
+        task = self._tasks.pop(key, None)
+        if task is not None and not task.done():
+            task.cancel()
+
+    async def run(
+        self,
+        key: Hashable,
+        spec: Any,
+        on_progress: Optional[Callable[[ScenarioEvent], None]] = None,
+    ):
+        self.cancel(key)
+        task = asyncio.ensure_future(run_scenario_async(spec, executor=self.executor, on_progress=on_progress))
+        self._tasks[key] = task
+        try:
+            return await task
+        finally:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
@@ -0,0 +1,116 @@
+# core/batch_executor.py
+"""
+Пакетный прогон списка спек (ScenarioSpec / SimpleNamespace) в пуле процессов.
+
+    for r in run_batch(specs, workers=4, on_progress=print):
+        if r.error is None:
+            df, plot_path = r.result
+
+Результаты отдаются по мере готовности (генератор), а не после всей сетки;
+on_progress получает BatchProgress (сделано / всего / ошибки / прошло / ETA).
+Ошибка одной спеки не останавливает остальные: она приходит как BatchResult.error
+(так же, как try/except вокруг run_scenario в старых циклах).
+
+runner — любая функция модуля (spec) -> результат, по умолчанию run_scenario;
+для сетки eco_vs_climate целиком — core.grid_engine.run_grid_spec. Она должна
+импортироваться по имени (pickle), lambda не подойдёт. workers <= 1 — без пула,
+в текущем процессе (удобно для отладки и там, где fork дорог).
+"""
+from __future__ import annotations
+
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from core.scenario_runner import run_scenario
+
+
+@dataclass
+class BatchResult:
+    index: int                    # позиция спеки во входном списке
+    spec: Any
+    result: Any = None            # то, что вернул runner (для run_scenario — (df, plot_path))
+    error: Optional[str] = None   # "TypeName: message" или None
+    seconds: float = 0.0
+
+
+@dataclass
+class BatchProgress:
+    done: int
+    total: int
+    failed: int
+    elapsed: float
+    last: BatchResult
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Оценка оставшегося времени (с) по среднему темпу; None, пока ничего не готово."""
+        if self.done == 0:
+            return None
+        return self.elapsed / self.done * (self.total - self.done)
+
+    def __str__(self) -> str:
+        eta = "?" if self.eta is None else f"{self.eta:.1f} s"
+        failed = f", {self.failed} failed" if self.failed else ""
+        return f"[{self.done}/{self.total}{failed}] elapsed {self.elapsed:.1f} s, ETA {eta}"
+
+
+def _run_one(runner: Callable[[Any], Any], index: int, spec: Any) -> BatchResult:
+    # исключение ловим в воркере: в главный процесс уходит только строка
+    # (не все исключения и их аргументы переживают pickle)
+    t0 = time.perf_counter()
+    try:
+        return BatchResult(index, spec, runner(spec), None, time.perf_counter() - t0)
+    except Exception as e:
+        return BatchResult(index, spec, None, f"{type(e).__name__}: {e}", time.perf_counter() - t0)
+
+
+def run_batch(
+    specs: Iterable[Any],
+    runner: Callable[[Any], Any] = run_scenario,
+    *,
+    workers: int = 1,
+    on_progress: Optional[Callable[[BatchProgress], None]] = None,
+) -> Iterator[BatchResult]:
+    """
+    Прогоняет runner(spec) для каждой спеки (workers процессов) и отдаёт BatchResult
+    в порядке завершения. Если генератор бросили (break / исключение), ещё не
+    начатые спеки отменяются.
+    """
+    specs = list(specs)
+    total = len(specs)
+    t0 = time.perf_counter()
+    done = failed = 0
+
+    def _report(r: BatchResult) -> BatchResult:
+        nonlocal done, failed
+        done += 1
+        failed += r.error is not None
+        if on_progress:
+            on_progress(BatchProgress(done, total, failed, time.perf_counter() - t0, r))
+        return r
+
+    if workers <= 1:
+        for i, spec in enumerate(specs):
+            yield _report(_run_one(runner, i, spec))
+        return
+
+    ex = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [ex.submit(_run_one, runner, i, spec) for i, spec in enumerate(specs)]
+        for fut in as_completed(futures):
+            yield _report(fut.result())
+    finally:
+        ex.shutdown(wait=True, cancel_futures=True)
+
+
+def run_batch_ordered(
+    specs: Iterable[Any],
+    runner: Callable[[Any], Any] = run_scenario,
+    *,
+    workers: int = 1,
+    on_progress: Optional[Callable[[BatchProgress], None]] = None,
+) -> list[BatchResult]:
+    """run_batch целиком, результаты — в порядке входных спек."""
+    return sorted(run_batch(specs, runner, workers=workers, on_progress=on_progress), key=lambda r: r.index)
@@ -0,0 +1,134 @@
+# core/bootstrap.py
+"""
+Бутстреп-доверительные интервалы для годовых рядов экоспектра.
+
+Годовое значение = среднее метрики по описаниям года. Реплика бутстрепа —
+пересэмплирование описаний внутри каждого года (с возвращением, тот же размер).
+Все реплики считаются сразу: матрица весов пересэмплирования W (реплики x описания,
+W[b, i] = сколько раз описание i попало в реплику b) умножается на вектор метрики,
+суммы берутся по блокам годов. Интервал — перцентильный.
+
+Настройка в сценарии: spec.bootstrap = True | int (n_boot) | dict(n_boot=, ci=, seed=).
+"""
+from __future__ import annotations
+
+from typing import Any, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_N_BOOT = 2000
+DEFAULT_CI = 0.95
+DEFAULT_SEED = 42
+# сколько элементов матрицы весов держать в памяти за раз (реплики режутся на блоки)
+_MAX_BLOCK_CELLS = 20_000_000
+
+
+def bootstrap_options(value: Any) -> Optional[dict[str, Any]]:
+    """
+    spec.bootstrap -> dict(n_boot, ci, seed) или None (выключено).
+    True -> значения по умолчанию, int -> n_boot, dict -> переопределения.
+    """
+    if value is None or value is False:
+        return None
+    opts = {"n_boot": DEFAULT_N_BOOT, "ci": DEFAULT_CI, "seed": DEFAULT_SEED}
+    if isinstance(value, dict):
+        unknown = set(value) - set(opts)
+        if unknown:
+            raise KeyError(f"Unknown bootstrap options: {sorted(unknown)} (expected {sorted(opts)})")
+        opts.update(value)
+    elif value is not True:
+        opts["n_boot"] = int(value)
+    if opts["n_boot"] < 1:
+        return None
+    if not 0 < opts["ci"] < 1:
+        raise ValueError(f"bootstrap ci must be in (0, 1), got {opts['ci']}")
+    return opts
+
+
+def resample_weights(sizes: np.ndarray, n_boot: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Матрица весов (n_boot x sum(sizes)): в каждой реплике описания каждого блока
+    пересэмплируются с возвращением внутри блока (мультиномиальные счётчики).
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    n = int(sizes.sum())
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    # для каждой позиции — случайное описание из её блока
+    block_start = np.repeat(starts, sizes)
+    block_size = np.repeat(sizes, sizes)
+    picks = block_start + (rng.random((n_boot, n)) * block_size).astype(np.int64)
+
+    flat = (np.arange(n_boot, dtype=np.int64)[:, None] * n + picks).ravel()
+    return np.bincount(flat, minlength=n_boot * n).reshape(n_boot, n).astype(float)
+
+
+def group_mean_ci(
+    values: np.ndarray,
+    groups: np.ndarray,
+    *,
+    n_boot: int = DEFAULT_N_BOOT,
+    ci: float = DEFAULT_CI,
+    seed: int = DEFAULT_SEED,
+) -> pd.DataFrame:
+    """
+    Бутстреп-интервал среднего values внутри каждой группы (пересэмплирование
+    элементов внутри группы). NaN не участвуют (как groupby().mean()).
+
+    Возвращает DataFrame: group | lo | hi (группы отсортированы).
+    """
+    values = np.asarray(values, dtype=float)
+    groups = np.asarray(groups)
+    ok = ~np.isnan(values)
+    values, groups = values[ok], groups[ok]
+
+    if len(values) == 0:
+        return pd.DataFrame({"group": [], "lo": [], "hi": []})
+
+    order = np.argsort(groups, kind="stable")
+    values, groups = values[order], groups[order]
+    keys, starts, sizes = np.unique(groups, return_index=True, return_counts=True)
+
+    rng = np.random.default_rng(seed)
+    n = len(values)
+    block = max(1, _MAX_BLOCK_CELLS // n)
+
+    means = np.empty((n_boot, len(keys)))
+    for b0 in range(0, n_boot, block):
+        b1 = min(n_boot, b0 + block)
+        w = resample_weights(sizes, b1 - b0, rng)
+        # (реплики x описания) * метрика -> суммы по блокам групп
+        means[b0:b1] = np.add.reduceat(w * values[None, :], starts, axis=1) / sizes
+
+    alpha = (1.0 - ci) / 2.0
+    lo, hi = np.quantile(means, [alpha, 1.0 - alpha], axis=0)
+    return pd.DataFrame({"group": keys, "lo": lo, "hi": hi})
+
+
+def add_bootstrap_ci(
+    result: pd.DataFrame,
+    per_item: pd.DataFrame,
+    *,
+    by: str | Sequence[str],
+    value_col: str,
+    out_prefix: Optional[str] = None,
+    n_boot: int = DEFAULT_N_BOOT,
+    ci: float = DEFAULT_CI,
+    seed: int = DEFAULT_SEED,
+) -> pd.DataFrame:
+    """
+    Добавляет к агрегату result колонки {out_prefix}_lo / {out_prefix}_hi:
+    интервал среднего per_item[value_col] по группам `by` (обычно year).
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    out_prefix = out_prefix or value_col
+
+    # несколько колонок группировки -> один код группы
+    codes, uniques = pd.MultiIndex.from_frame(per_item[by]).factorize()
+    bands = group_mean_ci(per_item[value_col].to_numpy(dtype=float), codes, n_boot=n_boot, ci=ci, seed=seed)
+
+    keys = uniques[bands["group"].to_numpy()].to_frame(index=False, name=by)
+    keys[f"{out_prefix}_lo"] = bands["lo"].to_numpy()
+    keys[f"{out_prefix}_hi"] = bands["hi"].to_numpy()
+    return result.merge(keys, on=by, how="left")
@@ -1,18 +1,64 @@
 # core/cache.py
 from __future__ import annotations
 
+import copy
+import dataclasses
+import functools
 import hashlib
+import inspect
 import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Callable, Iterable, Optional, Any, Dict, Tuple
+from types import SimpleNamespace
+from typing import Callable, Iterable, Iterator, Optional, Any, Dict, Tuple
 
+import numpy as np
 import pandas as pd
 
 DEFAULT_CACHE_DIR = Path("data/cache")
-_MEM: Dict[str, pd.DataFrame] = {}
+# Кеш в памяти процесса — LRU: долго живущий UI не должен расти без предела
+_MEM: "OrderedDict[str, Any]" = OrderedDict()
+_MEM_BYTES: Dict[str, int] = {}
+_MEM_LOCK = threading.RLock()
+MEM_MAX_ITEMS = 256
+MEM_MAX_BYTES = 1024 ** 3
+_INFLIGHT: Dict[str, "_Flight"] = {}
+_MISS = object()
 
+# Лимит на суммарный размер data/cache (LRU по времени последнего обращения).
+DEFAULT_MAX_BYTES: Optional[int] = 2 * 1024 ** 3
+# Записи, к которым не обращались дольше ttl, удаляются (None = без TTL).
+DEFAULT_TTL_SECONDS: Optional[float] = None
 
-def _safe_mkdir(p: Path) -> None:
+# Межпроцессная блокировка ключа: сколько ждём чужой расчёт и когда lock считается "мёртвым".
+# Владелец lock'а раз в LOCK_HEARTBEAT_S обновляет его mtime, поэтому "мёртвым" lock
+# становится только через LOCK_STALE_S после падения процесса, а не от долгого расчёта.
+LOCK_TIMEOUT_S = 600.0
+LOCK_STALE_S = 3600.0
+LOCK_HEARTBEAT_S = 60.0
+_LOCK_POLL_S = 0.1
+# захват мёртвого lock'а длится микросекунды; такой "takeover"-lock старше этого — брошен
+_TAKEOVER_STALE_S = 30.0
+
+# prune_cache после промаха — не чаще раза в PRUNE_INTERVAL_S на каталог кеша
+PRUNE_INTERVAL_S = 60.0
+_LAST_PRUNE: Dict[Path, float] = {}
+
+_LOCK_SUFFIX = ".lock"
+_TAKEOVER_SUFFIX = ".takeover"
+_TMP_SUFFIX = ".tmp"
+
+# "auto" = parquet/pickle; "arrow" = Arrow IPC (Feather v2) без сжатия, читается через memory map
+DEFAULT_FORMAT = "auto"
+_FORMAT_SUFFIX = {"arrow": ".arrow", "parquet": ".parquet", "pickle": ".pkl"}
+
+
+def safe_mkdir(p: Path) -> None:
     p.mkdir(parents=True, exist_ok=True)
 
 
@@ -43,8 +89,10 @@ def make_cache_key(namespace: str, payload: dict, data_sig: Optional[str] = None
     return hashlib.sha1(raw).hexdigest()
 
 
+@functools.lru_cache(maxsize=None)
 def _choose_format() -> str:
     # parquet быстрее, но требует pyarrow. Если нет — используем pickle.
+    # Результат проверки запоминаем: импорт pyarrow не нужен на каждый вызов.
     try:
         import pyarrow  # noqa: F401
         return "parquet"
@@ -52,25 +100,531 @@ def _choose_format() -> str:
         return "pickle"
 
 
-def _cache_path(cache_dir: Path, namespace: str, key: str) -> Tuple[Path, str]:
-    fmt = _choose_format()
+def _entry_base(cache_dir: Path, namespace: str, key: str) -> Path:
     ns_dir = cache_dir / namespace
-    _safe_mkdir(ns_dir)
-    suffix = ".parquet" if fmt == "parquet" else ".pkl"
-    return ns_dir / f"{key}{suffix}", fmt
+    safe_mkdir(ns_dir)
+    return ns_dir / key
+
+
+def _read_arrow(path: Path, mmap: bool = True) -> pd.DataFrame:
+    """
+    Arrow IPC (Feather v2, без сжатия): чтение без декодирования (в отличие от parquet),
+    при mmap=True — через memory map, так что процессы, читающие одну запись, делят
+    страницы файла через page cache ОС.
+
+    Результат — обычная изменяемая таблица: to_pandas() без split_blocks собирает колонки
+    в собственные блоки pandas (копия), и отображение закрывается до возврата. Иначе
+    колонки были бы read-only view на файл, а на Windows отображённый файл нельзя
+    ни заменить (os.replace), ни удалить (prune_cache, перезапись eco_store).
+    """
+    import pyarrow as pa
+
+    with (pa.memory_map(str(path), "r") if mmap else pa.OSFile(str(path), "rb")) as source:
+        table = pa.ipc.open_file(source).read_all()
+        df = table.to_pandas()
+        del table
+    return df
 
 
-def load_df(path: Path, fmt: str) -> pd.DataFrame:
+def load_df(path: Path, fmt: str, *, mmap: bool = True) -> pd.DataFrame:
+    if fmt == "arrow":
+        return _read_arrow(path, mmap=mmap)
     if fmt == "parquet":
         return pd.read_parquet(path)
     return pd.read_pickle(path)
 
 
+def _atomic_write(path: Path, write_fn: Callable[[Path], None]) -> None:
+    """
+    Пишем во временный файл рядом с целевым и делаем os.replace:
+    читатель видит либо старый файл, либо полностью записанный новый.
+    """
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex}{_TMP_SUFFIX}")
+    try:
+        write_fn(tmp)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
 def save_df(df: pd.DataFrame, path: Path, fmt: str) -> None:
-    if fmt == "parquet":
-        df.to_parquet(path, index=False)
+    if fmt == "arrow":
+        from pyarrow import feather
+
+        _atomic_write(path, lambda tmp: feather.write_feather(df, tmp, compression="uncompressed"))
+    elif fmt == "parquet":
+        _atomic_write(path, lambda tmp: df.to_parquet(tmp, index=False))
     else:
-        df.to_pickle(path)
+        _atomic_write(path, lambda tmp: df.to_pickle(tmp))
+
+
+def _is_flat_frame(obj: Any) -> bool:
+    # parquet/arrow пишем без индекса, поэтому только "плоские" таблицы с RangeIndex
+    return (
+        isinstance(obj, pd.DataFrame)
+        and isinstance(obj.index, pd.RangeIndex)
+        and obj.index.start == 0
+        and obj.index.step == 1
+        and obj.index.name is None
+        and all(isinstance(c, str) for c in obj.columns)
+    )
+
+
+def entry_path(base: Path, fmt: str) -> Path:
+    """Файл записи base (путь без суффикса) в формате fmt."""
+    return base.with_name(base.name + _FORMAT_SUFFIX[fmt])
+
+
+def _save_result(obj: Any, base: Path, fmt: str = "auto") -> str:
+    """
+    fmt="auto":  DataFrame -> parquet (если есть pyarrow и таблица плоская);
+    fmt="arrow": DataFrame -> Arrow IPC без сжатия (читается через memory map без декодирования);
+    всё остальное (Series, numpy, dict, результаты statsmodels, ...) -> pickle.
+    Возвращает фактически использованный формат.
+    """
+    if fmt not in ("auto", "arrow"):
+        raise ValueError(f"Unknown cache format: {fmt}")
+
+    if _choose_format() == "parquet" and _is_flat_frame(obj):
+        for f in (("arrow", "parquet") if fmt == "arrow" else ("parquet",)):
+            try:
+                save_df(obj, entry_path(base, f), f)
+            except Exception:
+                continue  # смешанные типы в object-колонках и т.п. — пробуем следующий формат
+            _drop_other_formats(base, f)
+            return f
+    _atomic_write(entry_path(base, "pickle"), lambda tmp: pd.to_pickle(obj, tmp))
+    _drop_other_formats(base, "pickle")
+    return "pickle"
+
+
+def _drop_other_formats(base: Path, keep: str) -> None:
+    """
+    Файлы той же записи в других форматах (запись переписали в новом формате) удаляем:
+    иначе _try_load может прочитать старый, а _is_expired — вечно видеть его устаревшим.
+    """
+    for f in _FORMAT_SUFFIX:
+        if f == keep:
+            continue
+        try:
+            entry_path(base, f).unlink()
+        except OSError:
+            pass  # файла нет или он занят (Windows) — тогда его уберёт prune_cache
+
+
+def _mem_size(obj: Any) -> int:
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=False).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=False))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    return 0
+
+
+def _mem_get(key: str) -> Any:
+    """Запись из памяти (и отметка "недавно использована") или _MISS. Вызывать под _MEM_LOCK."""
+    if key not in _MEM:
+        return _MISS
+    _MEM.move_to_end(key)
+    return _MEM[key]
+
+
+def _mem_put(key: str, obj: Any) -> None:
+    """Кладёт запись и вытесняет самые давние сверх MEM_MAX_ITEMS / MEM_MAX_BYTES. Вызывать под _MEM_LOCK."""
+    _MEM[key] = obj
+    _MEM.move_to_end(key)
+    _MEM_BYTES[key] = _mem_size(obj)
+    total = sum(_MEM_BYTES.values())
+    while len(_MEM) > 1 and (len(_MEM) > MEM_MAX_ITEMS or total > MEM_MAX_BYTES):
+        old, _ = _MEM.popitem(last=False)
+        total -= _MEM_BYTES.pop(old, 0)
+
+
+def _copy_result(obj: Any) -> Any:
+    # из памяти отдаём копию, чтобы вызывающий код не испортил закешированный объект
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return obj.copy()
+    if isinstance(obj, (dict, list)):
+        return copy.deepcopy(obj)
+    return obj
+
+
+class _Heartbeat:
+    """Один фоновый поток на процесс: обновляет mtime всех lock'ов, которые держит процесс."""
+
+    def __init__(self) -> None:
+        self._held: set[Path] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, lock: Path) -> None:
+        with self._lock:
+            self._held.add(lock)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="cache-lock-heartbeat", daemon=True)
+                self._thread.start()
+
+    def discard(self, lock: Path) -> None:
+        with self._lock:
+            self._held.discard(lock)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(LOCK_HEARTBEAT_S)
+            with self._lock:
+                held = list(self._held)
+            for lock in held:
+                _touch(lock)
+
+
+_HEARTBEAT = _Heartbeat()
+
+
+def _lock_age(lock: Path) -> Optional[float]:
+    try:
+        return time.time() - lock.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def _break_stale_lock(lock: Path, stale_after: float) -> None:
+    """
+    Удаляет мёртвый lock. Захват сериализован отдельным lock'ом (.takeover): иначе второй
+    ожидающий, увидевший тот же мёртвый lock, удалил бы уже новый lock первого.
+    Под takeover возраст проверяется заново.
+    """
+    takeover = lock.with_name(lock.name + _TAKEOVER_SUFFIX)
+    try:
+        fd = os.open(takeover, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        age = _lock_age(takeover)
+        if age is not None and age > _TAKEOVER_STALE_S:
+            try:
+                takeover.unlink()  # захватчик упал посреди захвата
+            except FileNotFoundError:
+                pass
+        return
+    os.close(fd)
+    try:
+        age = _lock_age(lock)
+        if age is not None and age > stale_after:
+            try:
+                lock.unlink()
+            except FileNotFoundError:
+                pass
+    finally:
+        try:
+            takeover.unlink()
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def key_lock(
+    path: Path,
+    *,
+    timeout: float = LOCK_TIMEOUT_S,
+    stale_after: float = LOCK_STALE_S,
+) -> Iterator[None]:
+    """
+    Файловый lock на один ключ кеша (O_CREAT | O_EXCL работает и на Windows).
+    Пока lock держит другой процесс — ждём. Владелец обновляет mtime lock'а
+    (heartbeat), так что lock старше stale_after остался от упавшего процесса — забираем его.
+    В файле lock'а — pid и токен владельца; при выходе удаляем только свой lock.
+    """
+    lock = path.with_name(path.name + _LOCK_SUFFIX)
+    token = f"{os.getpid()}:{uuid.uuid4().hex}".encode("ascii")
+    deadline = time.monotonic() + timeout
+
+    while True:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            age = _lock_age(lock)
+            if age is None:
+                continue  # lock только что отпустили — пробуем снова
+            if age > stale_after:
+                _break_stale_lock(lock, stale_after)
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Cache lock is busy for more than {timeout:.0f}s: {lock}")
+            time.sleep(_LOCK_POLL_S)
+            continue
+
+        try:
+            os.write(fd, token)
+        finally:
+            os.close(fd)
+        break
+
+    _HEARTBEAT.add(lock)
+    try:
+        yield
+    finally:
+        _HEARTBEAT.discard(lock)
+        try:
+            if lock.read_bytes() == token:
+                lock.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _touch(path: Path) -> None:
+    # mtime = время последнего обращения (для LRU/TTL); atime часто отключён на ФС
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+def _try_load(base: Path) -> Tuple[Any, Optional[str]]:
+    """
+    Загружает запись с диска (arrow, parquet или pickle); битый файл (например, от старой
+    неатомарной записи) удаляем и считаем промахом. Промах -> (_MISS, None).
+    """
+    for fmt, suffix in _FORMAT_SUFFIX.items():
+        path = base.with_name(base.name + suffix)
+        if not path.exists():
+            continue
+        try:
+            obj = load_df(path, fmt)
+        except FileNotFoundError:
+            continue  # запись вытеснили между exists() и чтением
+        except Exception:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            continue
+        _touch(path)
+        return obj, fmt
+    return _MISS, None
+
+
+def _is_expired(base: Path, ttl_seconds: Optional[float]) -> bool:
+    if ttl_seconds is None:
+        return False
+    for suffix in _FORMAT_SUFFIX.values():
+        path = base.with_name(base.name + suffix)
+        try:
+            if time.time() - path.stat().st_mtime > ttl_seconds:
+                return True
+        except FileNotFoundError:
+            continue
+    return False
+
+
+def prune_cache(
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    *,
+    max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+    ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+) -> int:
+    """
+    Чистит дисковый кеш:
+      - удаляет записи, к которым не обращались дольше ttl_seconds;
+      - затем, пока суммарный размер > max_bytes, удаляет самые давние по обращению (LRU);
+      - убирает осиротевшие .tmp от упавших процессов.
+    Записи под lock'ом не трогаем. Возвращает число удалённых файлов.
+    """
+    cache_dir = Path(cache_dir)
+    if not cache_dir.exists():
+        return 0
+
+    now = time.time()
+    removed = 0
+    entries: list[tuple[float, int, Path]] = []
+
+    for p in cache_dir.rglob("*"):
+        if not p.is_file() or p.name.endswith((_LOCK_SUFFIX, _TAKEOVER_SUFFIX)):
+            continue
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+
+        if p.name.endswith(_TMP_SUFFIX):
+            if now - st.st_mtime > LOCK_STALE_S:
+                try:
+                    p.unlink()
+                    removed += 1
+                except OSError:
+                    pass
+            continue
+
+        if p.with_name(p.name.split(".", 1)[0] + _LOCK_SUFFIX).exists():
+            continue
+
+        if ttl_seconds is not None and now - st.st_mtime > ttl_seconds:
+            try:
+                p.unlink()
+                removed += 1
+            except OSError:
+                pass
+            continue
+
+        entries.append((st.st_mtime, st.st_size, p))
+
+    if max_bytes is None:
+        return removed
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, p in sorted(entries, key=lambda e: e[0]):
+        if total <= max_bytes:
+            break
+        try:
+            p.unlink()
+        except OSError:
+            continue  # файл занят (Windows) — пропускаем
+        total -= size
+        removed += 1
+
+    return removed
+
+
+def _maybe_prune(cache_dir: Path, *, max_bytes: Optional[int], ttl_seconds: Optional[float]) -> None:
+    """prune_cache обходит весь каталог (rglob) — после промахов не чаще PRUNE_INTERVAL_S."""
+    cache_dir = Path(cache_dir)
+    now = time.monotonic()
+    with _MEM_LOCK:
+        last = _LAST_PRUNE.get(cache_dir)
+        if last is not None and now - last < PRUNE_INTERVAL_S:
+            return
+        _LAST_PRUNE[cache_dir] = now
+    prune_cache(cache_dir, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+
+
+class _Flight:
+    """Расчёт одного ключа, который сейчас идёт в этом процессе."""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+def _load_or_compute_disk(
+    base: Path,
+    compute_fn: Callable[[], Any],
+    *,
+    cache_dir: Path,
+    max_bytes: Optional[int],
+    ttl_seconds: Optional[float],
+    fmt: str,
+) -> Tuple[Any, Optional[str]]:
+    obj, used = (_MISS, None) if _is_expired(base, ttl_seconds) else _try_load(base)
+    if obj is not _MISS:
+        return obj, used
+
+    # между процессами: только один считает ключ; остальные ждут lock и читают готовый файл
+    with key_lock(base):
+        obj, used = (_MISS, None) if _is_expired(base, ttl_seconds) else _try_load(base)
+        if obj is _MISS:
+            obj = compute_fn()
+            used = _save_result(obj, base, fmt)
+    if max_bytes is not None or ttl_seconds is not None:
+        _maybe_prune(cache_dir, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+    return obj, used
+
+
+def get_or_compute(
+    namespace: str,
+    payload: dict,
+    compute_fn: Callable[[], Any],
+    *,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    input_paths: Optional[Iterable[str | Path]] = None,
+    use_disk: bool = True,
+    use_memory: bool = True,
+    max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+    ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+    fmt: str = DEFAULT_FORMAT,
+) -> Any:
+    """
+    Как get_or_compute_df, но для любого результата (DataFrame, Series, numpy, dict, ...).
+
+    fmt="arrow" — для больших промежуточных таблиц: запись хранится как Arrow IPC и
+    при попадании читается через memory map, а не декодируется заново (результат —
+    собственная копия вызывающего, файл после чтения не удерживается). Такие записи
+    не дублируются в памяти процесса — роль памяти играет page cache ОС.
+
+    Одновременные запросы одного ключа считаются один раз: потоки этого процесса
+    ждут первого (single-flight), другие процессы — файловый lock дискового кеша
+    (при use_disk=False процессы между собой результат не делят).
+    """
+    data_sig = file_signature(input_paths) if input_paths else None
+    key = make_cache_key(namespace, payload, data_sig=data_sig)
+
+    # single-flight: первый запросивший ключ считает, остальные потоки ждут его результат
+    with _MEM_LOCK:
+        hit = _mem_get(key) if use_memory else _MISS
+        if hit is not _MISS:
+            return _copy_result(hit)
+        flight = _INFLIGHT.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            _INFLIGHT[key] = flight
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return _copy_result(flight.result)
+
+    used: Optional[str] = None
+    try:
+        if use_disk:
+            obj, used = _load_or_compute_disk(
+                _entry_base(Path(cache_dir), namespace, key),
+                compute_fn,
+                cache_dir=Path(cache_dir),
+                max_bytes=max_bytes,
+                ttl_seconds=ttl_seconds,
+                fmt=fmt,
+            )
+        else:
+            obj = compute_fn()
+        flight.result = obj
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _MEM_LOCK:
+            if use_memory and flight.error is None and used != "arrow":
+                _mem_put(key, flight.result)
+            _INFLIGHT.pop(key, None)
+        flight.done.set()
+
+    if used == "arrow":
+        return obj  # свежепрочитанная таблица нигде больше не хранится — копия не нужна
+    return _copy_result(obj)
+
+
+def cache_status(
+    namespace: str,
+    payload: dict,
+    *,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    input_paths: Optional[Iterable[str | Path]] = None,
+) -> Optional[str]:
+    """
+    Где сейчас лежит запись get_or_compute с теми же namespace / payload / input_paths:
+    "memory" | "disk" | None (будет считаться). Ничего не загружает и не создаёт.
+    """
+    data_sig = file_signature(input_paths) if input_paths else None
+    key = make_cache_key(namespace, payload, data_sig=data_sig)
+    with _MEM_LOCK:
+        if key in _MEM:
+            return "memory"
+    base = Path(cache_dir) / namespace / key
+    if any(entry_path(base, fmt).exists() for fmt in _FORMAT_SUFFIX):
+        return "disk"
+    return None
 
 
 def get_or_compute_df(
@@ -82,27 +636,131 @@ def get_or_compute_df(
     input_paths: Optional[Iterable[str | Path]] = None,
     use_disk: bool = True,
     use_memory: bool = True,
+    max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+    ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+    fmt: str = DEFAULT_FORMAT,
 ) -> pd.DataFrame:
-    data_sig = file_signature(input_paths) if input_paths else None
-    key = make_cache_key(namespace, payload, data_sig=data_sig)
+    def _compute_checked() -> pd.DataFrame:
+        df = compute_fn()
+        if not isinstance(df, pd.DataFrame):
+            raise TypeError("compute_fn must return pandas.DataFrame")
+        return df
+
+    return get_or_compute(
+        namespace,
+        payload,
+        _compute_checked,
+        cache_dir=cache_dir,
+        input_paths=input_paths,
+        use_disk=use_disk,
+        use_memory=use_memory,
+        max_bytes=max_bytes,
+        ttl_seconds=ttl_seconds,
+        fmt=fmt,
+    )
+
+
+# ----------------------------
+# Memoization decorator
+# ----------------------------
+
+class _Uncacheable(Exception):
+    """Аргумент нельзя стабильно захешировать (lambda-фильтр и т.п.)."""
+
+
+def _hash_bytes(*chunks: bytes) -> str:
+    h = hashlib.sha1()
+    for c in chunks:
+        h.update(c)
+    return h.hexdigest()
+
+
+def _canonical_arg(obj: Any) -> Any:
+    """
+    Приводит аргумент функции к JSON-совместимому виду для ключа кеша.
+    FilterSpec-словари, dataclass-спеки (PanelSpec, PanelEcoSpec), пути,
+    DataFrame/Series/numpy (по хешу содержимого).
+    """
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, Path):
+        return {"__path__": obj.as_posix()}
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {
+            "__dataclass__": type(obj).__qualname__,
+            "fields": {f.name: _canonical_arg(getattr(obj, f.name)) for f in dataclasses.fields(obj)},
+        }
+    if isinstance(obj, SimpleNamespace):
+        return {"__namespace__": _canonical_arg(vars(obj))}
+    if isinstance(obj, dict):
+        return {str(k): _canonical_arg(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical_arg(v) for v in obj]
+    if isinstance(obj, (set, frozenset)):
+        return sorted((_canonical_arg(v) for v in obj), key=repr)
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        row_hash = pd.util.hash_pandas_object(obj, index=True).to_numpy()
+        cols = list(map(str, obj.columns)) if isinstance(obj, pd.DataFrame) else [str(obj.name)]
+        dtypes = list(map(str, obj.dtypes)) if isinstance(obj, pd.DataFrame) else [str(obj.dtype)]
+        return {"__frame__": _hash_bytes(row_hash.tobytes(), _canonical_json([cols, dtypes]).encode("utf-8"))}
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            raise _Uncacheable("object ndarray")
+        arr = np.ascontiguousarray(obj)
+        return {"__ndarray__": _hash_bytes(arr.tobytes(), f"{arr.dtype}|{arr.shape}".encode("ascii"))}
+    raise _Uncacheable(type(obj).__qualname__)
+
+
+def memoize(
+    namespace: Optional[str] = None,
+    *,
+    input_paths: Optional[Iterable[str | Path] | Callable[..., Iterable[str | Path]]] = None,
+    version: Optional[str] = None,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    use_disk: bool = True,
+    use_memory: bool = True,
+    fmt: str = DEFAULT_FORMAT,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Декоратор: кеширует результат функции по хешу её аргументов + сигнатуре входных файлов.
 
-    if use_memory and key in _MEM:
-        return _MEM[key].copy()
+      @memoize("ellenberg_scale", input_paths=[ELLENBERG_XLSX])
+      def load_ellenberg_scale(scale="M"): ...
+
+    input_paths — список файлов или функция (*args, **kwargs) -> список (если файлы
+    зависят от аргументов). version — поменять, если поменялась логика функции.
+    fmt="arrow" — хранить табличный результат в Arrow IPC, читаемом через memory map (см. get_or_compute).
+    Если аргумент не хешируется (например, callable-фильтр), функция просто вызывается без кеша.
+    Исходная функция доступна как wrapper.uncached.
+    """
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        ns = namespace or f"{fn.__module__}.{fn.__qualname__}"
+        sig = inspect.signature(fn)
 
-    path, fmt = _cache_path(cache_dir, namespace, key)
-    if use_disk and path.exists():
-        df = load_df(path, fmt)
-        if use_memory:
-            _MEM[key] = df
-        return df.copy()
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            try:
+                payload = {"args": _canonical_arg(dict(bound.arguments)), "version": version}
+            except _Uncacheable:
+                return fn(*args, **kwargs)
 
-    df = compute_fn()
-    if not isinstance(df, pd.DataFrame):
-        raise TypeError("compute_fn must return pandas.DataFrame")
+            paths = input_paths(*args, **kwargs) if callable(input_paths) else input_paths
+            return get_or_compute(
+                ns,
+                payload,
+                lambda: fn(*args, **kwargs),
+                cache_dir=cache_dir,
+                input_paths=paths,
+                use_disk=use_disk,
+                use_memory=use_memory,
+                fmt=fmt,
+            )
 
-    if use_disk:
-        save_df(df, path, fmt)
-    if use_memory:
-        _MEM[key] = df
+        wrapper.uncached = fn  # type: ignore[attr-defined]
+        return wrapper
 
-    return df.copy()
\ No newline at end of file
+    return decorator
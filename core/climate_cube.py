@@ -0,0 +1,199 @@
+# core/climate_cube.py
+"""
+Куб климатических сигналов: год x период x переменная x окно x лаг.
+
+Сигнал для года t (window, lag) = среднее переменной периода за календарные годы
+[t - lag - window + 1, t - lag]; определён, только если есть все window лет.
+Ряд сначала растягивается на полную сетку лет (пропуски = NaN), поэтому пропавший
+год не "склеивает" соседние, как rolling(window).shift(lag) по строкам.
+
+Куб строится один раз из meteo_periods (по умолчанию окна CUBE_WINDOWS, лаги CUBE_LAGS)
+и кешируется (память процесса + диск, ключ — подпись CSV): поменяли файл — куб пересобирается.
+Потребители (run_scenario, grid_engine, panel_api, panel_model) берут из него срезы;
+окна/лаги вне куба считаются на лету той же формулой.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+from core.cache import get_or_compute_df
+from core.trace import traced
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+METEO_PERIODS_CSV = PROJECT_ROOT / "data" / "processed" / "meteo_periods_1991_2020.csv"
+
+CLIMATE_VARS = ("pedya", "t_mean_c", "precip_mm")
+CUBE_WINDOWS = (1, 2, 3, 4, 5)
+CUBE_LAGS = (0, 1, 2, 3)
+# поменять при изменении формулы сигнала -> старый кеш не используется
+CUBE_VERSION = "1"
+
+
+def load_meteo_periods(path: Path = METEO_PERIODS_CSV) -> pd.DataFrame:
+    if not path.exists():
+        raise FileNotFoundError(
+            f"Meteo periods CSV not found: {path}. Run scripts/build_meteo_periods.py"
+        )
+    df = pd.read_csv(path)
+    required = {"year", "period", "t_mean_c", "precip_mm", "pedya"}
+    missing = required - set(df.columns)
+    if missing:
+        raise KeyError(f"Missing columns in meteo periods CSV: {sorted(missing)}")
+
+    df["year"] = pd.to_numeric(df["year"], errors="coerce")
+    df["period"] = df["period"].astype("string")
+    for c in ["t_mean_c", "precip_mm", "pedya"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    df = df.dropna(subset=["year", "period"]).copy()
+    df["year"] = df["year"].astype(int)
+    return df
+
+
+def cube_column(climate_var: str, period: str, window: int, lag: int) -> str:
+    return f"{climate_var}|{period}|w{int(window)}|lag{int(lag)}"
+
+
+def year_signal(values: np.ndarray, window: int, lag: int) -> np.ndarray:
+    """
+    values — ряды на полной сетке лет (n_years, ...), NaN = нет данных.
+    Среднее за window лет, оканчивающихся в t - lag (все window лет должны быть).
+    """
+    values = np.asarray(values, float)
+    n = len(values)
+    window = max(1, int(window))
+    lag = int(lag)
+    out = np.full(values.shape, np.nan)
+    if window > n:
+        return out
+
+    ok = ~np.isnan(values)
+    csum = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(np.where(ok, values, 0.0), axis=0)])
+    ccnt = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(ok, axis=0)])
+    s = csum[window:] - csum[:-window]
+    c = ccnt[window:] - ccnt[:-window]
+    roll = np.full(values.shape, np.nan)
+    roll[window - 1:] = np.where(c == window, s / window, np.nan)
+
+    if lag >= 0:
+        if lag < n:
+            out[lag:] = roll[:n - lag]
+    elif -lag < n:
+        out[:lag] = roll[-lag:]
+    return out
+
+
+def _year_grid(meteo: pd.DataFrame, climate_vars: Sequence[str], extend: int = 0) -> pd.DataFrame:
+    """year x (climate_var, period) на полной сетке лет min..max + extend (пропуски = NaN)."""
+    wide = meteo.pivot_table(index="year", columns="period", values=list(climate_vars), aggfunc="mean")
+    years = np.arange(int(wide.index.min()), int(wide.index.max()) + 1 + max(0, extend))
+    return wide.reindex(years)
+
+
+def build_climate_cube(
+    meteo: pd.DataFrame,
+    windows: Sequence[int] = CUBE_WINDOWS,
+    lags: Sequence[int] = CUBE_LAGS,
+    climate_vars: Sequence[str] = CLIMATE_VARS,
+) -> pd.DataFrame:
+    """
+    Плоский куб: year | "{var}|{period}|w{window}|lag{lag}" ... (сетка лет продлена на max(lags),
+    чтобы лаговый сигнал был и после последнего года метеоданных).
+    """
+    if meteo.empty:
+        return pd.DataFrame({"year": pd.Series([], dtype=int)})
+    grid = _year_grid(meteo, climate_vars, extend=max(lags, default=0))
+    values = grid.to_numpy(dtype=float)
+
+    cols = {"year": grid.index.to_numpy()}
+    for w in windows:
+        for lag in lags:
+            sig = year_signal(values, w, lag)
+            for j, (var, period) in enumerate(grid.columns):
+                cols[cube_column(var, period, w, lag)] = sig[:, j]
+    return pd.DataFrame(cols)
+
+
+def cube_cache_key(csv_path: Path = METEO_PERIODS_CSV) -> dict:
+    """Payload записи "climate_cube" в кеше (см. load_climate_cube)."""
+    return {"csv": str(csv_path), "windows": list(CUBE_WINDOWS), "lags": list(CUBE_LAGS), "version": CUBE_VERSION}
+
+
+@traced()
+def load_climate_cube(csv_path: Path = METEO_PERIODS_CSV) -> pd.DataFrame:
+    """Куб из кеша; при изменении CSV (размер/mtime) строится заново."""
+    csv_path = Path(csv_path)
+    return get_or_compute_df(
+        "climate_cube",
+        cube_cache_key(csv_path),
+        lambda: build_climate_cube(load_meteo_periods(csv_path)),
+        input_paths=[csv_path],
+    )
+
+
+def climate_signal_matrix(
+    climate_var: str,
+    period: str,
+    lags: Sequence[int],
+    windows: Sequence[int],
+    years: Sequence[int],
+    csv_path: Path = METEO_PERIODS_CSV,
+) -> np.ndarray:
+    """
+    Сигналы для всех (lag, window) на годах years: (len(lags) * len(windows), len(years)),
+    порядок — lag, затем window. Годы вне куба -> NaN.
+    """
+    if climate_var not in CLIMATE_VARS:
+        raise KeyError(
+            f"Unknown climate_var='{climate_var}'. Expected one of: {', '.join(CLIMATE_VARS)}."
+        )
+    cube = load_climate_cube(csv_path)
+    pos = pd.Index(cube["year"]).get_indexer(np.asarray(years))
+    inside = pos >= 0
+
+    combos = [(lag, w) for lag in lags for w in windows]
+    out = np.full((len(combos), len(pos)), np.nan)
+    missing = []
+    for i, (lag, w) in enumerate(combos):
+        col = cube_column(climate_var, period, w, lag)
+        if col in cube.columns:
+            out[i, inside] = cube[col].to_numpy(dtype=float)[pos[inside]]
+        elif int(w) in CUBE_WINDOWS and int(lag) in CUBE_LAGS:
+            continue  # периода нет в данных -> сигнал не определён
+        else:
+            missing.append(i)
+
+    if missing:
+        # окно/лаг вне куба — та же формула по исходному ряду
+        meteo = load_meteo_periods(Path(csv_path))
+        meteo = meteo[meteo["period"] == period]
+        if not meteo.empty:
+            grid = _year_grid(meteo, [climate_var], extend=max((combos[i][0] for i in missing), default=0))
+            gpos = grid.index.get_indexer(np.asarray(years))
+            ginside = gpos >= 0
+            values = grid.to_numpy(dtype=float)
+            for i in missing:
+                lag, w = combos[i]
+                out[i, ginside] = year_signal(values, w, lag)[gpos[ginside], 0]
+    return out
+
+
+@traced()
+def climate_signal(
+    climate_var: str,
+    period: str,
+    window: int = 1,
+    lag: int = 0,
+    csv_path: Path = METEO_PERIODS_CSV,
+) -> pd.DataFrame:
+    """
+    Один сигнал на всех годах куба: year | clim (исходное значение периода) | clim_signal.
+    """
+    cube = load_climate_cube(csv_path)
+    years = cube["year"].to_numpy()
+    sig = climate_signal_matrix(climate_var, period, [0, int(lag)], [1, int(window)], years, csv_path)
+    # строки: (lag 0, w 1), (lag 0, w), (lag, w 1), (lag, w)
+    return pd.DataFrame({"year": years, "clim": sig[0], "clim_signal": sig[3]})
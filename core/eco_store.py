@@ -0,0 +1,168 @@
+# core/eco_store.py
+"""
+Постоянное хранилище экоспектров по описаниям (инкрементальный пересчёт).
+
+Для каждого description_id хранится отпечаток его строк (виды, веса, значения
+шкал) и посчитанные метрики по всем шкалам (как ecospectrum_parts). При
+обновлении данных (поправили одну книгу Excel) пересчитываются только
+описания с изменившимся отпечатком; остальные берутся из хранилища, годовые и
+панельные агрегаты потом строятся из уже "залатанной" таблицы по описаниям.
+
+Хранилище — один Arrow-файл на набор параметров (шкалы, веса, квантили,
+STORE_VERSION) в data/cache/eco_store/. Описания, которых нет в текущей выборке
+(другие фильтры), в хранилище остаются.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+from core.cache import (
+    DEFAULT_CACHE_DIR,
+    entry_path,
+    key_lock,
+    load_df,
+    make_cache_key,
+    safe_mkdir,
+    save_df,
+)
+from core.trace import traced
+from core.ecospectrum import assemble_multi, ecospectrum_parts, trait_ranges
+
+STORE_DIR = DEFAULT_CACHE_DIR / "eco_store"
+# поменять при изменении формул ядра экоспектра -> старое хранилище не используется
+STORE_VERSION = "1"
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def description_fingerprints(
+    df: pd.DataFrame,
+    codes: np.ndarray,
+    n_desc: int,
+    cols: Sequence[str],
+) -> np.ndarray:
+    """
+    Отпечаток (uint64) строк каждого описания по колонкам cols, не зависящий от
+    порядка строк: хеш строки -> сумма и сумма квадратов по описанию (по модулю 2^64).
+    """
+    h = pd.util.hash_pandas_object(df[list(cols)], index=False).to_numpy(dtype=np.uint64)
+    fp = np.zeros(n_desc, dtype=np.uint64)
+    ok = codes >= 0
+    if not ok.any():
+        return fp
+
+    c = codes[ok]
+    h = h[ok]
+    order = np.argsort(c, kind="stable")
+    c, h = c[order], h[order]
+    present, starts = np.unique(c, return_index=True)
+    with np.errstate(over="ignore"):
+        s1 = np.add.reduceat(h, starts)
+        s2 = np.add.reduceat(h * h, starts)
+        n = np.diff(np.append(starts, len(c))).astype(np.uint64)
+        fp[present] = s1 + s2 * _GOLDEN + n
+    return fp
+
+
+def _store_base(
+    trait_cols: Sequence[str],
+    weight_col: str,
+    q_low: float,
+    q_high: float,
+    id_col: str,
+    quantiles: Sequence[float],
+    store_dir: Path,
+) -> Path:
+    key = make_cache_key(
+        "eco_store",
+        {
+            "trait_cols": list(trait_cols),
+            "weight_col": weight_col,
+            "q_low": q_low,
+            "q_high": q_high,
+            "id_col": id_col,
+            "quantiles": list(quantiles),
+            "version": STORE_VERSION,
+        },
+    )
+    return Path(store_dir) / key
+
+
+def refresh_ecospectrum(
+    df: pd.DataFrame,
+    trait_cols: Sequence[str],
+    weight_col: str = "w",
+    q_low: float = 0.05,
+    q_high: float = 0.95,
+    id_col: str = "description_id",
+    quantiles: Sequence[float] = (),
+    wide: bool = False,
+    store_dir: Path = STORE_DIR,
+) -> tuple[pd.DataFrame, list]:
+    """
+    То же, что compute_ecospectrum_multi(df, ...), но через хранилище: пересчитываются
+    только описания, чей отпечаток (виды + веса + шкалы) изменился или которых
+    в хранилище ещё нет. Возвращает (таблица, список пересчитанных description_id).
+    """
+    trait_cols = list(trait_cols)
+    missing = [c for c in trait_cols if c not in df.columns]
+    if missing:
+        raise KeyError(f"refresh_ecospectrum: missing trait columns {missing}")
+    n_scales = len(trait_cols)
+
+    codes, uniques = pd.factorize(df[id_col], sort=False)
+    fp_cols = [id_col, weight_col, *trait_cols] + (["species"] if "species" in df.columns else [])
+    fp = description_fingerprints(df, codes, len(uniques), fp_cols)
+    ids = pd.Index(uniques)
+
+    base = _store_base(trait_cols, weight_col, q_low, q_high, id_col, quantiles, store_dir)
+    path = entry_path(base, "arrow")
+    safe_mkdir(base.parent)
+
+    with key_lock(base):
+        # без memory map: тот же файл ниже перезаписывается (на Windows отображённый файл не заменить)
+        store = load_df(path, "arrow", mmap=False) if path.exists() else None
+
+        if store is not None and len(store):
+            stored_ids = pd.Index(store[id_col].to_numpy()[::n_scales])
+            stored_fp = store["fingerprint"].to_numpy(dtype=np.uint64)[::n_scales]
+            pos = stored_ids.get_indexer(ids)
+            changed = (pos < 0) | (stored_fp[np.maximum(pos, 0)] != fp)
+        else:
+            store = None
+            changed = np.ones(len(ids), dtype=bool)
+
+        changed_ids = ids[changed]
+        if changed.any():
+            sub = df[np.isin(codes, np.flatnonzero(changed))]
+            fresh = ecospectrum_parts(sub, trait_cols, weight_col, q_low, q_high, id_col, quantiles)
+            fresh.insert(1, "fingerprint", np.repeat(fp[changed], n_scales))
+
+            if store is None:
+                store = fresh
+            else:
+                keep = ~pd.Index(store[id_col]).isin(changed_ids)
+                store = pd.concat([store[keep], fresh], ignore_index=True)
+            save_df(store, path, "arrow")
+
+    if store is None:  # пустая выборка
+        parts = ecospectrum_parts(df, trait_cols, weight_col, q_low, q_high, id_col, quantiles)
+        return assemble_multi(parts, trait_ranges(df, trait_cols, weight_col), trait_cols, id_col, wide), []
+
+    # строки текущей выборки в порядке первого появления, блоками по шкалам
+    block = pd.Index(store[id_col].to_numpy()[::n_scales]).get_indexer(ids) * n_scales
+    rows = (block[:, None] + np.arange(n_scales)[None, :]).ravel()
+    parts = store.iloc[rows].drop(columns="fingerprint").reset_index(drop=True)
+
+    out = assemble_multi(parts, trait_ranges(df, trait_cols, weight_col), trait_cols, id_col, wide)
+    return out, list(changed_ids)
+
+
+@traced("ecospectrum")
+def ecospectrum_incremental(df: pd.DataFrame, trait_cols: Sequence[str], **kwargs) -> pd.DataFrame:
+    """Только таблица из refresh_ecospectrum (замена compute_ecospectrum_multi)."""
+    return refresh_ecospectrum(df, trait_cols, **kwargs)[0]
@@ -1,6 +1,12 @@
+from pathlib import Path
+from typing import Sequence
+
 import numpy as np
 import pandas as pd
 
+from core.cache import memoize
+from core.kernels import segment_central, segment_moments, segment_quantiles, segment_rao
+
 
 def weighted_quantile(x: np.ndarray, w: np.ndarray, q: float) -> float:
     """
@@ -84,6 +90,123 @@ def compute_ecospectrum_stats(
         "w_min": w_min,
         "w_max": w_max,
     }
+
+
+# ----------------------------
+# Векторное ядро: все описания за один проход
+# ----------------------------
+
+def weighted_quantiles_sorted(
+    codes: np.ndarray,
+    x: np.ndarray,
+    w: np.ndarray,
+    qs: Sequence[float],
+    n_groups: int,
+) -> np.ndarray:
+    """
+    Взвешенные квантили для всех групп и всех q за один проход.
+
+    codes, x, w — уже отсортированы лексикографически по (группа, значение),
+    без NaN и с w > 0. Накопленные веса строятся внутри каждой группы, все
+    пороги q * total ищутся одним сегментным searchsorted (левый порог, как
+    в weighted_quantile; см. core.kernels). Лишний квантиль стоит ещё одного
+    столбца порогов.
+
+    Возвращает массив (n_groups, len(qs)); для групп без строк — NaN.
+    """
+    qs = np.asarray(qs, dtype=float)
+    out = np.full((n_groups, len(qs)), np.nan)
+    if len(codes) == 0 or len(qs) == 0:
+        return out
+
+    present, starts = np.unique(codes, return_index=True)
+    ends = np.append(starts[1:], len(codes))
+    out[present] = segment_quantiles(x, w, starts, ends, qs)
+    return out
+
+
+def quantile_column(q: float) -> str:
+    """Имя колонки для дополнительного квантиля: 0.25 -> "w_q25", 0.025 -> "w_q2.5"."""
+    return f"w_q{q * 100:g}"
+
+
+def _ecospectrum_kernel(
+    codes: np.ndarray,
+    x: np.ndarray,
+    w: np.ndarray,
+    n_groups: int,
+    q_low: float,
+    q_high: float,
+    quantiles: Sequence[float] = (),
+) -> dict[str, np.ndarray]:
+    """
+    Экоспектр-метрики для всех групп сразу. codes — номер группы (0..n_groups-1, -1 = вне групп).
+    Семантика как у compute_ecospectrum_stats: строки с NaN и w <= 0 не участвуют,
+    квантили — левый порог на накопленных весах (как weighted_quantile).
+
+    Функциональное разнообразие по тем же отсортированным сегментам:
+      skew, kurt — взвешенные асимметрия и эксцесс (excess, нормальное = 0; NaN при sigma = 0),
+      fdis       — FDis: взвешенное среднее |x - cwm|,
+      rao_q      — Rao Q = sum_ij p_i p_j |x_i - x_j| (через накопленные суммы, без пар).
+    """
+    valid = (codes >= 0) & ~np.isnan(x) & ~np.isnan(w) & (w > 0)
+    c = codes[valid]
+    xv = x[valid]
+    wv = w[valid]
+
+    # одна сортировка: по группе, внутри группы по значению признака
+    order = np.lexsort((xv, c))
+    c = c[order]
+    xv = xv[order]
+    wv = wv[order]
+
+    n_rows = np.bincount(c, minlength=n_groups).astype(float)
+    sum_w = np.zeros(n_groups)
+    cwm = np.full(n_groups, np.nan)
+    sigma = np.full(n_groups, np.nan)
+    skew = np.full(n_groups, np.nan)
+    kurt = np.full(n_groups, np.nan)
+    fdis = np.full(n_groups, np.nan)
+    rao_q = np.full(n_groups, np.nan)
+
+    if len(c):
+        present, starts = np.unique(c, return_index=True)
+        ends = np.append(starts[1:], len(c))
+
+        sw, mean, sd = segment_moments(xv, wv, starts, ends)
+        mad, m3, m4 = segment_central(xv, wv, starts, ends, mean)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sd_pos = np.where(sd > 0, sd, np.nan)
+            skew[present] = m3 / sd_pos ** 3
+            kurt[present] = m4 / sd_pos ** 4 - 3.0
+
+        sum_w[present] = sw
+        cwm[present] = mean
+        sigma[present] = sd
+        fdis[present] = mad
+        rao_q[present] = segment_rao(xv, wv, starts, ends)
+
+    qv = weighted_quantiles_sorted(c, xv, wv, [0.50, q_low, q_high, *quantiles], n_groups)
+
+    out = {
+        "n_rows_used": n_rows,
+        "sum_w": sum_w,
+        "cwm": cwm,
+        "sigma": sigma,
+        "w_median": qv[:, 0],
+        "w_min": qv[:, 1],
+        "w_max": qv[:, 2],
+        "skew": skew,
+        "kurt": kurt,
+        "fdis": fdis,
+        "rao_q": rao_q,
+    }
+    for j, q in enumerate(quantiles):
+        out[quantile_column(q)] = qv[:, 3 + j]
+    return out
+
+
+@memoize("ecospectrum_by_description", version="2", fmt="arrow")
 def compute_ecospectrum_by_description(
     df: pd.DataFrame,
     trait_col: str = "M",
@@ -91,6 +214,7 @@ def compute_ecospectrum_by_description(
     q_low: float = 0.05,
     q_high: float = 0.95,
     id_col: str = "description_id",
+    quantiles: Sequence[float] = (),
 ) -> pd.DataFrame:
     """
     Считает экоспектр-метрики для каждого description_id.
@@ -99,23 +223,476 @@ def compute_ecospectrum_by_description(
       - trait_col (например "M")
       - weight_col (например "w")
 
+    Все описания считаются одним векторным проходом (без groupby.apply);
+    результат совпадает с compute_ecospectrum_stats по каждому описанию.
+
+    quantiles — дополнительные взвешенные квантили (например (0.25, 0.75)),
+    добавляются колонками w_q25, w_q75 почти без доп. затрат.
+
     Возвращает DataFrame:
-      description_id, n_rows_used, sum_w, cwm, sigma, w_median, w_min, w_max
-    """
-
-    def _calc(group: pd.DataFrame) -> pd.Series:
-        stats = compute_ecospectrum_stats(
-            group,
-            trait_col=trait_col,
-            weight_col=weight_col,
-            q_low=q_low,
-            q_high=q_high,
-        )
-        return pd.Series(stats)
-
-    out = (
-        df.groupby(id_col, sort=False)
-          .apply(_calc)
-          .reset_index()
+      description_id, n_rows_used, sum_w, cwm, sigma, w_median, w_min, w_max,
+      skew, kurt, fdis, rao_q[, w_q..]
+    """
+    # порядок групп = порядок первого появления (как groupby(sort=False)); NaN id -> -1
+    codes, uniques = pd.factorize(df[id_col], sort=False)
+
+    stats = _ecospectrum_kernel(
+        codes,
+        df[trait_col].to_numpy(dtype=float, na_value=np.nan),
+        df[weight_col].to_numpy(dtype=float, na_value=np.nan),
+        len(uniques),
+        q_low,
+        q_high,
+        tuple(quantiles),
     )
+
+    out = pd.DataFrame({id_col: uniques})
+    for name, values in stats.items():
+        out[name] = values
+    return out
+
+
+def _stack_codes(codes: np.ndarray, n_cols: int) -> np.ndarray:
+    """
+    Коды групп для "растянутых" (строки x колонки, по колонкам) массивов:
+    группа = описание * n_cols + номер колонки (порядок: описание, внутри него колонки).
+    """
+    col_idx = np.repeat(np.arange(n_cols), len(codes))
+    codes_t = np.tile(codes, n_cols)
+    return np.where(codes_t >= 0, codes_t * n_cols + col_idx, -1)
+
+
+def _stack_scales(codes: np.ndarray, traits: np.ndarray, w: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (строки x шкалы) -> длинные массивы (см. _stack_codes). traits — матрица (n_rows, n_scales).
+    """
+    n_scales = traits.shape[1]
+    return _stack_codes(codes, n_scales), traits.ravel(order="F"), np.tile(w, n_scales)
+
+
+def _complete_cases(codes: np.ndarray, traits: np.ndarray, w: np.ndarray) -> np.ndarray:
+    return (codes >= 0) & ~np.isnan(traits).any(axis=1) & ~np.isnan(w) & (w > 0)
+
+
+def gower_ranges(codes: np.ndarray, traits: np.ndarray, w: np.ndarray) -> np.ndarray:
+    """Размах каждой шкалы по complete cases (нормировка расстояния Гауэра); нет строк -> NaN."""
+    ok = _complete_cases(codes, traits, w)
+    if not ok.any():
+        return np.full(traits.shape[1], np.nan)
+    return traits[ok].max(axis=0) - traits[ok].min(axis=0)
+
+
+def fd_components(
+    codes: np.ndarray,
+    traits: np.ndarray,
+    w: np.ndarray,
+    n_desc: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Одномерные FDis и Rao Q по каждой шкале, посчитанные только по complete cases
+    (виды со всеми шкалами), без нормировки. Массивы (n_desc, n_scales); описания
+    без complete cases -> NaN. Не зависят от других описаний (см. core.eco_store).
+    """
+    n_scales = traits.shape[1]
+    fdis = np.full((n_desc, n_scales), np.nan)
+    rao_q = np.full((n_desc, n_scales), np.nan)
+
+    ok = _complete_cases(codes, traits, w)
+    if not ok.any():
+        return fdis, rao_q
+
+    codes_long, x, wl = _stack_scales(codes[ok], traits[ok], w[ok])
+    order = np.lexsort((x, codes_long))
+    c, x, wl = codes_long[order], x[order], wl[order]
+    present, starts = np.unique(c, return_index=True)
+    ends = np.append(starts[1:], len(c))
+
+    _, mean, _ = segment_moments(x, wl, starts, ends)
+    mad, _, _ = segment_central(x, wl, starts, ends, mean)
+
+    # у complete cases каждое описание присутствует сразу всеми шкалами
+    desc = present[::n_scales] // n_scales
+    fdis[desc] = mad.reshape(-1, n_scales)
+    rao_q[desc] = segment_rao(x, wl, starts, ends).reshape(-1, n_scales)
+    return fdis, rao_q
+
+
+def combine_gower(fdis: np.ndarray, rao_q: np.ndarray, ranges: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Многопризнаковые FDis и Rao Q с расстоянием Гауэра d_ij = mean_k |x_ik - x_jk| / range_k.
+
+    Расстояние аддитивно по шкалам, поэтому обе метрики = среднее по шкалам от
+    одномерных fdis_k / range_k и rao_q_k / range_k (см. fd_components) — без матрицы
+    пар. Постоянные шкалы (range_k = 0) не участвуют. Центроид FDis — взвешенное
+    среднее по каждой шкале (Manhattan/Gower, без PCoA).
+    """
+    use = ranges > 0
+    if not use.any():
+        zero = np.where(np.isnan(fdis[:, 0]), np.nan, 0.0)
+        return zero, zero.copy()
+    return (fdis[:, use] / ranges[use]).mean(axis=1), (rao_q[:, use] / ranges[use]).mean(axis=1)
+
+
+def ecospectrum_parts(
+    df: pd.DataFrame,
+    trait_cols: Sequence[str],
+    weight_col: str = "w",
+    q_low: float = 0.05,
+    q_high: float = 0.95,
+    id_col: str = "description_id",
+    quantiles: Sequence[float] = (),
+) -> pd.DataFrame:
+    """
+    Всё, что считается по каждому описанию независимо от остальных:
+    длинная таблица  description_id | scale | n_rows_used | ... | fdis_cc | rao_q_cc
+    (fdis_cc / rao_q_cc — компоненты fdis_multi / rao_q_multi, см. fd_components).
+    Описания идут блоками по len(trait_cols) строк в порядке первого появления.
+    """
+    trait_cols = list(trait_cols)
+    missing = [c for c in trait_cols if c not in df.columns]
+    if missing:
+        raise KeyError(f"compute_ecospectrum_multi: missing trait columns {missing}")
+
+    codes, uniques = pd.factorize(df[id_col], sort=False)
+    n_desc, n_scales = len(uniques), len(trait_cols)
+
+    traits = np.column_stack([df[c].to_numpy(dtype=float, na_value=np.nan) for c in trait_cols])
+    w = df[weight_col].to_numpy(dtype=float, na_value=np.nan)
+
+    codes_long, x, w_long = _stack_scales(codes, traits, w)
+    stats = _ecospectrum_kernel(codes_long, x, w_long, n_desc * n_scales, q_low, q_high, tuple(quantiles))
+    fdis_cc, rao_q_cc = fd_components(codes, traits, w, n_desc)
+
+    out = pd.DataFrame({id_col: np.repeat(np.asarray(uniques), n_scales)})
+    if isinstance(uniques, pd.api.extensions.ExtensionArray):
+        out[id_col] = out[id_col].astype(uniques.dtype)
+    out["scale"] = np.tile(np.asarray(trait_cols, dtype=object), n_desc)
+    for name, values in stats.items():
+        out[name] = values
+    out["fdis_cc"] = fdis_cc.ravel()
+    out["rao_q_cc"] = rao_q_cc.ravel()
     return out
+
+
+def trait_ranges(df: pd.DataFrame, trait_cols: Sequence[str], weight_col: str = "w") -> np.ndarray:
+    """Размахи шкал для Гауэра по всем строкам df (complete cases)."""
+    traits = np.column_stack([df[c].to_numpy(dtype=float, na_value=np.nan) for c in trait_cols])
+    w = df[weight_col].to_numpy(dtype=float, na_value=np.nan)
+    return gower_ranges(np.zeros(len(df), dtype=np.intp), traits, w)
+
+
+def assemble_multi(
+    parts: pd.DataFrame,
+    ranges: np.ndarray,
+    trait_cols: Sequence[str],
+    id_col: str = "description_id",
+    wide: bool = False,
+) -> pd.DataFrame:
+    """
+    ecospectrum_parts (+ размахи шкал) -> результат compute_ecospectrum_multi:
+    компоненты fdis_cc / rao_q_cc сворачиваются в fdis_multi / rao_q_multi.
+    """
+    trait_cols = list(trait_cols)
+    n_scales = len(trait_cols)
+    fdis_multi, rao_q_multi = combine_gower(
+        parts["fdis_cc"].to_numpy(dtype=float).reshape(-1, n_scales),
+        parts["rao_q_cc"].to_numpy(dtype=float).reshape(-1, n_scales),
+        ranges,
+    )
+    out = parts.drop(columns=["fdis_cc", "rao_q_cc"])
+
+    if not wide:
+        out["fdis_multi"] = np.repeat(fdis_multi, n_scales)
+        out["rao_q_multi"] = np.repeat(rao_q_multi, n_scales)
+        return out
+
+    metrics = [c for c in out.columns if c not in (id_col, "scale")]
+    ids = out[id_col].iloc[::n_scales]
+    wide_df = out.pivot(index=id_col, columns="scale", values=metrics)
+    wide_df = wide_df.reindex(columns=pd.MultiIndex.from_product([metrics, trait_cols]))
+    wide_df.columns = [f"{m}_{s}" for m, s in wide_df.columns]
+    wide_df = wide_df.reindex(pd.Index(ids, name=id_col)).reset_index()
+    wide_df["fdis_multi"] = fdis_multi
+    wide_df["rao_q_multi"] = rao_q_multi
+    return wide_df
+
+
+@memoize("ecospectrum_multi", version="2", fmt="arrow")
+def compute_ecospectrum_multi(
+    df: pd.DataFrame,
+    trait_cols: Sequence[str] = ("L", "T", "M", "R", "N", "S"),
+    weight_col: str = "w",
+    q_low: float = 0.05,
+    q_high: float = 0.95,
+    id_col: str = "description_id",
+    quantiles: Sequence[float] = (),
+    wide: bool = False,
+) -> pd.DataFrame:
+    """
+    Экоспектр сразу по нескольким шкалам (матрица признаков, см. traits.attach_traits)
+    за один сгруппированный проход: строки "растягиваются" в (описание, шкала) и
+    считаются одним вызовом ядра. Значения по каждой шкале совпадают с
+    compute_ecospectrum_by_description(df, trait_col=шкала).
+
+    Плюс многопризнаковые fdis_multi / rao_q_multi по всем trait_cols
+    (см. combine_gower) — одно значение на описание.
+
+    wide=False: длинная таблица  description_id | scale | n_rows_used | sum_w | cwm | ... | fdis_multi | rao_q_multi
+    wide=True:  широкая таблица  description_id | cwm_M | sigma_M | ... | cwm_N | ... | fdis_multi | rao_q_multi
+    """
+    parts = ecospectrum_parts(df, trait_cols, weight_col, q_low, q_high, id_col, quantiles)
+    return assemble_multi(parts, trait_ranges(df, trait_cols, weight_col), trait_cols, id_col, wide)
+
+
+@memoize("ecospectrum_schemes", fmt="arrow")
+def compute_ecospectrum_schemes(
+    df: pd.DataFrame,
+    trait_col: str = "M",
+    weight_cols: Sequence[str] = ("w",),
+    q_low: float = 0.05,
+    q_high: float = 0.95,
+    id_col: str = "description_id",
+    quantiles: Sequence[float] = (),
+    wide: bool = False,
+) -> pd.DataFrame:
+    """
+    Экоспектр одной шкалы сразу для нескольких схем весов (см. abundance.attach_weight_matrix):
+    строки "растягиваются" в (описание, схема) и считаются одним вызовом ядра.
+    По каждой колонке весов — как compute_ecospectrum_by_description(df, weight_col=...).
+
+    wide=False: description_id | weights | n_rows_used | ... (weights = имя колонки весов)
+    wide=True:  description_id | cwm_w_presence | cwm_w_ordinal | ...
+    """
+    weight_cols = list(weight_cols)
+    codes, uniques = pd.factorize(df[id_col], sort=False)
+    n_desc, n_schemes = len(uniques), len(weight_cols)
+
+    x = df[trait_col].to_numpy(dtype=float, na_value=np.nan)
+    W = np.column_stack([df[c].to_numpy(dtype=float, na_value=np.nan) for c in weight_cols])
+    # как _stack_scales, только растягиваются веса, а признак повторяется
+    stats = _ecospectrum_kernel(
+        _stack_codes(codes, n_schemes),
+        np.tile(x, n_schemes),
+        W.ravel(order="F"),
+        n_desc * n_schemes,
+        q_low,
+        q_high,
+        tuple(quantiles),
+    )
+
+    out = pd.DataFrame({id_col: np.repeat(np.asarray(uniques), n_schemes)})
+    if isinstance(uniques, pd.api.extensions.ExtensionArray):
+        out[id_col] = out[id_col].astype(uniques.dtype)
+    out["weights"] = np.tile(np.asarray(weight_cols, dtype=object), n_desc)
+    for name, values in stats.items():
+        out[name] = values
+    if not wide:
+        return out
+
+    metrics = list(stats)
+    wide_df = out.pivot(index=id_col, columns="weights", values=metrics)
+    wide_df = wide_df.reindex(columns=pd.MultiIndex.from_product([metrics, weight_cols]))
+    wide_df.columns = [f"{m}_{c}" for m, c in wide_df.columns]
+    return wide_df.reindex(pd.Index(uniques, name=id_col)).reset_index()
+
+
+# ----------------------------
+# Спектр как гистограмма: описание x бин (значение шкалы)
+# ----------------------------
+
+SPECTRA_DIR = Path(__file__).resolve().parents[1] / "data" / "processed"
+# диапазоны шкал Элленберга (бины с шагом 1); шкала не из списка -> по данным
+SPECTRUM_RANGES = {"L": (1, 9), "T": (1, 9), "K": (1, 9), "M": (1, 12), "F": (1, 12), "R": (1, 9), "N": (1, 9), "S": (0, 9)}
+
+
+def spectrum_bin_columns(spec_df: pd.DataFrame, id_col: str = "description_id") -> list[str]:
+    """Колонки-бины таблицы спектров (всё, кроме id/группы); имена — значения шкалы ("1", "6.5")."""
+    return [c for c in spec_df.columns if c != id_col and _is_number(c)]
+
+
+def spectrum_bins(spec_df: pd.DataFrame, id_col: str = "description_id") -> np.ndarray:
+    return np.array([float(c) for c in spectrum_bin_columns(spec_df, id_col)])
+
+
+def _is_number(s: str) -> bool:
+    try:
+        float(s)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def build_spectrum_matrix(
+    df: pd.DataFrame,
+    trait_col: str = "M",
+    weight_col: str = "w",
+    id_col: str = "description_id",
+    bin_range: tuple[float, float] | None = None,
+    resolution: int = 1,
+) -> pd.DataFrame:
+    """
+    Плотная матрица спектров: description_id | "1" | "2" | ... | "12"
+    (сумма весов видов с данным значением шкалы). Строки с NaN и w <= 0 не
+    участвуют, как в compute_ecospectrum_stats; порядок описаний — первое появление.
+
+    Целые значения (Элленберг) ложатся в бины точно. Значение между бинами
+    делится между двумя соседними пропорционально расстоянию: сумма весов и CWM
+    сохраняются, sigma и квантили становятся приближёнными (df.attrs["exact"] = False).
+    resolution — бинов на единицу шкалы.
+    """
+    codes, uniques = pd.factorize(df[id_col], sort=False)
+    x = df[trait_col].to_numpy(dtype=float, na_value=np.nan)
+    w = df[weight_col].to_numpy(dtype=float, na_value=np.nan)
+    valid = (codes >= 0) & ~np.isnan(x) & ~np.isnan(w) & (w > 0)
+
+    lo, hi = bin_range or SPECTRUM_RANGES.get(trait_col, (np.nan, np.nan))
+    if valid.any():
+        lo = np.nanmin([lo, np.floor(x[valid].min())])
+        hi = np.nanmax([hi, np.ceil(x[valid].max())])
+    elif np.isnan(lo):
+        lo, hi = 0.0, 0.0
+    bins = lo + np.arange(int(round((hi - lo) * resolution)) + 1) / resolution
+    n_bins, n_desc = len(bins), len(uniques)
+
+    c, xv, wv = codes[valid], x[valid], w[valid]
+    pos = (xv - lo) * resolution
+    left = np.floor(pos).astype(np.int64)
+    frac = pos - left
+    exact = bool(np.all(frac == 0))
+    right = np.minimum(left + 1, n_bins - 1)
+
+    flat = np.bincount(c * n_bins + left, weights=wv * (1.0 - frac), minlength=n_desc * n_bins)
+    if not exact:
+        flat += np.bincount(c * n_bins + right, weights=wv * frac, minlength=n_desc * n_bins)
+
+    out = pd.DataFrame(flat.reshape(n_desc, n_bins), columns=[f"{b:g}" for b in bins])
+    out.insert(0, id_col, uniques)
+    out.attrs["exact"] = exact
+    out.attrs["scale"] = trait_col
+    return out
+
+
+def spectrum_stats(
+    spec_df: pd.DataFrame,
+    q_low: float = 0.05,
+    q_high: float = 0.95,
+    quantiles: Sequence[float] = (),
+    id_col: str = "description_id",
+) -> pd.DataFrame:
+    """
+    Метрики из матрицы спектров без строк видов: sum_w, cwm, sigma, w_median,
+    w_min, w_max[, w_q..]. Для точных (целых) спектров совпадают с
+    compute_ecospectrum_by_description до округления (квантили — точно).
+    """
+    bins = spectrum_bins(spec_df, id_col)
+    W = spec_df[spectrum_bin_columns(spec_df, id_col)].to_numpy(dtype=float)
+
+    sum_w = W.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cwm = W @ bins / sum_w
+        sigma = np.sqrt((W * (bins[None, :] - cwm[:, None]) ** 2).sum(axis=1) / sum_w)
+
+    out = pd.DataFrame({id_col: spec_df[id_col].to_numpy(), "sum_w": sum_w, "cwm": cwm, "sigma": sigma})
+    qs = [0.50, q_low, q_high, *quantiles]
+    names = ["w_median", "w_min", "w_max", *[quantile_column(q) for q in quantiles]]
+    qv = spectrum_quantiles(W, bins, qs)
+    for j, name in enumerate(names):
+        out[name] = qv[:, j]
+    return out
+
+
+def spectrum_quantiles(W: np.ndarray, bins: np.ndarray, qs: Sequence[float]) -> np.ndarray:
+    """
+    Взвешенные квантили из гистограмм (строки W): первый непустой бин, где накопленный
+    вес >= q * total (левый порог, как weighted_quantile). Пустые строки -> NaN.
+    """
+    cum = np.cumsum(W, axis=1)
+    total = cum[:, -1] if W.shape[1] else np.zeros(len(W))
+    out = np.full((len(W), len(qs)), np.nan)
+    has = total > 0
+    for j, q in enumerate(qs):
+        hit = (cum >= (q * total)[:, None]) & (W > 0)
+        out[has, j] = bins[hit[has].argmax(axis=1)]
+    return out
+
+
+def pool_spectra(
+    spec_df: pd.DataFrame,
+    groups: pd.Series | np.ndarray,
+    normalize: bool = True,
+    group_col: str = "year",
+    id_col: str = "description_id",
+) -> pd.DataFrame:
+    """
+    Сводный спектр группы (обычно года): среднее относительных спектров описаний
+    (normalize=True: каждое описание — доли, сумма 1; тогда CWM сводного спектра =
+    среднее CWM описаний года) или сумма весов (normalize=False).
+    groups — значение группы для каждой строки spec_df.
+    Возвращает: year | n_desc | "1" | "2" | ... (группы отсортированы).
+    """
+    cols = spectrum_bin_columns(spec_df, id_col)
+    W = spec_df[cols].to_numpy(dtype=float)
+    if normalize:
+        tot = W.sum(axis=1, keepdims=True)
+        keep = tot[:, 0] > 0
+        W = W[keep] / tot[keep]
+        groups = np.asarray(groups)[keep]
+
+    codes, keys = pd.factorize(np.asarray(groups), sort=True)
+    ok = codes >= 0
+    counts = np.bincount(codes[ok], minlength=len(keys)).astype(float)
+    pooled = np.zeros((len(keys), W.shape[1]))
+    np.add.at(pooled, codes[ok], W[ok])
+    if normalize:
+        pooled /= np.maximum(counts, 1.0)[:, None]
+
+    out = pd.DataFrame(pooled, columns=cols)
+    out.insert(0, group_col, keys)
+    out.insert(1, "n_desc", counts.astype(int))
+    return out
+
+
+def spectrum_distances(W: np.ndarray, bins: np.ndarray, metric: str = "emd") -> np.ndarray:
+    """
+    Попарные расстояния между спектрами (строками W, нормируются к сумме 1):
+      "emd"       — earth mover's (Wasserstein-1) по оси шкалы: sum |CDF_a - CDF_b| * шаг,
+      "l1"        — сумма |p_a - p_b|,
+      "hellinger" — sqrt(1 - sum sqrt(p_a p_b)).
+    Возвращает матрицу (n x n).
+    """
+    tot = W.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        P = np.where(tot > 0, W / tot, np.nan)
+
+    if metric == "emd":
+        step = np.diff(bins)
+        C = np.cumsum(P, axis=1)[:, :-1]
+        return (np.abs(C[:, None, :] - C[None, :, :]) * step).sum(axis=2)
+    if metric == "l1":
+        return np.abs(P[:, None, :] - P[None, :, :]).sum(axis=2)
+    if metric == "hellinger":
+        S = np.sqrt(P)
+        return np.sqrt(np.clip(1.0 - S @ S.T, 0.0, None))
+    raise ValueError(f"Unknown spectrum distance: {metric!r} (expected emd | l1 | hellinger)")
+
+
+def spectrum_path(scale: str, out_dir: Path = SPECTRA_DIR) -> Path:
+    return Path(out_dir) / f"spectra_{scale}.parquet"
+
+
+def save_spectra(spectra: dict[str, pd.DataFrame], out_dir: Path = SPECTRA_DIR) -> list[Path]:
+    """Сохраняет матрицы спектров рядом с processed-данными: spectra_{scale}.parquet."""
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    paths = []
+    for scale, spec_df in spectra.items():
+        p = spectrum_path(scale, out_dir)
+        spec_df.to_parquet(p, index=False)
+        paths.append(p)
+    return paths
+
+
+def load_spectrum(scale: str, out_dir: Path = SPECTRA_DIR) -> pd.DataFrame:
+    p = spectrum_path(scale, out_dir)
+    if not p.exists():
+        raise FileNotFoundError(f"{p} not found (build it: python scripts/build_spectra.py)")
+    return pd.read_parquet(p)
@@ -0,0 +1,264 @@
+# core/grid_engine.py
+"""
+Сетка eco_vs_climate без run_scenario на каждую комбинацию.
+
+Один годовой ряд eco (load_eco_year) + срезы куба климатических сигналов
+(core.climate_cube) -> матрица сигналов для всех (climate_var, period, lag, window) ->
+Pearson, Spearman (Pearson рангов), их p-значения, p по круговым сдвигам и p с
+поправкой на автокорреляцию (эффективный объём выборки) пачкой, матричными операциями.
+
+Сглаженный климатический сигнал (window 2-3) сильно автокоррелирован, и обычный
+pearson_p завышает значимость. Поэтому рядом:
+  ac1_eco / ac1_clim        — автокорреляция лага 1 рядов пары;
+  n_eff / pearson_p_eff     — Bretherton et al. (1999), лаг 1;
+  n_eff_pp / pearson_p_pp   — Pyper & Peterman (1998), лаги 1..n/5 (типа Dutilleul)
+(см. core.kernels.effective_n). Автокорреляции считаются по годам пары подряд,
+без учёта пропусков в годах, — как и круговые сдвиги.
+
+Семантика та же, что в run_scenario(analysis="eco_vs_climate"):
+  - окно и лаг — в календарных годах (сигнал из куба), сигнал берётся на годах eco;
+  - пары с NaN выбрасываются; r / p при n >= 3, p_shift при n >= 4.
+Результат совпадает с поштучным прогоном с точностью до округления.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from core.climate_cube import CLIMATE_VARS, METEO_PERIODS_CSV, climate_signal_matrix
+from core.kernels import (
+    SHIFT_MODE_DEFAULT,
+    autocorrelations,
+    circular_shift_pvalues,
+    effective_n_from_acf,
+    effective_n_pvalues,
+)
+from core.scenario_runner import load_eco_year
+
+GRID_COLUMNS = [
+    "climate_var", "period", "lag", "window",
+    "n_years", "year_min", "year_max",
+    "pearson_r", "pearson_p", "pearson_p_shift",
+    "spearman_rho", "spearman_p",
+    "ac1_eco", "ac1_clim", "n_eff", "pearson_p_eff", "n_eff_pp", "pearson_p_pp",
+]
+# текст ошибки блока (climate_var, period), None — блок посчитан; идёт в результат после GRID_COLUMNS
+ERROR_COLUMN = "error"
+
+
+def _masked_pearson(A: np.ndarray, B: np.ndarray, mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Построчный Pearson r по позициям mask (A, B, mask — (k, n)). Возвращает (r, n)."""
+    m = mask.astype(float)
+    n = m.sum(axis=1)
+    a = np.where(mask, A, 0.0)
+    b = np.where(mask, B, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ac = (a - (a.sum(axis=1) / n)[:, None]) * m
+        bc = (b - (b.sum(axis=1) / n)[:, None]) * m
+        r = (ac * bc).sum(axis=1) / np.sqrt((ac * ac).sum(axis=1) * (bc * bc).sum(axis=1))
+    return np.clip(r, -1.0, 1.0), n
+
+
+def _masked_ranks(A: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Средние ранги (как scipy.stats.rankdata) по позициям mask в каждой строке; вне mask — NaN."""
+    return stats.rankdata(np.where(mask, A, np.nan), axis=1, nan_policy="omit")
+
+
+def _pearson_pvalue(r: np.ndarray, n: np.ndarray) -> np.ndarray:
+    # как scipy.stats.pearsonr: бета-распределение r при H0
+    p = np.full(len(r), np.nan)
+    ok = (n >= 3) & ~np.isnan(r)
+    a = n[ok] / 2 - 1
+    p[ok] = np.clip(2 * stats.beta.sf(np.abs(r[ok]), a, a, loc=-1, scale=2), 0.0, 1.0)
+    return p
+
+
+def _spearman_pvalue(rho: np.ndarray, n: np.ndarray) -> np.ndarray:
+    # как scipy.stats.spearmanr: t-распределение с n - 2 степенями свободы
+    p = np.full(len(rho), np.nan)
+    ok = (n >= 3) & ~np.isnan(rho)
+    dof = n[ok] - 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = rho[ok] * np.sqrt(dof / ((rho[ok] + 1.0) * (1.0 - rho[ok])))
+    p[ok] = 2 * stats.t.sf(np.abs(t), dof)
+    return p
+
+
+def _series_stats(
+    E: np.ndarray, S: np.ndarray, mask: np.ndarray, n: np.ndarray, n_perm: int, seed: int, mode: str
+) -> dict[str, np.ndarray]:
+    """
+    Статистики по сжатым рядам пары (только годы mask): p по круговым сдвигам (n >= 4),
+    автокорреляции лага 1 и эффективные n (n >= 3). Комбинации с одинаковым n — одной пачкой.
+    """
+    out = {c: np.full(len(n), np.nan) for c in ("pearson_p_shift", "ac1_eco", "ac1_clim", "n_eff", "n_eff_pp")}
+    for n_k in np.unique(n[n >= 3]):
+        rows = np.flatnonzero(n == n_k)
+        m = mask[rows]
+        X = E[rows][m].reshape(len(rows), int(n_k))
+        Y = S[rows][m].reshape(len(rows), int(n_k))
+        if n_k >= 4:
+            out["pearson_p_shift"][rows] = circular_shift_pvalues(X, Y, n_perm=n_perm, seed=seed, mode=mode)
+        # одна пачка ACF (лаги 1..n/5) на оба метода
+        ax = autocorrelations(X, max(1, int(n_k) // 5))
+        ay = autocorrelations(Y, max(1, int(n_k) // 5))
+        out["ac1_eco"][rows] = ax[:, 0]
+        out["ac1_clim"][rows] = ay[:, 0]
+        out["n_eff"][rows] = effective_n_from_acf(ax, ay, int(n_k), "bretherton")
+        out["n_eff_pp"][rows] = effective_n_from_acf(ax, ay, int(n_k), "pyper_peterman")
+    return out
+
+
+def eco_climate_grid(
+    eco_year: pd.DataFrame,
+    periods: Sequence[str],
+    lags: Sequence[int] = (0,),
+    windows: Sequence[int] = (1,),
+    climate_vars: Sequence[str] = ("pedya",),
+    climate_csv: str | Path | None = None,
+    n_perm: int = 999,
+    seed: int = 42,
+    shift_mode: str = SHIFT_MODE_DEFAULT,
+) -> pd.DataFrame:
+    """
+    eco_year: year | eco (как load_eco_year); климат — из куба по climate_csv
+    (по умолчанию meteo_periods). Одна строка результата на (climate_var, period, lag, window),
+    колонки GRID_COLUMNS — те же числа, что run_scenario кладёт в каждую строку joined,
+    плюс ERROR_COLUMN: блок (climate_var, period), на котором упал расчёт, остаётся в
+    результате строками с NaN и текстом ошибки — как строки с "error" в старом поштучном цикле.
+    shift_mode="exact" / "auto" — точный p по всем круговым сдвигам (см. circular_shift_pvalue);
+    pearson_p_shift тогда не совпадает с run_scenario, режим пишется в df.attrs["shift_mode"].
+    """
+    lags = [int(x) for x in lags]
+    windows = [max(1, int(x)) for x in windows]
+    unknown = [v for v in climate_vars if v not in CLIMATE_VARS]
+    if unknown:
+        raise KeyError(f"Unknown climate_var {unknown}. Expected one of: {', '.join(CLIMATE_VARS)}.")
+    csv_path = Path(climate_csv or METEO_PERIODS_CSV)
+
+    eco_year = eco_year[["year", "eco"]].sort_values("year")
+    years = eco_year["year"].to_numpy()
+    eco = eco_year["eco"].to_numpy(dtype=float)
+
+    # блоки (climate_var, period) копятся как массивы; p-значения по распределениям
+    # (scipy sf) считаются одним вызовом на всю сетку, таблица собирается один раз
+    blocks: dict[str, list] = {c: [] for c in ("climate_var", "period", "lag", "window", "n", "ymin", "ymax", "r", "rho", "error")}
+    series: dict[str, list] = {}
+    k = len(lags) * len(windows)
+    for climate_var in climate_vars:
+        for period in periods:
+            # ошибка одного блока не роняет сетку: его строки остаются с NaN и текстом в "error"
+            try:
+                S = climate_signal_matrix(climate_var, period, lags, windows, years, csv_path)
+                E = np.broadcast_to(eco, S.shape)
+                mask = ~np.isnan(E) & ~np.isnan(S)
+
+                r, n = _masked_pearson(E, S, mask)
+                rho, _ = _masked_pearson(_masked_ranks(E, mask), _masked_ranks(S, mask), mask)
+                few = n < 3
+                r[few] = np.nan
+                rho[few] = np.nan
+
+                yrs = np.broadcast_to(years.astype(float), S.shape)
+                block = {
+                    "n": n,
+                    "ymin": np.where(mask, yrs, np.inf).min(axis=1, initial=np.inf),
+                    "ymax": np.where(mask, yrs, -np.inf).max(axis=1, initial=-np.inf),
+                    "r": r,
+                    "rho": rho,
+                    "error": np.full(k, None, dtype=object),
+                }
+                stats_k = _series_stats(E, S, mask, n, n_perm, seed, shift_mode)
+            except Exception as e:
+                nan = np.full(k, np.nan)
+                block = {"n": np.zeros(k, dtype=int), "ymin": nan, "ymax": nan, "r": nan, "rho": nan,
+                         "error": np.full(k, f"{type(e).__name__}: {e}", dtype=object)}
+                stats_k = {c: nan for c in ("pearson_p_shift", "ac1_eco", "ac1_clim", "n_eff", "n_eff_pp")}
+
+            blocks["climate_var"].append(np.full(k, climate_var, dtype=object))
+            blocks["period"].append(np.full(k, period, dtype=object))
+            blocks["lag"].append(np.repeat(lags, len(windows)))
+            blocks["window"].append(np.tile(windows, len(lags)))
+            for c, v in block.items():
+                blocks[c].append(v)
+            for c, v in stats_k.items():
+                series.setdefault(c, []).append(v)
+
+    if not blocks["n"]:
+        return pd.DataFrame(columns=GRID_COLUMNS + [ERROR_COLUMN])
+
+    col = {c: np.concatenate(v) for c, v in blocks.items()}
+    ser = {c: np.concatenate(v) for c, v in series.items()}
+    n, r, rho = col["n"], col["r"], col["rho"]
+    # обе поправки на автокорреляцию — одним t.sf по всей сетке
+    p_ess = effective_n_pvalues(np.concatenate([r, r]), np.concatenate([ser["n_eff"], ser["n_eff_pp"]]))
+
+    out = pd.DataFrame({
+        "climate_var": col["climate_var"],
+        "period": col["period"],
+        "lag": col["lag"],
+        "window": col["window"],
+        "n_years": n.astype(int),
+        "year_min": pd.array(np.where(n > 0, col["ymin"], np.nan), dtype="Int64"),
+        "year_max": pd.array(np.where(n > 0, col["ymax"], np.nan), dtype="Int64"),
+        "pearson_r": r,
+        "pearson_p": _pearson_pvalue(r, n),
+        "pearson_p_shift": ser["pearson_p_shift"],
+        "spearman_rho": rho,
+        "spearman_p": _spearman_pvalue(rho, n),
+        "ac1_eco": ser["ac1_eco"],
+        "ac1_clim": ser["ac1_clim"],
+        "n_eff": ser["n_eff"],
+        "pearson_p_eff": p_ess[:len(r)],
+        "n_eff_pp": ser["n_eff_pp"],
+        "pearson_p_pp": p_ess[len(r):],
+        ERROR_COLUMN: col["error"],
+    })[GRID_COLUMNS + [ERROR_COLUMN]]
+    out.attrs["shift_mode"] = shift_mode
+    return out
+
+
+def run_eco_climate_grid(
+    filters: Dict[str, Any] | None,
+    scale: str,
+    eco_metric: str,
+    periods: Sequence[str],
+    lags: Sequence[int] = (0,),
+    windows: Sequence[int] = (1,),
+    climate_vars: Sequence[str] = ("pedya",),
+    climate_csv: str | Path | None = None,
+    bootstrap: Any = None,
+    **kwargs,
+) -> pd.DataFrame:
+    """
+    Сетка целиком: eco_year (из кеша, один раз) + куб климатических сигналов -> eco_climate_grid.
+    В результат добавляются trait_scale и eco_metric.
+    """
+    eco_year = load_eco_year(filters or {}, scale, eco_metric, bootstrap)
+    out = eco_climate_grid(eco_year, periods, lags, windows, climate_vars, climate_csv, **kwargs)
+    out.insert(0, "eco_metric", eco_metric)
+    out.insert(0, "trait_scale", scale)
+    return out
+
+
+def run_grid_spec(spec: Any) -> pd.DataFrame:
+    """
+    run_eco_climate_grid по спеке (для core.batch_executor.run_batch): поля filters, trait_scale,
+    eco_metric, periods, lags, windows, climate_vars; необязательные climate_csv, bootstrap, shift_mode.
+    """
+    return run_eco_climate_grid(
+        getattr(spec, "filters", None),
+        getattr(spec, "trait_scale", "M"),
+        getattr(spec, "eco_metric", "cwm"),
+        spec.periods,
+        getattr(spec, "lags", (0,)),
+        getattr(spec, "windows", (1,)),
+        getattr(spec, "climate_vars", ("pedya",)),
+        getattr(spec, "climate_csv", None),
+        getattr(spec, "bootstrap", None),
+        shift_mode=getattr(spec, "shift_mode", SHIFT_MODE_DEFAULT),
+    )
@@ -0,0 +1,529 @@
+# core/kernels.py
+"""
+Тяжёлые численные циклы с двумя реализациями:
+  - "numba": JIT-компиляция (если numba установлена),
+  - "numpy": векторный NumPy (всегда доступен).
+
+Бэкенд выбирается автоматически (numba, если импортируется), переопределяется
+переменной окружения ECO_KERNEL_BACKEND=numpy|numba или set_backend().
+
+Все функции работают с сегментами: данные отсортированы по (группа, значение),
+группа i занимает [starts[i], ends[i]).
+
+Сверка бэкендов: python scripts/test_kernel_parity.py
+Бенчмарк:        python scripts/bench_kernels.py
+"""
+from __future__ import annotations
+
+import os
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+try:
+    import numba
+    HAVE_NUMBA = True
+except ImportError:  # optional
+    numba = None
+    HAVE_NUMBA = False
+
+BACKENDS = ("numpy", "numba")
+_backend = os.environ.get("ECO_KERNEL_BACKEND", "numba" if HAVE_NUMBA else "numpy")
+
+
+def get_backend() -> str:
+    return _backend if (_backend != "numba" or HAVE_NUMBA) else "numpy"
+
+
+def set_backend(name: str) -> str:
+    """
+    Переключает бэкенд; возвращает предыдущий. "numba" без установленной numba -> ImportError.
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown kernel backend: {name!r} (expected one of {BACKENDS})")
+    if name == "numba" and not HAVE_NUMBA:
+        raise ImportError("numba is not installed (pip install numba)")
+    prev = get_backend()
+    _backend = name
+    return prev
+
+
+# ----------------------------
+# NumPy-реализации
+# ----------------------------
+
+def _segmented_searchsorted(
+    cum: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    cutoffs: np.ndarray,
+) -> np.ndarray:
+    """
+    np.searchsorted(cum[s:e], cutoff, side="left") + s для каждого сегмента сразу
+    (векторный бинарный поиск: ~log2(макс. длины сегмента) шагов по всем сегментам).
+    """
+    lo = starts.copy()
+    hi = ends.copy()
+    active = lo < hi
+    while active.any():
+        mid = (lo + hi) // 2
+        go_right = active & (cum[np.minimum(mid, len(cum) - 1)] < cutoffs)
+        lo = np.where(go_right, mid + 1, lo)
+        hi = np.where(active & ~go_right, mid, hi)
+        active = lo < hi
+    return lo
+
+
+def _segment_moments_np(x, w, starts, ends):
+    sw = np.add.reduceat(w, starts)
+    mean = np.add.reduceat(w * x, starts) / sw
+    var = np.add.reduceat(w * (x - np.repeat(mean, ends - starts)) ** 2, starts) / sw
+    return sw, mean, np.sqrt(var)
+
+
+def _segment_quantiles_np(x, w, starts, ends, qs):
+    # накопленные веса внутри сегмента (последовательно, как np.cumsum в weighted_quantile)
+    seg = np.repeat(np.arange(len(starts)), ends - starts)
+    cum = pd.Series(w).groupby(seg, sort=False).cumsum().to_numpy()
+    total = cum[ends - 1]
+
+    # матрица порогов (сегмент x квантиль) -> плоский вектор для одного поиска
+    cutoffs = (total[:, None] * qs[None, :]).ravel()
+    seg_starts = np.repeat(starts, len(qs))
+    seg_ends = np.repeat(ends, len(qs))
+
+    idx = _segmented_searchsorted(cum, seg_starts, seg_ends, cutoffs)
+    idx = np.minimum(idx, seg_ends - 1)
+    return x[idx].reshape(len(starts), len(qs))
+
+
+def _segment_central_np(x, w, starts, ends, mean):
+    sw = np.add.reduceat(w, starts)
+    d = x - np.repeat(mean, ends - starts)
+    mad = np.add.reduceat(w * np.abs(d), starts) / sw
+    m3 = np.add.reduceat(w * d ** 3, starts) / sw
+    m4 = np.add.reduceat(w * d ** 4, starts) / sw
+    return mad, m3, m4
+
+
+def _segment_rao_np(x, w, starts, ends):
+    # x отсортирован внутри сегмента: sum_ij p_i p_j |x_i - x_j| = 2 sum_j p_j (x_j P_<j - S_<j)
+    sizes = ends - starts
+    seg = np.repeat(np.arange(len(starts)), sizes)
+    p = w / np.repeat(np.add.reduceat(w, starts), sizes)
+    px = p * x
+    g = pd.DataFrame({"p": p, "px": px}).groupby(seg, sort=False).cumsum()
+    p_before = g["p"].to_numpy() - p
+    px_before = g["px"].to_numpy() - px
+    return 2.0 * np.add.reduceat(p * (x * p_before - px_before), starts)
+
+
+def _shift_correlations_np(x, y, shifts):
+    n = len(x)
+    xc = x - x.mean()
+    yc = y - y.mean()
+    # строка k = np.roll(yc, shifts[k])
+    idx = (np.arange(n)[None, :] - np.asarray(shifts)[:, None]) % n
+    num = yc[idx] @ xc
+    den = np.sqrt(np.dot(xc, xc) * np.dot(yc, yc))
+    if den == 0:  # постоянный ряд: корреляция не определена
+        return np.full(len(idx), np.nan)
+    return num / den
+
+
+# ----------------------------
+# Numba-реализации (те же формулы, явные циклы)
+# ----------------------------
+
+if HAVE_NUMBA:
+    @numba.njit(cache=True)
+    def _segment_moments_nb(x, w, starts, ends):
+        m = len(starts)
+        sw = np.empty(m)
+        mean = np.empty(m)
+        sigma = np.empty(m)
+        for i in range(m):
+            s, e = starts[i], ends[i]
+            a = 0.0
+            b = 0.0
+            for j in range(s, e):
+                a += w[j]
+                b += w[j] * x[j]
+            mu = b / a
+            v = 0.0
+            for j in range(s, e):
+                d = x[j] - mu
+                v += w[j] * d * d
+            sw[i] = a
+            mean[i] = mu
+            sigma[i] = np.sqrt(v / a)
+        return sw, mean, sigma
+
+    @numba.njit(cache=True)
+    def _segment_quantiles_nb(x, w, starts, ends, qs):
+        m = len(starts)
+        nq = len(qs)
+        out = np.empty((m, nq))
+        cum = np.empty(len(w))
+        for i in range(m):
+            s, e = starts[i], ends[i]
+            acc = 0.0
+            for j in range(s, e):
+                acc += w[j]
+                cum[j] = acc
+            for k in range(nq):
+                cutoff = acc * qs[k]
+                lo, hi = s, e
+                while lo < hi:  # searchsorted side="left"
+                    mid = (lo + hi) // 2
+                    if cum[mid] < cutoff:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                out[i, k] = x[min(lo, e - 1)]
+        return out
+
+    @numba.njit(cache=True)
+    def _segment_central_nb(x, w, starts, ends, mean):
+        m = len(starts)
+        mad = np.empty(m)
+        m3 = np.empty(m)
+        m4 = np.empty(m)
+        for i in range(m):
+            s, e = starts[i], ends[i]
+            sw = 0.0
+            a1 = 0.0
+            a3 = 0.0
+            a4 = 0.0
+            for j in range(s, e):
+                d = x[j] - mean[i]
+                sw += w[j]
+                a1 += w[j] * abs(d)
+                a3 += w[j] * d ** 3
+                a4 += w[j] * d ** 4
+            mad[i] = a1 / sw
+            m3[i] = a3 / sw
+            m4[i] = a4 / sw
+        return mad, m3, m4
+
+    @numba.njit(cache=True)
+    def _segment_rao_nb(x, w, starts, ends):
+        m = len(starts)
+        out = np.empty(m)
+        for i in range(m):
+            s, e = starts[i], ends[i]
+            sw = 0.0
+            for j in range(s, e):
+                sw += w[j]
+            p_before = 0.0
+            px_before = 0.0
+            q = 0.0
+            for j in range(s, e):
+                p = w[j] / sw
+                q += p * (x[j] * p_before - px_before)
+                p_before += p
+                px_before += p * x[j]
+            out[i] = 2.0 * q
+        return out
+
+    @numba.njit(cache=True)
+    def _shift_correlations_nb(x, y, shifts):
+        n = len(x)
+        mx = x.mean()
+        my = y.mean()
+        xc = x - mx
+        yc = y - my
+        den = np.sqrt(np.dot(xc, xc) * np.dot(yc, yc))
+        out = np.empty(len(shifts))
+        if den == 0.0:
+            out[:] = np.nan
+            return out
+        for k in range(len(shifts)):
+            sh = shifts[k] % n
+            acc = 0.0
+            for i in range(n):
+                j = i - sh
+                if j < 0:
+                    j += n
+                acc += yc[j] * xc[i]
+            out[k] = acc / den
+        return out
+
+
+# ----------------------------
+# Публичные функции (диспетчер)
+# ----------------------------
+
+def segment_moments(
+    x: np.ndarray,
+    w: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Для каждого непустого сегмента: (sum_w, взвешенное среднее, взвешенное sd).
+    """
+    x = np.ascontiguousarray(x, dtype=float)
+    w = np.ascontiguousarray(w, dtype=float)
+    starts = np.ascontiguousarray(starts, dtype=np.int64)
+    ends = np.ascontiguousarray(ends, dtype=np.int64)
+    if len(starts) == 0:
+        empty = np.empty(0)
+        return empty, empty.copy(), empty.copy()
+    if get_backend() == "numba":
+        return _segment_moments_nb(x, w, starts, ends)
+    return _segment_moments_np(x, w, starts, ends)
+
+
+def segment_central(
+    x: np.ndarray,
+    w: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    mean: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Взвешенные центральные моменты вокруг mean (на сегмент):
+    (среднее |x - mean|, 3-й момент, 4-й момент), все нормированы на sum_w.
+    """
+    x = np.ascontiguousarray(x, dtype=float)
+    w = np.ascontiguousarray(w, dtype=float)
+    starts = np.ascontiguousarray(starts, dtype=np.int64)
+    ends = np.ascontiguousarray(ends, dtype=np.int64)
+    mean = np.ascontiguousarray(mean, dtype=float)
+    if len(starts) == 0:
+        empty = np.empty(0)
+        return empty, empty.copy(), empty.copy()
+    if get_backend() == "numba":
+        return _segment_central_nb(x, w, starts, ends, mean)
+    return _segment_central_np(x, w, starts, ends, mean)
+
+
+def segment_rao(
+    x: np.ndarray,
+    w: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+) -> np.ndarray:
+    """
+    Rao Q = sum_ij p_i p_j |x_i - x_j| (p = w / sum_w) для сегментов, отсортированных
+    по значению: через накопленные суммы (средняя разность Джини), O(n) вместо O(n^2).
+    """
+    x = np.ascontiguousarray(x, dtype=float)
+    w = np.ascontiguousarray(w, dtype=float)
+    starts = np.ascontiguousarray(starts, dtype=np.int64)
+    ends = np.ascontiguousarray(ends, dtype=np.int64)
+    if len(starts) == 0:
+        return np.empty(0)
+    if get_backend() == "numba":
+        return _segment_rao_nb(x, w, starts, ends)
+    return _segment_rao_np(x, w, starts, ends)
+
+
+def segment_quantiles(
+    x: np.ndarray,
+    w: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    qs: Sequence[float],
+) -> np.ndarray:
+    """
+    Взвешенные квантили (левый порог на накопленных весах, как weighted_quantile)
+    для непустых сегментов, отсортированных по значению. Возвращает (n_segments, len(qs)).
+    """
+    x = np.ascontiguousarray(x, dtype=float)
+    w = np.ascontiguousarray(w, dtype=float)
+    starts = np.ascontiguousarray(starts, dtype=np.int64)
+    ends = np.ascontiguousarray(ends, dtype=np.int64)
+    qs = np.ascontiguousarray(qs, dtype=float)
+    if len(starts) == 0 or len(qs) == 0:
+        return np.empty((len(starts), len(qs)))
+    if get_backend() == "numba":
+        return _segment_quantiles_nb(x, w, starts, ends, qs)
+    return _segment_quantiles_np(x, w, starts, ends, qs)
+
+
+def shift_correlations(x: np.ndarray, y: np.ndarray, shifts: Sequence[int]) -> np.ndarray:
+    """
+    Pearson r между x и np.roll(y, k) для каждого k из shifts (NaN, если x или y постоянен).
+    """
+    x = np.ascontiguousarray(x, dtype=float)
+    y = np.ascontiguousarray(y, dtype=float)
+    shifts = np.ascontiguousarray(shifts, dtype=np.int64)
+    if get_backend() == "numba":
+        return _shift_correlations_nb(x, y, shifts)
+    return _shift_correlations_np(x, y, shifts)
+
+
+SHIFT_MODES = ("auto", "exact", "sampled")
+# "exact" даёт другое (точное) p, чем случайные сдвиги, — включается явно,
+# чтобы уже посчитанные pearson_p_shift не менялись молча
+SHIFT_MODE_DEFAULT = "sampled"
+
+
+def circular_shift_pvalue(x, y, n_perm: int = 999, seed: int = 42, mode: str = SHIFT_MODE_DEFAULT) -> float:
+    """
+    Robust p-value: circular shift permutation (keeps temporal structure of y).
+
+    mode:
+      "sampled" — (по умолчанию) n_perm случайных сдвигов 1..n-1 (seed),
+                  p = (#{|r_k| >= |r_obs|} + 1) / (n_perm + 1);
+      "exact"   — все n сдвигов (включая нулевой) одним матричным вызовом — точный
+                  перестановочный p = #{k = 0..n-1: |r_k| >= |r_obs|} / n = (count + 1) / n,
+                  не зависит от n_perm. Отличается от "sampled" (шум выборки и знаменатель),
+                  поэтому включается явно;
+      "auto"    — "exact", если различных сдвигов не больше n_perm (короткие ряды:
+                  выборка только повторяла бы их), иначе "sampled".
+    """
+    if mode not in SHIFT_MODES:
+        raise ValueError(f"Unknown shift mode '{mode}' (expected {SHIFT_MODES})")
+    x = np.asarray(x, float)
+    y = np.asarray(y, float)
+    n = len(x)
+    if n < 4:
+        return float("nan")
+    if mode == "auto":
+        mode = "exact" if n - 1 <= n_perm else "sampled"
+
+    if mode == "exact":
+        r = shift_correlations(x, y, np.arange(n))
+        r_obs, r_k = r[0], r[1:]
+        if np.isnan(r_obs):
+            return float("nan")
+        return (np.count_nonzero(np.abs(r_k) >= abs(r_obs)) + 1) / n
+
+    rng = np.random.default_rng(seed)
+    shifts = rng.integers(1, n, size=n_perm)  # exclude 0 shift
+    r = shift_correlations(x, y, np.concatenate([[0], shifts]))
+    r_obs, r_k = r[0], r[1:]
+    if np.isnan(r_obs):
+        return float("nan")
+    cnt = int(np.count_nonzero(np.abs(r_k) >= abs(r_obs)))
+    return (cnt + 1) / (n_perm + 1)  # add-one smoothing
+
+
+def circular_shift_pvalues(
+    X: np.ndarray,
+    Y: np.ndarray,
+    n_perm: int = 999,
+    seed: int = 42,
+    mode: str = SHIFT_MODE_DEFAULT,
+) -> np.ndarray:
+    """
+    circular_shift_pvalue для пачки пар рядов одной длины: X, Y — (k, n), результат — (k,).
+    Сдвиги (все n-1 или n_perm случайных с тем же seed) общие для всех пар, поэтому
+    значения совпадают с поштучными вызовами circular_shift_pvalue(X[i], Y[i], ...).
+    """
+    if mode not in SHIFT_MODES:
+        raise ValueError(f"Unknown shift mode '{mode}' (expected {SHIFT_MODES})")
+    X = np.atleast_2d(np.asarray(X, float))
+    Y = np.atleast_2d(np.asarray(Y, float))
+    k, n = X.shape
+    if n < 4 or k == 0:
+        return np.full(k, np.nan)
+    if mode == "auto":
+        mode = "exact" if n - 1 <= n_perm else "sampled"
+
+    if mode == "exact":
+        shifts = np.arange(n)
+    else:
+        rng = np.random.default_rng(seed)
+        shifts = np.concatenate([[0], rng.integers(1, n, size=n_perm)])
+
+    if get_backend() == "numba":
+        s64 = np.ascontiguousarray(shifts, dtype=np.int64)
+        R = np.stack([_shift_correlations_nb(np.ascontiguousarray(X[i]), np.ascontiguousarray(Y[i]), s64) for i in range(k)])
+    else:
+        Xc = X - X.mean(axis=1, keepdims=True)
+        Yc = Y - Y.mean(axis=1, keepdims=True)
+        den = np.sqrt(np.einsum("kn,kn->k", Xc, Xc) * np.einsum("kn,kn->k", Yc, Yc))
+        den[den == 0] = np.nan  # постоянный ряд -> NaN, как в _shift_correlations_np
+        idx = (np.arange(n)[None, :] - shifts[:, None]) % n
+        R = np.empty((k, len(shifts)))
+        # пары режутся на блоки, чтобы (пары x сдвиги x n) помещалось в память
+        block = max(1, 20_000_000 // (len(shifts) * n))
+        for i0 in range(0, k, block):
+            i1 = min(k, i0 + block)
+            R[i0:i1] = np.einsum("ksn,kn->ks", Yc[i0:i1][:, idx], Xc[i0:i1]) / den[i0:i1, None]
+
+    r_obs, r_k = np.abs(R[:, :1]), np.abs(R[:, 1:])
+    cnt = np.count_nonzero(r_k >= r_obs, axis=1)
+    p = (cnt + 1) / (n if mode == "exact" else n_perm + 1)
+    p[np.isnan(r_obs[:, 0])] = np.nan
+    return p
+
+
+ESS_METHODS = ("bretherton", "pyper_peterman")
+
+
+def autocorrelations(X: np.ndarray, max_lag: int) -> np.ndarray:
+    """
+    Выборочная автокорреляция строк X (k, n) на лагах 1..max_lag: (k, max_lag).
+    Оценка со смещением (знаменатель — полная сумма квадратов), как у Pyper & Peterman (1998);
+    лаг >= n или постоянный ряд -> NaN.
+    """
+    X = np.atleast_2d(np.asarray(X, float))
+    k, n = X.shape
+    out = np.full((k, max(0, int(max_lag))), np.nan)
+    Xc = X - X.mean(axis=1, keepdims=True)
+    den = np.einsum("kn,kn->k", Xc, Xc)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for j in range(1, min(int(max_lag), n - 1) + 1):
+            out[:, j - 1] = np.einsum("kn,kn->k", Xc[:, :-j], Xc[:, j:]) / den
+    return out
+
+
+def effective_n(X: np.ndarray, Y: np.ndarray, method: str = "bretherton") -> np.ndarray:
+    """
+    Эффективный объём выборки для корреляции пар автокоррелированных рядов X, Y — (k, n):
+      "bretherton"     — Bretherton et al. (1999), лаг 1: N* = N (1 - a1 b1) / (1 + a1 b1);
+      "pyper_peterman" — Pyper & Peterman (1998), лаги 1..N/5 (поправка типа Dutilleul):
+                         1/N* = 1/N + (2/N) * sum_j (N - j)/N * a_j b_j.
+    N* ограничен [3, N] (не больше N — отрицательная автокорреляция не "добавляет" лет;
+    не меньше 3 — у t-теста остаётся 1 степень свободы). NaN, если автокорреляция не определена.
+    """
+    X = np.atleast_2d(np.asarray(X, float))
+    Y = np.atleast_2d(np.asarray(Y, float))
+    k, n = X.shape
+    if n < 3 or k == 0:
+        if method not in ESS_METHODS:
+            raise ValueError(f"Unknown ESS method '{method}' (expected {ESS_METHODS})")
+        return np.full(k, np.nan)
+    J = 1 if method == "bretherton" else max(1, n // 5)
+    return effective_n_from_acf(autocorrelations(X, J), autocorrelations(Y, J), n, method)
+
+
+def effective_n_from_acf(ax: np.ndarray, ay: np.ndarray, n: int, method: str = "bretherton") -> np.ndarray:
+    """
+    effective_n по уже посчитанным автокорреляциям (autocorrelations, (k, >= 1) и (k, >= n // 5)):
+    одна пачка ACF обслуживает оба метода.
+    """
+    if method not in ESS_METHODS:
+        raise ValueError(f"Unknown ESS method '{method}' (expected {ESS_METHODS})")
+    if method == "bretherton":
+        ab = ax[:, 0] * ay[:, 0]
+        n_eff = n * (1.0 - ab) / (1.0 + ab)
+    else:
+        J = max(1, n // 5)
+        j = np.arange(1, J + 1)
+        inv = 1.0 / n + (2.0 / n) * (((n - j) / n) * ax[:, :J] * ay[:, :J]).sum(axis=1)
+        with np.errstate(divide="ignore"):
+            n_eff = np.where(inv > 0, 1.0 / inv, n)
+        n_eff = np.where(np.isnan(inv), np.nan, n_eff)
+    return np.clip(n_eff, 3.0, n)
+
+
+def effective_n_pvalues(r: np.ndarray, n_eff: np.ndarray) -> np.ndarray:
+    """Двусторонний p для Pearson r с n_eff вместо n: t = r sqrt((n_eff - 2) / (1 - r^2)), df = n_eff - 2."""
+    r = np.asarray(r, float)
+    n_eff = np.asarray(n_eff, float)
+    p = np.full(r.shape, np.nan)
+    ok = ~np.isnan(r) & ~np.isnan(n_eff) & (n_eff > 2)
+    dof = n_eff[ok] - 2.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = r[ok] * np.sqrt(dof / ((1.0 + r[ok]) * (1.0 - r[ok])))
+    p[ok] = 2 * stats.t.sf(np.abs(t), dof)
+    return p
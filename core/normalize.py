@@ -1,6 +1,8 @@
 from pathlib import Path
 import pandas as pd
 
+from core.registry_store import ELLENBERG_XLSX, registry_table
+
 # =====================
 # PATHS
 # =====================
@@ -11,9 +13,6 @@ OUT_OBS = PROJECT_ROOT / "data" / "processed" / "observations.csv"
 OUT_META = PROJECT_ROOT / "data" / "processed" / "descriptions.csv"
 OUT_UNMATCHED = PROJECT_ROOT / "data" / "processed" / "unmatched_species.csv"
 ALIASES_FILE = PROJECT_ROOT / "data" / "registry" / "species_aliases.csv"
-ELLENBERG_XLSX = PROJECT_ROOT / "data" / "external" / "Indicator_values_Tichy_et_al.xlsx"
-
-ELLENBERG_SHEET = "Tab-IVs-Tichy-et-al2022"
 
 NBSP = "\u00A0"
 
@@ -71,14 +70,8 @@ def load_ellenberg_species() -> set[str]:
         print("⚠️ Ellenberg xlsx not found — skipping check")
         return set()
 
-    df = pd.read_excel(
-        ELLENBERG_XLSX,
-        sheet_name=ELLENBERG_SHEET,
-        usecols=[1],   # колонка B
-    )
-
-    df.columns = ["species"]
-    df["species"] = normalize_text(df["species"])
+    # лист Tab-IVs-Tichy-et-al2022, колонка B — уже разобран в скомпилированном реестре
+    df = registry_table("ellenberg_species")
 
     species = df["species"].dropna().unique().tolist()
     print(f"ℹ️ Loaded {len(species)} Ellenberg species")
@@ -0,0 +1,293 @@
+# core/null_models.py
+"""
+Нуль-модели для метрик сообщества (CWM, sigma, FDis): отличается ли сдвиг
+от случайной перестановки состава?
+
+Данные — матрица описание x вид (веса, CSR: indptr / indices / data) и вектор
+значений шкалы по видам. Нуль-модели:
+  trait_shuffle     — значения шкалы переставляются между видами выборки
+                      (веса и состав описаний не меняются);
+  abundance_shuffle — веса переставляются между видами внутри каждого описания
+                      (состав и значения шкалы не меняются).
+
+Все итерации блока считаются сразу: массивы (итерации x ненулевые элементы),
+суммы по описаниям — np.add.reduceat по строкам CSR. По итерациям копятся
+только суммы (среднее/sd нуля) и счётчики для p-значений, сами реплики не хранятся.
+
+SES = (obs - mean(null)) / sd(null); по описаниям и по группам (год: среднее
+метрики по описаниям года, в каждой итерации — то же среднее по нулевым значениям).
+
+Воспроизводимость: итерации режутся на блоки фиксированного размера, у каждого
+блока свой SeedSequence.spawn(seed) -> результат не зависит от числа процессов.
+"""
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+NULL_METRICS = ("cwm", "sigma", "fdis")
+DEFAULT_N_ITER = 999
+DEFAULT_SEED = 42
+# сколько элементов (итерации x ненулевые) держать в памяти за раз
+_MAX_BLOCK_CELLS = 5_000_000
+
+
+@dataclass
+class CommunityMatrix:
+    """Описание x вид в CSR-виде + значение шкалы для каждого вида."""
+    desc_ids: pd.Index
+    species: pd.Index
+    indptr: np.ndarray   # (n_desc + 1,)
+    indices: np.ndarray  # (nnz,) номер вида
+    data: np.ndarray     # (nnz,) вес
+    traits: np.ndarray   # (n_species,)
+
+    @property
+    def n_desc(self) -> int:
+        return len(self.desc_ids)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.data)
+
+    def row_codes(self) -> np.ndarray:
+        return np.repeat(np.arange(self.n_desc), np.diff(self.indptr))
+
+
+def community_matrix(
+    df: pd.DataFrame,
+    trait_col: str = "M",
+    weight_col: str = "w",
+    id_col: str = "description_id",
+    species_col: str = "species",
+) -> CommunityMatrix:
+    """
+    Строки видов -> CommunityMatrix. Как в экоспектре: строки с NaN шкалы/веса и w <= 0
+    не участвуют. Повторы вида в описании суммируются; значение шкалы вида — первое встреченное.
+    """
+    for c in (id_col, species_col, weight_col, trait_col):
+        if c not in df.columns:
+            raise KeyError(f"community_matrix: column '{c}' not found")
+
+    x = pd.to_numeric(df[trait_col], errors="coerce").to_numpy(dtype=float)
+    w = pd.to_numeric(df[weight_col], errors="coerce").to_numpy(dtype=float)
+    valid = ~np.isnan(x) & ~np.isnan(w) & (w > 0)
+
+    rows, desc_ids = pd.factorize(df[id_col].to_numpy()[valid])
+    cols, species = pd.factorize(df[species_col].to_numpy()[valid])
+    x, w = x[valid], w[valid]
+
+    n_sp = len(species)
+    traits = np.full(n_sp, np.nan)
+    traits[cols[::-1]] = x[::-1]  # при повторной записи побеждает первое вхождение
+
+    key = rows.astype(np.int64) * n_sp + cols
+    uniq, inv = np.unique(key, return_inverse=True)
+    data = np.bincount(inv, weights=w, minlength=len(uniq))
+    r = uniq // max(n_sp, 1)
+
+    return CommunityMatrix(
+        desc_ids=pd.Index(desc_ids),
+        species=pd.Index(species),
+        indptr=np.searchsorted(r, np.arange(len(desc_ids) + 1)).astype(np.int64),
+        indices=(uniq % max(n_sp, 1)).astype(np.int64),
+        data=data,
+        traits=traits,
+    )
+
+
+# ---------------------------------------------------------------------------
+# нуль-модели: (cm, n итераций, rng) -> (W, X), оба (n, nnz)
+# ---------------------------------------------------------------------------
+
+def _trait_shuffle(cm: CommunityMatrix, n: int, rng: np.random.Generator):
+    T = rng.permuted(np.tile(cm.traits, (n, 1)), axis=1)
+    return np.broadcast_to(cm.data, (n, cm.nnz)), T[:, cm.indices]
+
+
+def _abundance_shuffle(cm: CommunityMatrix, n: int, rng: np.random.Generator):
+    # случайный ключ внутри строки: сортировка по (строка + U[0,1)) = перестановка внутри описания
+    keys = rng.random((n, cm.nnz)) + cm.row_codes()[None, :]
+    order = np.argsort(keys, axis=1)
+    return cm.data[order], np.broadcast_to(cm.traits[cm.indices], (n, cm.nnz))
+
+
+NULL_MODELS: dict[str, Callable] = {
+    "trait_shuffle": _trait_shuffle,
+    "abundance_shuffle": _abundance_shuffle,
+}
+
+
+def register_null_model(name: str, fn: Callable) -> None:
+    """Добавить нуль-модель: fn(cm, n, rng) -> (W, X), массивы (n, nnz) в раскладке CSR."""
+    NULL_MODELS[name] = fn
+
+
+def segment_metrics(W: np.ndarray, X: np.ndarray, indptr: np.ndarray, metrics: Sequence[str] = NULL_METRICS) -> dict[str, np.ndarray]:
+    """
+    Метрики по строкам CSR для каждой итерации: W, X — (n, nnz), результат — (n, n_desc).
+    Формулы как в ядре экоспектра (sigma — взвешенное sd без поправки, fdis — среднее |x - cwm|).
+    """
+    starts = indptr[:-1]
+    sizes = np.diff(indptr)
+    sw = np.add.reduceat(W, starts, axis=1)
+    cwm = np.add.reduceat(W * X, starts, axis=1) / sw
+    out = {"cwm": cwm}
+    if "sigma" in metrics or "fdis" in metrics:
+        dev = X - np.repeat(cwm, sizes, axis=1)
+        if "sigma" in metrics:
+            out["sigma"] = np.sqrt(np.add.reduceat(W * dev * dev, starts, axis=1) / sw)
+        if "fdis" in metrics:
+            out["fdis"] = np.add.reduceat(W * np.abs(dev), starts, axis=1) / sw
+    return {m: out[m] for m in metrics}
+
+
+# ---------------------------------------------------------------------------
+# накопление по блокам итераций
+# ---------------------------------------------------------------------------
+
+def _empty_acc(n: int) -> dict[str, np.ndarray]:
+    return {k: np.zeros(n) for k in ("s1", "s2", "n", "le", "ge")}
+
+
+def _accumulate(acc: dict[str, np.ndarray], null: np.ndarray, obs: np.ndarray) -> None:
+    ok = ~np.isnan(null)
+    z = np.where(ok, null, 0.0)
+    acc["s1"] += z.sum(axis=0)
+    acc["s2"] += (z * z).sum(axis=0)
+    acc["n"] += ok.sum(axis=0)
+    acc["le"] += (ok & (null <= obs[None, :])).sum(axis=0)
+    acc["ge"] += (ok & (null >= obs[None, :])).sum(axis=0)
+
+
+# состояние процесса-воркера (initializer), чтобы не пересылать матрицу с каждым блоком
+_WORKER: dict = {}
+
+
+def _init_worker(cm, null, metrics, group_codes, n_groups, obs) -> None:
+    _WORKER.update(cm=cm, null=null, metrics=metrics, group_codes=group_codes, n_groups=n_groups, obs=obs)
+
+
+def _group_means(values: np.ndarray, group_codes: np.ndarray, n_groups: int) -> np.ndarray:
+    """(n, n_desc) -> (n, n_groups): среднее по описаниям группы (NaN не участвуют)."""
+    ok = ~np.isnan(values)
+    G = np.zeros((values.shape[1], n_groups))
+    has = group_codes >= 0  # описания без группы (NaN года) не участвуют
+    G[np.flatnonzero(has), group_codes[has]] = 1.0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (np.where(ok, values, 0.0) @ G) / (ok.astype(float) @ G)
+
+
+def _run_block(args) -> dict:
+    n, seed_seq = args
+    st = _WORKER
+    cm = st["cm"]
+    rng = np.random.default_rng(seed_seq)
+    W, X = NULL_MODELS[st["null"]](cm, n, rng)
+    null = segment_metrics(W, X, cm.indptr, st["metrics"])
+
+    out = {}
+    for m, vals in null.items():
+        acc_d = _empty_acc(cm.n_desc)
+        _accumulate(acc_d, vals, st["obs"][m]["desc"])
+        out[(m, "desc")] = acc_d
+        if st["group_codes"] is not None:
+            acc_g = _empty_acc(st["n_groups"])
+            _accumulate(acc_g, _group_means(vals, st["group_codes"], st["n_groups"]), st["obs"][m]["group"])
+            out[(m, "group")] = acc_g
+    return out
+
+
+def _summary(obs: np.ndarray, acc: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    n = acc["n"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = acc["s1"] / n
+        sd = np.sqrt(np.maximum(acc["s2"] / n - mean * mean, 0.0) * n / (n - 1))
+        ses = np.where(sd > 0, (obs - mean) / sd, np.nan)
+        p_low = (acc["le"] + 1) / (n + 1)
+        p_high = (acc["ge"] + 1) / (n + 1)
+    return {"obs": obs, "null_mean": mean, "null_sd": sd, "ses": ses, "p_low": p_low, "p_high": p_high}
+
+
+def null_model_ses(
+    df: pd.DataFrame,
+    trait_col: str = "M",
+    weight_col: str = "w",
+    null: str = "trait_shuffle",
+    n_iter: int = DEFAULT_N_ITER,
+    seed: int = DEFAULT_SEED,
+    workers: int = 1,
+    metrics: Sequence[str] = NULL_METRICS,
+    group_col: Optional[str] = "year",
+    id_col: str = "description_id",
+    species_col: str = "species",
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    SES метрик сообщества относительно нуль-модели null (см. NULL_MODELS).
+
+    Возвращает (по описаниям, по группам):
+      description_id | metric | obs | null_mean | null_sd | ses | p_low | p_high
+      {group_col}    | metric | obs | null_mean | null_sd | ses | p_low | p_high
+    p_low = P(null <= obs), p_high = P(null >= obs), с поправкой (k + 1) / (n + 1).
+    Вторая таблица пустая, если group_col = None.
+    """
+    if null not in NULL_MODELS:
+        raise KeyError(f"Unknown null model '{null}' (expected {sorted(NULL_MODELS)})")
+    metrics = list(metrics)
+    unknown = [m for m in metrics if m not in NULL_METRICS]
+    if unknown:
+        raise KeyError(f"Unknown null-model metrics: {unknown} (expected {list(NULL_METRICS)})")
+
+    cm = community_matrix(df, trait_col, weight_col, id_col, species_col)
+    if cm.n_desc == 0:
+        cols = ["metric", "obs", "null_mean", "null_sd", "ses", "p_low", "p_high"]
+        return pd.DataFrame(columns=[id_col, *cols]), pd.DataFrame(columns=[group_col or "group", *cols])
+
+    group_codes, groups, n_groups = None, None, 0
+    if group_col:
+        per_desc = df.drop_duplicates(id_col).set_index(id_col)[group_col]
+        group_codes, groups = pd.factorize(per_desc.reindex(cm.desc_ids).to_numpy(), sort=True)
+        n_groups = len(groups)
+
+    # наблюдаемые значения — той же формулой, что и нуль
+    obs_desc = segment_metrics(cm.data[None, :], cm.traits[cm.indices][None, :], cm.indptr, metrics)
+    obs = {}
+    for m in metrics:
+        obs[m] = {"desc": obs_desc[m][0]}
+        if group_codes is not None:
+            obs[m]["group"] = _group_means(obs_desc[m], group_codes, n_groups)[0]
+
+    block = max(1, _MAX_BLOCK_CELLS // max(cm.nnz, 1))
+    sizes = [min(block, n_iter - b0) for b0 in range(0, n_iter, block)]
+    tasks = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+    init_args = (cm, null, metrics, group_codes, n_groups, obs)
+
+    if workers <= 1 or len(tasks) == 1:
+        _init_worker(*init_args)
+        results = [_run_block(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as ex:
+            results = list(ex.map(_run_block, tasks))
+
+    # суммы в порядке блоков -> одинаково при любом числе процессов
+    totals = results[0]
+    for r in results[1:]:
+        for key, acc in r.items():
+            for k in acc:
+                totals[key][k] += acc[k]
+
+    desc_parts, group_parts = [], []
+    for m in metrics:
+        part = pd.DataFrame({id_col: cm.desc_ids, "metric": m, **_summary(obs[m]["desc"], totals[(m, "desc")])})
+        desc_parts.append(part)
+        if group_codes is not None:
+            part = pd.DataFrame({group_col: groups, "metric": m, **_summary(obs[m]["group"], totals[(m, "group")])})
+            group_parts.append(part)
+
+    per_desc_out = pd.concat(desc_parts, ignore_index=True)
+    per_group_out = pd.concat(group_parts, ignore_index=True) if group_parts else pd.DataFrame()
+    return per_desc_out, per_group_out
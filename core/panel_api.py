@@ -2,12 +2,16 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Iterable
+from typing import Any, Iterable
 
 import numpy as np
 import pandas as pd
 import statsmodels.formula.api as smf
 
+from core.cache import memoize
+from core.climate_cube import METEO_PERIODS_CSV, climate_signal
+from core.trace import attach_trace, trace_options, trace_stage, traced, tracing
+
 
 @dataclass(frozen=True)
 class PanelSpec:
@@ -25,25 +29,21 @@ def _panel_path(scale: str, eco_metric: str) -> str:
 
 
 def _build_climate_signal(
-    meteo: pd.DataFrame,
     climate_var: str,
     period: str,
     lag: int,
     window: int,
 ) -> pd.DataFrame:
-    clim = (
-        meteo.loc[meteo["period"] == period, ["year", climate_var]]
-        .rename(columns={climate_var: "clim"})
-        .sort_values("year")
-        .reset_index(drop=True)
-    )
-
-    # window затем lag (как мы делали)
-    clim["clim"] = clim["clim"].rolling(window).mean()
-    clim["clim"] = clim["clim"].shift(lag)
-    return clim
+    # window затем lag, в календарных годах — срез куба core.climate_cube
+    clim = climate_signal(climate_var, period, window=window, lag=lag, csv_path=METEO_PERIODS_CSV)
+    return clim[["year", "clim_signal"]].rename(columns={"clim_signal": "clim"})
 
 
+@traced("fit_panel_ols_cluster")
+@memoize(
+    "panel_ols_cluster",
+    input_paths=lambda spec, include_controls=True: [_panel_path(spec.scale, spec.eco_metric), METEO_PERIODS_CSV],
+)
 def fit_panel_ols_cluster(
     spec: PanelSpec,
     include_controls: bool = True,
@@ -51,11 +51,10 @@ def fit_panel_ols_cluster(
     """
     Возвращает 1 строку с slopes + deltas + p-values + r2.
     """
-    panel = pd.read_csv(_panel_path(spec.scale, spec.eco_metric))
-    meteo = pd.read_csv("data/processed/meteo_periods_1991_2020.csv")
-
+    with trace_stage("read_panel") as st:
+        panel = pd.read_csv(_panel_path(spec.scale, spec.eco_metric))
+        st.rows_out = len(panel)
     clim = _build_climate_signal(
-        meteo=meteo,
         climate_var=spec.climate_var,
         period=spec.period,
         lag=spec.lag,
@@ -78,10 +77,11 @@ def fit_panel_ols_cluster(
     else:
         formula = "eco ~ clim_c * C(afforestation)"
 
-    model = smf.ols(formula, data=df).fit(
-        cov_type="cluster",
-        cov_kwds={"groups": df["site_id"]},
-    )
+    with trace_stage("ols", df):
+        model = smf.ols(formula, data=df).fit(
+            cov_type="cluster",
+            cov_kwds={"groups": df["site_id"]},
+        )
 
     params = model.params
     pvals = model.pvalues
@@ -124,6 +124,28 @@ def run_panel_batch(
     lags: Iterable[int],
     windows: Iterable[int],
     include_controls: bool = True,
+    trace: Any = None,
+) -> pd.DataFrame:
+    """
+    OLS на каждую комбинацию climate_var x period x window x lag (ошибка — строка с error).
+    trace: как ScenarioSpec.trace (core.trace) -> df.attrs["trace"] по всему прогону.
+    """
+    opts = trace_options(trace)
+    if opts is None:
+        return _run_panel_batch(scale, eco_metric, climate_vars, periods, lags, windows, include_controls)
+    with tracing(f"run_panel_batch:{scale}_{eco_metric}", **opts) as tr:
+        out = _run_panel_batch(scale, eco_metric, climate_vars, periods, lags, windows, include_controls)
+    return attach_trace(out, tr)
+
+
+def _run_panel_batch(
+    scale: str,
+    eco_metric: str,
+    climate_vars: Iterable[str],
+    periods: Iterable[str],
+    lags: Iterable[int],
+    windows: Iterable[int],
+    include_controls: bool,
 ) -> pd.DataFrame:
     rows = []
     for cv in climate_vars:
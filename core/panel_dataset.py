@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+import json
 from dataclasses import dataclass, field
 
-from core.analysis_engine import load_processed, apply_filters
-from core.ecospectrum import compute_ecospectrum_by_description
-from core.traits import attach_trait
-from core.abundance import attach_weights  # если у тебя так называется; если иначе — поправим импорт
+from core.analysis_engine import load_processed, apply_filters, OBS_FILE, META_FILE, REGISTRY_PROFILES
+from core.cache import file_signature, make_cache_key, memoize
+from core.eco_store import STORE_VERSION, ecospectrum_incremental
+from core.traits import attach_traits, scales_with, ELLENBERG_XLSX
+from core.abundance import attach_weights, ABUNDANCE_XLSX  # если у тебя так называется; если иначе — поправим импорт
 
 # core/panel_model.py
 from pathlib import Path
@@ -35,6 +37,41 @@ class PanelEcoSpec:
     out_path: str | None = None
 
 
+# поменять при любом изменении расчёта или набора колонок -> старые записи кеша не используются
+PANEL_ECO_VERSION = "3"
+PANEL_ECO_INPUT_PATHS = [OBS_FILE, META_FILE, REGISTRY_PROFILES, ELLENBERG_XLSX, ABUNDANCE_XLSX]
+
+
+def panel_eco_signature() -> str:
+    """Подпись входных файлов + версий расчёта: поменялась — сохранённый panel_eco_*.csv устарел."""
+    return make_cache_key(
+        "panel_eco_dataset",
+        {"version": PANEL_ECO_VERSION, "store_version": STORE_VERSION},
+        data_sig=file_signature(PANEL_ECO_INPUT_PATHS),
+    )
+
+
+def _signature_path(csv_path: Path) -> Path:
+    return csv_path.with_name(csv_path.name + ".sig.json")
+
+
+def panel_eco_is_current(csv_path: str | Path) -> bool:
+    """CSV есть и собран из текущих входных данных текущей версией (см. save_panel_eco_dataset)."""
+    csv_path = Path(csv_path)
+    sig_path = _signature_path(csv_path)
+    if not (csv_path.exists() and sig_path.exists()):
+        return False
+    try:
+        return json.loads(sig_path.read_text(encoding="utf-8")).get("signature") == panel_eco_signature()
+    except (OSError, ValueError):
+        return False
+
+
+@memoize(
+    "panel_eco_dataset",
+    input_paths=PANEL_ECO_INPUT_PATHS,
+    version=PANEL_ECO_VERSION,
+)
 def build_panel_eco_dataset(spec: PanelEcoSpec) -> pd.DataFrame:
     """
     Build ecological panel dataset: site_id x year -> eco.
@@ -48,23 +85,28 @@ def build_panel_eco_dataset(spec: PanelEcoSpec) -> pd.DataFrame:
 
     # 3) Attach weights + traits for Ellenberg
     df = attach_weights(df)
-    df = attach_trait(df, scale=spec.trait_scale)   # 'N', 'R', 'T', ...
-
-    print("Columns after attach_trait:",
-          [c for c in df.columns if c in ["N", "R", "T", "L", "M"] or "ell" in c.lower() or "trait" in c.lower()])
-    print("Has w:", "w" in df.columns, "Has N:", "N" in df.columns)
+    # все шкалы сразу: панели по другим шкалам потом берут экоспектр из кеша
+    df = attach_traits(df, scales=scales_with(spec.trait_scale))   # 'N', 'R', 'T', ...
+    if spec.trait_scale not in df.columns:
+        raise KeyError(f"Ellenberg scale '{spec.trait_scale}' not found in trait table.")
 
     # 4) Compute ecospectrum per description (description_id granularity)
     # IMPORTANT: this function should return df with:
     # - description_id
     # - year (or can be merged from descriptions)
     # - metric columns (cwm/sigma/...)
-    eco_desc = compute_ecospectrum_by_description(
+    # через хранилище по описаниям: пересчёт только изменившихся описаний
+    eco_all = ecospectrum_incremental(
         df,
-        trait_col=spec.trait_scale,  # 'N' / 'R' / ...
+        trait_cols=tuple(c for c in scales_with(spec.trait_scale) if c in df.columns),
         weight_col="w",  # у тебя attach_weights как раз делает 'w'
         id_col="description_id",
     )
+    eco_desc = (
+        eco_all[eco_all["scale"] == spec.trait_scale]   # 'N' / 'R' / ...
+        .drop(columns="scale")
+        .reset_index(drop=True)
+    )
 
     # 5) Pull metadata needed for panel aggregation
     # We assume df contains description_id rows (observations), so we take unique description-level info.
@@ -82,9 +124,6 @@ def build_panel_eco_dataset(spec: PanelEcoSpec) -> pd.DataFrame:
     if "river" in df.columns:
         meta_cols.append("river")
 
-    print("NA in afforestation before aggregation:",
-          df["afforestation"].isna().sum())
-
     agg_map = {
         "year": "first",
         "profile_id": "first",
@@ -149,8 +188,6 @@ def build_panel_eco_dataset(spec: PanelEcoSpec) -> pd.DataFrame:
     if len(bad) > 0:
         raise ValueError(f"Unexpected afforestation codes: {bad}")
 
-    print("Ecospectrum columns:", list(eco_desc.columns))
-
     return panel
 
 
@@ -163,4 +200,8 @@ def save_panel_eco_dataset(panel: pd.DataFrame, spec: PanelEcoSpec) -> Path:
         out = PROCESSED_DIR / f"panel_eco_{spec.trait_scale}_{spec.eco_metric}.csv"
 
     panel.to_csv(out, index=False)
+    # рядом — подпись входов/версий, по ней _ensure_panel_eco решает, пересобирать ли CSV
+    _signature_path(out).write_text(
+        json.dumps({"signature": panel_eco_signature(), "version": PANEL_ECO_VERSION}), encoding="utf-8"
+    )
     return out
\ No newline at end of file
@@ -9,16 +9,20 @@ import numpy as np
 import pandas as pd
 import statsmodels.formula.api as smf
 
-from core.panel_dataset import PanelEcoSpec, build_panel_eco_dataset, save_panel_eco_dataset
+from core.climate_cube import climate_signal
+from core.panel_dataset import PanelEcoSpec, build_panel_eco_dataset, panel_eco_is_current, save_panel_eco_dataset
+from core.trace import attach_trace, trace_options, trace_stage, traced, tracing
 
 
+@traced("ensure_panel_eco")
 def _ensure_panel_eco(scale: str, metric: str) -> str:
     """
-    Ensures that eco panel (site_id x year -> eco + meta) exists on disk.
-    Builds it once and caches in data/processed/.
+    Ensures that eco panel (site_id x year -> eco + meta) exists on disk and is current.
+    Builds it once and caches in data/processed/; rebuilt when its inputs or
+    PANEL_ECO_VERSION change (signature next to the CSV, see panel_eco_is_current).
     """
     out_path = Path(f"data/processed/panel_eco_{scale}_{metric}.csv")
-    if out_path.exists():
+    if panel_eco_is_current(out_path):
         return str(out_path)
 
     spec = PanelEcoSpec(
@@ -80,7 +84,17 @@ def run_panel_model(spec: dict[str, Any]) -> pd.DataFrame:
       - lag: int
       - window: int
       - filters: dict (optional, see _apply_panel_filters)
+      - trace: optional, as ScenarioSpec.trace (core.trace) -> out.attrs["trace"]
     """
+    opts = trace_options(spec.get("trace"))
+    if opts is None:
+        return _run_panel_model(spec)
+    with tracing(f"run_panel_model:{spec['scale']}_{spec['metric']}", **opts) as tr:
+        out = _run_panel_model(spec)
+    return attach_trace(out, tr)
+
+
+def _run_panel_model(spec: dict[str, Any]) -> pd.DataFrame:
     scale = spec["scale"]
     metric = spec["metric"]
     climate_var = spec["climate_var"]
@@ -89,25 +103,20 @@ def run_panel_model(spec: dict[str, Any]) -> pd.DataFrame:
     window = int(spec.get("window", 1))
 
     panel_path = _ensure_panel_eco(scale, metric)
-    panel = pd.read_csv(panel_path)
+    with trace_stage("read_panel") as st:
+        panel = pd.read_csv(panel_path)
+        st.rows_out = len(panel)
 
-    meteo = pd.read_csv("data/processed/meteo_periods_1991_2020.csv")
-
-    # --- build climate signal (period -> rolling(window) -> shift(lag)) ---
-    clim = (
-        meteo.loc[meteo["period"] == period, ["year", climate_var]]
-        .rename(columns={climate_var: "clim"})
-        .sort_values("year")
-        .reset_index(drop=True)
-    )
+    # --- climate signal: period -> window -> lag in calendar years (core.climate_cube) ---
+    clim = climate_signal(climate_var, period, window=window, lag=lag)
+    clim = clim[["year", "clim_signal"]].rename(columns={"clim_signal": "clim"})
 
-    clim["clim"] = clim["clim"].rolling(window).mean()
-    clim["clim"] = clim["clim"].shift(lag)
+    with trace_stage("merge", panel) as st:
+        df = panel.merge(clim, on="year", how="left")
 
-    df = panel.merge(clim, on="year", how="left")
-
-    # --- apply UI filters ---
-    df = _apply_panel_filters(df, spec.get("filters", {}) or {})
+        # --- apply UI filters ---
+        df = _apply_panel_filters(df, spec.get("filters", {}) or {})
+        st.rows_out = len(df)
 
     # --- clean & center ---
     df = df.dropna(
@@ -146,10 +155,11 @@ def run_panel_model(spec: dict[str, Any]) -> pd.DataFrame:
 
     # --- model ---
     formula = "eco ~ clim_c * C(afforestation) + C(geomorph_level) + C(impact_type)"
-    model = smf.ols(formula, data=df).fit(
-        cov_type="cluster",
-        cov_kwds={"groups": df["site_id"]},
-    )
+    with trace_stage("ols", df):
+        model = smf.ols(formula, data=df).fit(
+            cov_type="cluster",
+            cov_kwds={"groups": df["site_id"]},
+        )
 
     params = model.params
     pvals = model.pvalues
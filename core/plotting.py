@@ -1,45 +1,153 @@
+import os
+import threading
 from pathlib import Path
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+import numpy as np
+
+from core.trace import traced
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 OUT_DIR = PROJECT_ROOT / "data" / "processed"
 
+# Каждый вызов строит свой Figure (без pyplot и его глобального "текущего рисунка"):
+# стадии сценариев с графиками выполняются параллельно в потоках (scenario_dag, async_runner).
+
+
+def _save(fig, out_path):
+    # через временный файл + os.replace: параллельные сценарии (run_scenarios_async, LatestRunner —
+    # отменённый запуск досчитывает стадию в фоне) могут писать один и тот же out_name
+    tmp = out_path.with_name(f"{out_path.stem}.{os.getpid()}.{threading.get_ident()}.tmp{out_path.suffix}")
+    try:
+        fig.savefig(tmp, dpi=150, bbox_inches="tight")
+        os.replace(tmp, out_path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return out_path
+
+
+@traced("plot")
 def plot_timeseries(df, spec):
     """
     spec:
-      - kind: "line" (default) or "scatter"
-      - x, y: column names
+      - kind: "line" (default), "scatter" or "spectrum"
+      - x, y: column names; y may be a list of columns -> one line per column + legend
+        (bands per column: "{y}_lo" / "{y}_hi" when present)
+      - ylabel: optional axis label (default: y)
+        (spectrum: df = pooled spectra, x = group column (year), bin columns "1".."12";
+         y = optional label of the trait axis, e.g. "M")
+      - y_lo, y_hi: optional band columns (e.g. bootstrap CI): line -> fill_between,
+        scatter -> vertical error bars
       - title: optional
       - out_name: optional (without extension)
     """
     OUT_DIR.mkdir(parents=True, exist_ok=True)
 
     kind = spec.get("kind", "line")
+    if kind == "spectrum":
+        return _plot_spectrum(df, spec)
+
     xcol = spec["x"]
     ycol = spec["y"]
+    if isinstance(ycol, (list, tuple)):
+        return _plot_multi(df, spec, xcol, list(ycol), kind)
 
     x = df[xcol]
     y = df[ycol]
 
-    plt.figure()
+    lo_col, hi_col = spec.get("y_lo"), spec.get("y_hi")
+    has_band = bool(lo_col and hi_col and lo_col in df.columns and hi_col in df.columns)
+
+    fig = Figure()
+    ax = fig.subplots()
     if kind == "scatter":
-        plt.scatter(x, y)
+        if has_band:
+            yerr = [(y - df[lo_col]).clip(lower=0), (df[hi_col] - y).clip(lower=0)]
+            ax.errorbar(x, y, yerr=yerr, fmt="none", ecolor="gray", alpha=0.6, capsize=2)
+        ax.scatter(x, y)
     else:
-        plt.plot(x, y, marker="o")
+        if has_band:
+            ax.fill_between(x, df[lo_col], df[hi_col], alpha=0.25, linewidth=0)
+        ax.plot(x, y, marker="o")
 
-    plt.xlabel(xcol)
-    plt.ylabel(ycol)
-    plt.title(spec.get("title", ""))
-    plt.grid(True)
+    ax.set_xlabel(xcol)
+    ax.set_ylabel(spec.get("ylabel", ycol))
+    ax.set_title(spec.get("title", ""))
+    ax.grid(True)
 
     out_name = spec.get("out_name")
     if not out_name:
         out_name = f"{ycol}_{kind}"
 
-    out_path = OUT_DIR / f"{out_name}.png"
-    plt.savefig(out_path, dpi=150, bbox_inches="tight")
-    plt.close()
+    return _save(fig, OUT_DIR / f"{out_name}.png")
 
-    return out_path
+
+def _plot_multi(df, spec, xcol, ycols, kind):
+    """Несколько рядов на одном графике (например, метрика под разными схемами весов)."""
+    x = df[xcol]
+    fig = Figure()
+    ax = fig.subplots()
+    for col in ycols:
+        lo_col, hi_col = f"{col}_lo", f"{col}_hi"
+        if kind == "scatter":
+            ax.scatter(x, df[col], label=col)
+        else:
+            if lo_col in df.columns and hi_col in df.columns:
+                ax.fill_between(x, df[lo_col], df[hi_col], alpha=0.15, linewidth=0)
+            ax.plot(x, df[col], marker="o", label=col)
+    ax.legend()
+
+    ax.set_xlabel(xcol)
+    ax.set_ylabel(spec.get("ylabel", ", ".join(ycols)))
+    ax.set_title(spec.get("title", ""))
+    ax.grid(True)
+
+    out_name = spec.get("out_name") or f"{ycols[0]}_multi_{kind}"
+    return _save(fig, OUT_DIR / f"{out_name}.png")
+
+
+def _plot_spectrum(df, spec):
+    """
+    Полный спектр по годам: тепловая карта (год x значение шкалы, цвет = доля веса)
+    + линия CWM сводного спектра.
+    """
+    xcol = spec.get("x", "year")
+    label = spec.get("y", "trait value")
+    bin_cols = [c for c in df.columns if c != xcol and _is_number(c)]
+    bins = np.array([float(c) for c in bin_cols])
+
+    years = df[xcol].to_numpy(dtype=float)
+    W = df[bin_cols].to_numpy(dtype=float)
+    tot = W.sum(axis=1, keepdims=True)
+    P = np.divide(W, tot, out=np.zeros_like(W), where=tot > 0)
+
+    fig = Figure()
+    ax = fig.subplots()
+    mesh = ax.pcolormesh(_edges(years), _edges(bins), P.T, shading="flat", cmap="viridis")
+    fig.colorbar(mesh, ax=ax, label="share of weight")
+    ax.plot(years, P @ bins, color="white", marker="o", linewidth=1.5, label="CWM")
+    ax.legend(loc="upper right")
+
+    ax.set_xlabel(xcol)
+    ax.set_ylabel(label)
+    ax.set_title(spec.get("title", ""))
+
+    out_name = spec.get("out_name") or f"spectrum_{label}"
+    return _save(fig, OUT_DIR / f"{out_name}.png")
+
+
+def _edges(centers):
+    """Границы ячеек вокруг центров (для pcolormesh)."""
+    centers = np.asarray(centers, dtype=float)
+    if len(centers) == 1:
+        return np.array([centers[0] - 0.5, centers[0] + 0.5])
+    mid = (centers[1:] + centers[:-1]) / 2
+    return np.concatenate([[centers[0] - (mid[0] - centers[0])], mid, [centers[-1] + (centers[-1] - mid[-1])]])
+
+
+def _is_number(s):
+    try:
+        float(s)
+        return True
+    except (TypeError, ValueError):
+        return False
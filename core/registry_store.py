@@ -0,0 +1,132 @@
+# core/registry_store.py
+"""
+Скомпилированный реестр справочников: шкалы Элленберга (Tichy et al.), веса
+классов обилия (обилие.xlsx) и список видов Элленберга для normalize.py.
+
+Раньше каждый attach_trait / attach_weights / normalize заново разбирал xlsx.
+Теперь книги читаются один раз в компактное бинарное хранилище (data/cache/registry_store,
+ключ = путь + размер + mtime исходников + REGISTRY_VERSION), а в процессе реестр
+держится в памяти: повторные вызовы стоят один stat() исходников. Поменяли книгу —
+подпись другая, реестр пересобирается сам при следующем обращении.
+
+Таблицы:
+  ellenberg          — лист 'Tab-OriginalNamesValues': species (очищенное имя) | все колонки-шкалы
+                       (числа, NaN как в файле; порядок и повторы строк сохранены)
+  ellenberg_species  — лист 'Tab-IVs-Tichy-et-al2022', колонка B: species (уникальные, очищенные)
+  abundance          — обилие.xlsx: code | w
+Если исходного файла нет, соответствующая таблица = None (ошибка — при обращении).
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from core.cache import DEFAULT_CACHE_DIR, file_signature, get_or_compute
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+ELLENBERG_XLSX = PROJECT_ROOT / "data" / "external" / "Indicator_values_Tichy_et_al.xlsx"
+ELLENBERG_VALUES_SHEET = "Tab-OriginalNamesValues"
+ELLENBERG_SPECIES_SHEET = "Tab-IVs-Tichy-et-al2022"
+ABUNDANCE_XLSX = PROJECT_ROOT / "data" / "registry" / "обилие.xlsx"
+
+REGISTRY_SOURCES = (ELLENBERG_XLSX, ABUNDANCE_XLSX)
+# поменять при изменении разбора книг -> старое хранилище не используется
+REGISTRY_VERSION = "1"
+
+# реестр текущего процесса: (подпись исходников, таблицы)
+_LOADED: dict[str, dict[str, Optional[pd.DataFrame]]] = {}
+
+
+def clean_taxon(s: pd.Series) -> pd.Series:
+    """NBSP -> пробел, схлопываем пробелы, strip (как в traits / normalize)."""
+    return (
+        s.astype("string")
+        .str.replace("\u00A0", " ", regex=False)
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
+
+
+def read_ellenberg_values(xlsx_path: Path = ELLENBERG_XLSX) -> pd.DataFrame:
+    """Лист значений шкал -> species | L | T | M | ... (все колонки, кроме Taxon, как числа)."""
+    df = pd.read_excel(xlsx_path, sheet_name=ELLENBERG_VALUES_SHEET)
+    if "Taxon" not in df.columns:
+        raise KeyError(f"Не нашёл 'Taxon' на листе '{ELLENBERG_VALUES_SHEET}'.")
+
+    out = pd.DataFrame({"species": clean_taxon(df["Taxon"])})
+    for c in df.columns:
+        if c != "Taxon":
+            out[str(c)] = pd.to_numeric(df[c], errors="coerce")
+    return out
+
+
+def read_ellenberg_species(xlsx_path: Path = ELLENBERG_XLSX) -> pd.DataFrame:
+    """Лист со списком таксонов (колонка B) -> species (уникальные)."""
+    df = pd.read_excel(xlsx_path, sheet_name=ELLENBERG_SPECIES_SHEET, usecols=[1])
+    species = clean_taxon(df.iloc[:, 0]).dropna().unique()
+    return pd.DataFrame({"species": pd.Series(species, dtype="string")})
+
+
+def read_abundance_weights(xlsx_path: Path = ABUNDANCE_XLSX) -> pd.DataFrame:
+    """Класс обилия -> вес: code | w (первые две колонки книги)."""
+    df = pd.read_excel(xlsx_path)
+    code_col = df.columns[0]
+    w_col = df.columns[1]
+
+    weights = (
+        df[[code_col, w_col]]
+        .dropna()
+        .assign(
+            code=lambda x: x[code_col].astype("string").str.strip(),
+            w=lambda x: pd.to_numeric(x[w_col], errors="coerce"),
+        )
+        .dropna(subset=["code", "w"])
+    )
+    return weights[["code", "w"]].reset_index(drop=True)
+
+
+def _compile() -> dict[str, Optional[pd.DataFrame]]:
+    tables: dict[str, Optional[pd.DataFrame]] = {"ellenberg": None, "ellenberg_species": None, "abundance": None}
+    if ELLENBERG_XLSX.exists():
+        tables["ellenberg"] = read_ellenberg_values(ELLENBERG_XLSX)
+        try:
+            tables["ellenberg_species"] = read_ellenberg_species(ELLENBERG_XLSX)
+        except ValueError:  # нет листа со списком
+            tables["ellenberg_species"] = None
+    if ABUNDANCE_XLSX.exists():
+        tables["abundance"] = read_abundance_weights(ABUNDANCE_XLSX)
+    return tables
+
+
+def load_registry(cache_dir: Path = DEFAULT_CACHE_DIR) -> dict[str, Optional[pd.DataFrame]]:
+    """
+    Все таблицы реестра. В процессе — из памяти, пока подпись исходников та же;
+    между процессами — из дискового хранилища; иначе книги разбираются заново.
+    """
+    sig = file_signature(REGISTRY_SOURCES)
+    tables = _LOADED.get(sig)
+    if tables is None:
+        tables = get_or_compute(
+            "registry_store",
+            {"version": REGISTRY_VERSION},
+            _compile,
+            cache_dir=cache_dir,
+            input_paths=REGISTRY_SOURCES,
+            use_memory=False,  # в памяти держим сами (_LOADED), без копий на каждый вызов
+        )
+        _LOADED.clear()
+        _LOADED[sig] = tables
+    return tables
+
+
+def registry_table(name: str) -> pd.DataFrame:
+    """Одна таблица реестра (не изменять на месте — она общая для процесса)."""
+    tables = load_registry()
+    if name not in tables:
+        raise KeyError(f"Unknown registry table '{name}' (expected {sorted(tables)})")
+    if tables[name] is None:
+        src = ABUNDANCE_XLSX if name == "abundance" else ELLENBERG_XLSX
+        raise FileNotFoundError(f"Registry table '{name}' is unavailable: source {src} not found or incomplete.")
+    return tables[name]
@@ -0,0 +1,405 @@
+# core/scenario_dag.py
+"""
+Декларативные сценарии (YAML / JSON) -> DAG стадий пайплайна с общими промежуточными узлами.
+
+Файл сценариев:
+
+    defaults:                  # общие поля для всех сценариев (поля ScenarioSpec)
+      analysis: eco_vs_climate
+      trait_scale: M
+    scenarios:
+      - name: cwm_jja
+        eco_metric: cwm
+        period: JJA
+        sweep:                 # декартово произведение -> по сценарию на комбинацию
+          lag: [0, 1, 2]
+          window: [1, 2, 3]
+      - name: sigma_by_year
+        analysis: ecospectrum
+        eco_metric: sigma
+
+Каждый сценарий раскладывается на стадии (STAGES):
+
+    eco_desc (filters, scale)                     экоспектр по описаниям + метаданные (кеш "eco_table")
+      -> eco_year (filters, scale, metric, boot)  годовой ряд (кеш "eco_year")
+      -> eco_vs_climate (+ climate_cube)          корреляция с климатическим сигналом
+    eco_desc -> ecospectrum                       агрегат по groupby
+    scenario                                      прочие режимы: run_scenario целиком
+
+Узел = стадия + параметры (id — хеш), поэтому одинаковые верхние стадии разных
+сценариев (те же фильтры и шкала) считаются один раз. Независимые узлы идут
+параллельно (потоки: промежуточные таблицы остаются в памяти процесса).
+Узлы, чей результат уже в кеше (память / диск), только загружаются, а их
+предки, не нужные больше никому, не выполняются — это и показывает explain_plan.
+
+Запуск: python scripts/run_scenarios.py explain|run scenarios/example_eco_climate.yaml
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+
+from core.cache import cache_status, make_cache_key
+from core.climate_cube import METEO_PERIODS_CSV, cube_cache_key, load_climate_cube
+from core.scenario_runner import (
+    ScenarioSpec,
+    aggregate_ecospectrum,
+    SPECTRUM_INPUT_PATHS,
+    eco_table_cache_key,
+    eco_year_cache_key,
+    load_eco_table,
+    load_eco_year,
+    resolve_weight_schemes,
+    run_scenario,
+)
+
+try:
+    import yaml  # pyyaml: только для .yaml/.yml
+except ImportError:  # pragma: no cover
+    yaml = None
+
+SPEC_FIELDS = {f.name for f in fields(ScenarioSpec)}
+DEFAULT_WORKERS = 4
+
+
+# ----------------------------
+# Файл сценариев -> ScenarioSpec
+# ----------------------------
+
+def _read_document(path: Path) -> Any:
+    text = Path(path).read_text(encoding="utf-8")
+    if Path(path).suffix.lower() in (".yaml", ".yml"):
+        if yaml is None:
+            raise ImportError("pyyaml is required for YAML scenario files (pip install pyyaml)")
+        return yaml.safe_load(text)
+    return json.loads(text)
+
+
+def _make_spec(entry: Dict[str, Any]) -> ScenarioSpec:
+    unknown = set(entry) - SPEC_FIELDS
+    if unknown:
+        raise KeyError(f"Unknown scenario fields {sorted(unknown)} in '{entry.get('name')}'")
+    entry = dict(entry)
+    entry.setdefault("filters", {})
+    entry.setdefault("groupby", ["year"])
+    entry.setdefault("metric", {})
+    return ScenarioSpec(**entry)
+
+
+def expand_scenarios(doc: Any) -> list[ScenarioSpec]:
+    """
+    Документ (dict с defaults/scenarios или просто список сценариев) -> список ScenarioSpec.
+    sweep: {field: [values]} разворачивается в сценарии "name[field=value,...]".
+    """
+    if isinstance(doc, list):
+        doc = {"scenarios": doc}
+    defaults = dict(doc.get("defaults") or {})
+    specs: list[ScenarioSpec] = []
+    for i, raw in enumerate(doc.get("scenarios") or []):
+        entry = {**defaults, **raw}
+        entry.setdefault("name", f"scenario_{i + 1}")
+        sweep = entry.pop("sweep", None) or {}
+        if not sweep:
+            specs.append(_make_spec(entry))
+            continue
+        keys = list(sweep)
+        for values in itertools.product(*(sweep[k] for k in keys)):
+            combo = dict(zip(keys, values))
+            suffix = ",".join(f"{k}={v}" for k, v in combo.items())
+            specs.append(_make_spec({**entry, **combo, "name": f"{entry['name']}[{suffix}]"}))
+
+    names = [s.name for s in specs]
+    dupes = sorted({n for n in names if names.count(n) > 1})
+    if dupes:
+        raise ValueError(f"Duplicate scenario names: {dupes}")
+    return specs
+
+
+def load_scenario_file(path: str | Path) -> list[ScenarioSpec]:
+    """YAML (.yaml/.yml) или JSON файл сценариев -> список ScenarioSpec."""
+    return expand_scenarios(_read_document(Path(path)))
+
+
+# ----------------------------
+# Стадии
+# ----------------------------
+
+@dataclass(frozen=True)
+class Stage:
+    run: Callable[[Dict[str, Any], Dict[str, Any]], Any]   # (params, {dep stage: result}) -> result
+    cached: Callable[[Dict[str, Any]], Optional[str]] | None = None  # "memory" | "disk" | None
+    description: str = ""
+
+
+def _run_eco_desc(params, inputs):
+    return load_eco_table(params["filters"], params["scale"])
+
+
+def _eco_desc_cached(params):
+    return cache_status(
+        "eco_table", eco_table_cache_key(params["filters"], params["scale"]), input_paths=SPECTRUM_INPUT_PATHS
+    )
+
+
+def _run_eco_year(params, inputs):
+    # eco_desc может отсутствовать, если eco_year уже лежал в кеше (предок не выполнялся)
+    return load_eco_year(
+        params["filters"], params["scale"], params["eco_metric"], params["bootstrap"],
+        eco_table=inputs.get("eco_desc"),
+    )
+
+
+def _eco_year_cached(params):
+    return cache_status(
+        "eco_year",
+        eco_year_cache_key(params["filters"], params["scale"], params["eco_metric"], params["bootstrap"]),
+        input_paths=SPECTRUM_INPUT_PATHS,
+    )
+
+
+def _run_climate_cube(params, inputs):
+    return load_climate_cube(Path(params["csv"]))
+
+
+def _climate_cube_cached(params):
+    csv_path = Path(params["csv"])
+    return cache_status("climate_cube", cube_cache_key(csv_path), input_paths=[csv_path])
+
+
+def _run_ecospectrum(params, inputs):
+    return aggregate_ecospectrum(params["spec"], inputs["eco_desc"])
+
+
+def _run_eco_vs_climate(params, inputs):
+    # eco_year и куб уже в памяти процесса (предки) -> run_scenario берёт их из кеша
+    return run_scenario(params["spec"])
+
+
+def _run_whole_scenario(params, inputs):
+    return run_scenario(params["spec"])
+
+
+STAGES: Dict[str, Stage] = {
+    "eco_desc": Stage(_run_eco_desc, _eco_desc_cached, "filters -> weights -> traits -> ecospectrum per description"),
+    "eco_year": Stage(_run_eco_year, _eco_year_cached, "yearly mean of one metric"),
+    "climate_cube": Stage(_run_climate_cube, _climate_cube_cached, "climate signal cube"),
+    "ecospectrum": Stage(_run_ecospectrum, None, "aggregate by groupby (+ CI, plot)"),
+    "eco_vs_climate": Stage(_run_eco_vs_climate, None, "join with climate signal, correlations (+ plot)"),
+    "scenario": Stage(_run_whole_scenario, None, "run_scenario as a whole"),
+}
+
+
+def register_stage(name: str, stage: Stage) -> None:
+    STAGES[name] = stage
+
+
+# ----------------------------
+# Компиляция в DAG
+# ----------------------------
+
+@dataclass
+class Node:
+    node_id: str
+    stage: str
+    params: Dict[str, Any]
+    deps: list[str] = field(default_factory=list)
+    scenarios: list[str] = field(default_factory=list)   # какие сценарии через него проходят
+
+
+@dataclass
+class ScenarioPlan:
+    nodes: Dict[str, Node]          # в топологическом порядке (предки раньше)
+    outputs: Dict[str, str]         # имя сценария -> id узла-результата
+
+
+def _node_id(stage: str, params: Dict[str, Any]) -> str:
+    # спека сценария (ScenarioSpec / SimpleNamespace) в ключ не входит целиком:
+    # её узлы и так уникальны по имени сценария
+    key_params = {k: (v.name if k == "spec" else v) for k, v in params.items()}
+    return f"{stage}:{make_cache_key(stage, key_params)[:10]}"
+
+
+class _PlanBuilder:
+    def __init__(self) -> None:
+        self.nodes: Dict[str, Node] = {}
+
+    def add(self, stage: str, params: Dict[str, Any], deps: list[str], scenario: str) -> str:
+        node_id = _node_id(stage, params)
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = self.nodes[node_id] = Node(node_id, stage, params, list(deps))
+        node.scenarios.append(scenario)
+        for d in deps:  # предки тоже "принадлежат" сценарию
+            if scenario not in self.nodes[d].scenarios:
+                self.nodes[d].scenarios.append(scenario)
+        return node_id
+
+
+def compile_plan(specs: list[ScenarioSpec]) -> ScenarioPlan:
+    """Сценарии -> DAG узлов; одинаковые (стадия, параметры) сливаются в один узел."""
+    b = _PlanBuilder()
+    outputs: Dict[str, str] = {}
+    for spec in specs:
+        analysis = getattr(spec, "analysis", "aggregate")
+        filters = getattr(spec, "filters", None) or {}
+        scale = getattr(spec, "trait_scale", "M")
+
+        if analysis == "ecospectrum" and not resolve_weight_schemes(getattr(spec, "weight_schemes", None)):
+            desc = b.add("eco_desc", {"filters": filters, "scale": scale}, [], spec.name)
+            outputs[spec.name] = b.add("ecospectrum", {"spec": spec}, [desc], spec.name)
+        elif analysis == "eco_vs_climate":
+            desc = b.add("eco_desc", {"filters": filters, "scale": scale}, [], spec.name)
+            year = b.add(
+                "eco_year",
+                {
+                    "filters": filters,
+                    "scale": scale,
+                    "eco_metric": getattr(spec, "eco_metric", "cwm"),
+                    "bootstrap": getattr(spec, "bootstrap", None),
+                },
+                [desc],
+                spec.name,
+            )
+            csv_path = Path(getattr(spec, "climate_csv", None) or METEO_PERIODS_CSV)
+            cube = b.add("climate_cube", {"csv": str(csv_path)}, [], spec.name)
+            outputs[spec.name] = b.add("eco_vs_climate", {"spec": spec}, [year, cube], spec.name)
+        else:
+            outputs[spec.name] = b.add("scenario", {"spec": spec}, [], spec.name)
+    return ScenarioPlan(b.nodes, outputs)
+
+
+def plan_status(plan: ScenarioPlan) -> Dict[str, str]:
+    """
+    Статус каждого узла: "memory" / "disk" (результат в кеше, только загрузка),
+    "compute" (будет считаться), "skip" (нужен только узлам, которые возьмутся из кеша).
+    """
+    status: Dict[str, str] = {}
+    for node_id, node in plan.nodes.items():
+        probe = STAGES[node.stage].cached
+        status[node_id] = (probe(node.params) if probe else None) or "compute"
+
+    children: Dict[str, list[str]] = {n: [] for n in plan.nodes}
+    for node in plan.nodes.values():
+        for d in node.deps:
+            children[d].append(node.node_id)
+
+    # обратный топологический порядок: узел нужен, если он — результат сценария
+    # или его ждёт хотя бы один выполняемый (не из кеша) потомок
+    needed: set[str] = set(plan.outputs.values())
+    for node_id in reversed(list(plan.nodes)):
+        if any(c in needed and status[c] == "compute" for c in children[node_id]):
+            needed.add(node_id)
+        if node_id not in needed:
+            status[node_id] = "skip"
+    return status
+
+
+def explain_plan(plan: ScenarioPlan) -> pd.DataFrame:
+    """Таблица узлов: node | stage | status | n_scenarios | deps | params (без спеки сценария)."""
+    status = plan_status(plan)
+    rows = []
+    for node_id, node in plan.nodes.items():
+        params = {k: v for k, v in node.params.items() if k != "spec"}
+        rows.append({
+            "node": node_id,
+            "stage": node.stage,
+            "status": status[node_id],
+            "n_scenarios": len(node.scenarios),
+            "deps": ",".join(node.deps),
+            "params": json.dumps(params, ensure_ascii=False, sort_keys=True) if params else node.scenarios[0],
+        })
+    return pd.DataFrame(rows, columns=["node", "stage", "status", "n_scenarios", "deps", "params"])
+
+
+# ----------------------------
+# Выполнение
+# ----------------------------
+
+def run_node(plan: ScenarioPlan, node_id: str, results: Dict[str, Any]) -> Any:
+    """Один узел плана; results — {id узла: результат} уже выполненных предков (пропущенных там нет)."""
+    node = plan.nodes[node_id]
+    inputs = {plan.nodes[d].stage: results[d] for d in node.deps if d in results}
+    return STAGES[node.stage].run(node.params, inputs)
+
+
+@dataclass
+class NodeResult:
+    node_id: str
+    status: str
+    seconds: float
+    error: Optional[str] = None
+
+
+def run_plan(
+    plan: ScenarioPlan,
+    workers: int = DEFAULT_WORKERS,
+    on_node: Callable[[NodeResult], None] | None = None,
+) -> tuple[Dict[str, Any], Dict[str, NodeResult]]:
+    """
+    Выполняет DAG: узел стартует, когда готовы все его выполняемые предки; независимые
+    узлы — параллельно (ThreadPoolExecutor, workers потоков).
+    Ошибка узла не останавливает остальные: зависящие от него сценарии получают
+    исключение вместо результата. Возвращает ({сценарий: (df, plot_path) | Exception}, {узел: NodeResult}).
+    """
+    status = plan_status(plan)
+    skipped = {n for n, s in status.items() if s == "skip"}
+    todo = set(plan.nodes) - skipped
+    results: Dict[str, Any] = {}
+    errors: Dict[str, BaseException] = {}
+    report: Dict[str, NodeResult] = {}
+
+    def _ready(node_id: str) -> bool:
+        return all(d in results or d in errors or d in skipped for d in plan.nodes[node_id].deps)
+
+    def _execute(node_id: str) -> Any:
+        return run_node(plan, node_id, results)
+
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+        running: Dict[Any, tuple[str, float]] = {}
+        while todo or running:
+            for node_id in [n for n in plan.nodes if n in todo and _ready(n)]:
+                todo.discard(node_id)
+                failed = [d for d in plan.nodes[node_id].deps if d in errors]
+                if failed:
+                    errors[node_id] = errors[failed[0]]
+                    report[node_id] = NodeResult(node_id, "failed", 0.0, f"upstream {failed[0]} failed")
+                    if on_node:
+                        on_node(report[node_id])
+                    continue
+                running[pool.submit(_execute, node_id)] = (node_id, time.perf_counter())
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                node_id, t0 = running.pop(fut)
+                try:
+                    results[node_id] = fut.result()
+                    report[node_id] = NodeResult(node_id, status[node_id], time.perf_counter() - t0)
+                except Exception as e:
+                    errors[node_id] = e
+                    report[node_id] = NodeResult(node_id, "failed", time.perf_counter() - t0, f"{type(e).__name__}: {e}")
+                if on_node:
+                    on_node(report[node_id])
+
+    out: Dict[str, Any] = {}
+    for name, node_id in plan.outputs.items():
+        out[name] = results[node_id] if node_id in results else errors[node_id]
+    return out, report
+
+
+def run_scenarios(
+    specs: list[ScenarioSpec],
+    workers: int = DEFAULT_WORKERS,
+    on_node: Callable[[NodeResult], None] | None = None,
+) -> Dict[str, Any]:
+    """compile_plan + run_plan: {имя сценария: (df, plot_path) | Exception}."""
+    out, _ = run_plan(compile_plan(specs), workers=workers, on_node=on_node)
+    return out
@@ -1,18 +1,23 @@
 from dataclasses import dataclass
 from typing import Dict, Any, List
-from core.abundance import attach_weights
-from core.traits import attach_trait
-from core.ecospectrum import compute_ecospectrum_by_description
+from core.abundance import WEIGHT_SCHEMES, attach_weight_matrix, attach_weights, weight_column
+from core.traits import ELLENBERG_XLSX, attach_trait, attach_traits, scales_with
+from core.abundance import ABUNDANCE_XLSX
+from core.ecospectrum import build_spectrum_matrix, compute_ecospectrum_schemes, load_spectrum, pool_spectra, save_spectra, spectrum_path
+from core.eco_store import STORE_VERSION, ecospectrum_incremental
 from core.analysis_engine import apply_filters
 import pandas as pd
 from pathlib import Path
 from scipy import stats
 import numpy as np
 from core.cache import get_or_compute_df
+from core.kernels import SHIFT_MODE_DEFAULT, autocorrelations, circular_shift_pvalue, effective_n, effective_n_pvalues
+from core.bootstrap import add_bootstrap_ci, bootstrap_options
+from core.climate_cube import CLIMATE_VARS, METEO_PERIODS_CSV, climate_signal, load_meteo_periods
+from core.trace import attach_trace, current_trace, trace_options, trace_stage, traced, tracing
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 PEDYA_PERIODS_CSV = PROJECT_ROOT / "data" / "processed" / "meteo_pedya_periods_1991_2020.csv"
-METEO_PERIODS_CSV = PROJECT_ROOT / "data" / "processed" / "meteo_periods_1991_2020.csv"
 
 
 
@@ -34,12 +39,69 @@ class ScenarioSpec:
     plot: Dict[str, Any] | None = None
     analysis: str = "aggregate"  # "aggregate" (как было) или "ecospectrum"
     trait_scale: str = "M"  # M = moisture
-    eco_metric: str = "cwm"  # что строим: cwm/sigma/w_median/w_min/w_max
+    eco_metric: str = "cwm"  # что строим: cwm/sigma/w_median/w_min/w_max/skew/kurt/fdis/rao_q(_multi)
     climate_var: str = "pedya"
     period: str = "JJA"
     lag: int = 0
     window: int = 1
     climate_csv: str | None = None
+    bootstrap: Any = None  # True | n_boot | {"n_boot", "ci", "seed"}: CI по описаниям внутри года
+    weight_schemes: Any = None  # None | "all" | ["registry", "presence", ...]: метрика под каждой схемой весов
+    trace: Any = None  # None | True | "trace.json" | {"json_path", "chrome_path", "memory", "profile"}: см. core.trace
+    shift_mode: str = SHIFT_MODE_DEFAULT  # pearson_p_shift: "sampled" | "exact" | "auto", см. core.kernels.circular_shift_pvalue
+
+
+# Домены выпадающих списков UI (MainWindow); их же перебирает прогрев кеша.
+# (K — континентальность — в таблице Tichy et al. нет; F = M, см. core.traits.SCALE_ALIASES)
+ELLENBERG_SCALES = ["L", "T", "F", "R", "N", "S", "M"]
+ECO_METRICS = [
+    "cwm", "sigma", "w_median", "w_min", "w_max",
+    # функциональное разнообразие (по выбранной шкале / *_multi — по всем шкалам, Гауэр)
+    "skew", "kurt", "fdis", "rao_q", "fdis_multi", "rao_q_multi",
+]
+AFFORESTATION_CHOICES: list[tuple[str, list[int] | None]] = [
+    ("All", None),
+    ("Луг (0)", [0]),
+    ("Редколесье (1)", [1]),
+    ("Лес (2)", [2]),
+    ("Луг + редколесье (0,1)", [0, 1]),
+    ("Редколесье + лес (1,2)", [1, 2]),
+]
+
+# какие файлы определяют eco-часть (если поменяются — кеш инвалидируется)
+ECO_INPUT_PATHS = [
+    PROJECT_ROOT / "data" / "processed" / "observations.csv",
+    PROJECT_ROOT / "data" / "processed" / "descriptions.csv",
+    PROJECT_ROOT / "data" / "processed" / "profiles.csv",  # если нет — ок, будет MISSING
+]
+# + справочники шкал и весов: от них зависят матрицы спектров
+SPECTRUM_INPUT_PATHS = ECO_INPUT_PATHS + [ELLENBERG_XLSX, ABUNDANCE_XLSX]
+
+# метаданные описания, которые приклеиваются к экоспектру (группировки / фильтры после расчёта)
+ECO_META_COLS = ["description_id", "year", "geomorph_level", "impact_type", "source_file"]
+# поменять при изменении состава таблицы экоспектра по описаниям -> старый кеш не используется
+ECO_TABLE_VERSION = "1"
+
+
+def build_ui_filters(
+    profile: str = "All",
+    geomorph_level: str = "All",
+    impact_type: str = "All",
+    afforestation: list[int] | None = None,
+) -> Dict[str, Any]:
+    """
+    FilterSpec из значений выпадающих списков UI ("All" = без фильтра).
+    """
+    filters: Dict[str, Any] = {}
+    if afforestation is not None:
+        filters["afforestation"] = {"in": afforestation}
+    if geomorph_level != "All":
+        filters["geomorph_level"] = geomorph_level
+    if profile != "All":
+        filters["source_file"] = profile
+    if impact_type != "All":
+        filters["impact_type"] = impact_type
+    return filters
 
 
 def build_metric(metric_spec: Dict[str, Any]):
@@ -52,24 +114,293 @@ def build_metric(metric_spec: Dict[str, Any]):
 
     raise ValueError(f"Unknown metric type: {t}")
 
-def load_meteo_periods(path: Path = METEO_PERIODS_CSV) -> pd.DataFrame:
-    if not path.exists():
-        raise FileNotFoundError(
-            f"Meteo periods CSV not found: {path}. Run scripts/build_meteo_periods.py"
+@traced()
+def prepare_eco_rows(filters: Dict[str, Any] | None, scale: str | tuple[str, ...]) -> pd.DataFrame:
+    """
+    Species-level rows ready for ecospectrum: filters -> abundance rows -> weights -> trait.
+    scale: one Ellenberg scale ("M") or a tuple of scales (trait matrix, one column per scale).
+    """
+    df = load_processed()
+
+    # (A) filters before ecospectrum (river/geomorph/impact/year...)
+    if filters:
+        df = apply_filters(df, filters)
+
+    # (B) only abundance rows
+    df = df[df["abundance_class"].notna()].copy()
+
+    # (C) weights
+    df = attach_weights(df, abundance_col="abundance_class", out_col="w")
+    df = df[df["w"].notna() & (df["w"] > 0)].copy()
+
+    # (D) attach trait scale (default M) / trait matrix
+    if isinstance(scale, str):
+        return attach_trait(df, scale=scale)
+    return attach_traits(df, scales=tuple(scale))
+
+
+def eco_by_description(filters: Dict[str, Any] | None, scale: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Ecospectrum per description for one scale, computed together with all TRAIT_SCALES
+    in one pass (so switching the scale in UI hits the cache). Goes through the
+    per-description store (core.eco_store): only descriptions whose rows changed are recomputed.
+    Returns (eco, rows): eco has the same columns as compute_ecospectrum_by_description.
+    """
+    df = prepare_eco_rows(filters, scales_with(scale))
+    if scale not in df.columns:
+        raise KeyError(f"Ellenberg scale '{scale}' not found in trait table.")
+
+    trait_cols = tuple(c for c in scales_with(scale) if c in df.columns)
+    eco_all = ecospectrum_incremental(df, trait_cols, weight_col="w")
+    eco = eco_all[eco_all["scale"] == scale].drop(columns="scale").reset_index(drop=True)
+    return eco, df
+
+
+def resolve_weight_schemes(value: Any) -> list[str] | None:
+    """spec.weight_schemes -> list of scheme names (see core.abundance.WEIGHT_SCHEMES) or None."""
+    if value is None or value is False:
+        return None
+    if value is True or value == "all":
+        return list(WEIGHT_SCHEMES)
+    schemes = [value] if isinstance(value, str) else list(value)
+    unknown = [s for s in schemes if s not in WEIGHT_SCHEMES]
+    if unknown:
+        raise KeyError(f"Unknown weight schemes: {unknown} (expected {list(WEIGHT_SCHEMES)})")
+    return schemes
+
+
+def eco_by_description_schemes(
+    filters: Dict[str, Any] | None,
+    scale: str,
+    schemes: list[str],
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Ecospectrum per description for one scale under several abundance-weighting schemes
+    at once (one kernel pass, core.ecospectrum.compute_ecospectrum_schemes).
+    Returns (eco, rows): eco is long, description_id | weights | metrics...,
+    "weights" holds the scheme name ("registry", "presence", ...).
+    """
+    df = load_processed()
+    if filters:
+        df = apply_filters(df, filters)
+    df = df[df["abundance_class"].notna()].copy()
+
+    # все схемы сразу: w_registry, w_presence, ...; строка нужна, если хоть одна схема дала вес
+    df = attach_weight_matrix(df, schemes=schemes, abundance_col="abundance_class")
+    weight_cols = [weight_column(s) for s in schemes]
+    df = df[(df[weight_cols].fillna(0) > 0).any(axis=1)].copy()
+
+    df = attach_trait(df, scale=scale)
+    if scale not in df.columns:
+        raise KeyError(f"Ellenberg scale '{scale}' not found in trait table.")
+
+    eco = compute_ecospectrum_schemes(df, trait_col=scale, weight_cols=weight_cols)
+    eco["weights"] = eco["weights"].str.removeprefix("w_")
+    return eco, df
+
+
+@traced()
+def load_spectra(scale: str) -> pd.DataFrame:
+    """
+    Description x bin spectrum matrix for one scale (all descriptions, no filters).
+    Persisted next to processed data (data/processed/spectra_{scale}.parquet, see
+    scripts/build_spectra.py); rebuilt when any input file is newer than the matrix.
+    """
+    path = spectrum_path(scale)
+    src_mtime = max((Path(p).stat().st_mtime for p in SPECTRUM_INPUT_PATHS if Path(p).exists()), default=0.0)
+    if path.exists() and path.stat().st_mtime >= src_mtime:
+        return load_spectrum(scale)
+
+    rows = prepare_eco_rows(None, scale)
+    spec_df = build_spectrum_matrix(rows, trait_col=scale, weight_col="w")
+    save_spectra({scale: spec_df})
+    return spec_df
+
+
+@traced("merge_meta")
+def describe_eco(eco: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+    """Per-description ecospectrum + description metadata (ECO_META_COLS) from the species rows."""
+    meta = rows[ECO_META_COLS].drop_duplicates("description_id")
+    return eco.merge(meta, on="description_id", how="left")
+
+
+def eco_table_cache_key(filters: Dict[str, Any] | None, scale: str) -> dict:
+    """Payload of the "eco_table" cache entry (see load_eco_table): one entry for all scales_with(scale)."""
+    return {
+        "filters": filters or {},
+        "scales": list(scales_with(scale)),
+        "version": ECO_TABLE_VERSION,
+        "store_version": STORE_VERSION,
+    }
+
+
+@traced()
+def load_eco_table(filters: Dict[str, Any] | None, scale: str) -> pd.DataFrame:
+    """
+    Per-description ecospectrum table for one scale: all metrics + ECO_META_COLS
+    (same as describe_eco(*eco_by_description(filters, scale))).
+    Cached on disk and in memory once per filters for all TRAIT_SCALES (one pass computes
+    them together), so switching the metric, the groupby or the scale in UI only slices
+    and aggregates this table.
+    """
+    eco_filters = filters or {}
+    trait_cols = scales_with(scale)
+
+    def _compute_eco_table() -> pd.DataFrame:
+        df = prepare_eco_rows(eco_filters, trait_cols)
+        if scale not in df.columns:
+            raise KeyError(f"Ellenberg scale '{scale}' not found in trait table.")
+        eco_all = ecospectrum_incremental(df, tuple(c for c in trait_cols if c in df.columns), weight_col="w")
+        return describe_eco(eco_all, df)
+
+    table = get_or_compute_df(
+        namespace="eco_table",
+        payload=eco_table_cache_key(eco_filters, scale),
+        input_paths=SPECTRUM_INPUT_PATHS,
+        compute_fn=_compute_eco_table,
+    )
+    if not (table["scale"] == scale).any() and not table.empty:
+        raise KeyError(f"Ellenberg scale '{scale}' not found in trait table.")
+    return table[table["scale"] == scale].drop(columns="scale").reset_index(drop=True)
+
+
+def eco_year_cache_key(
+    filters: Dict[str, Any] | None,
+    scale: str,
+    metric_name: str,
+    bootstrap: Any = None,
+) -> dict:
+    """Payload of the "eco_year" cache entry (see load_eco_year)."""
+    # ключ кеша — ТОЛЬКО eco-постановка (без period/lag/window/climate_var!)
+    key = {
+        "analysis": "eco_vs_climate",
+        "filters": filters or {},
+        "trait_scale": scale,
+        "eco_metric": metric_name,
+        # строится из eco_table -> те же версии, что и у неё
+        "version": ECO_TABLE_VERSION,
+        "store_version": STORE_VERSION,
+    }
+    boot = bootstrap_options(bootstrap)
+    if boot:
+        key["bootstrap"] = boot
+    return key
+
+
+@traced()
+def load_eco_year(
+    filters: Dict[str, Any] | None,
+    scale: str,
+    metric_name: str,
+    bootstrap: Any = None,
+    eco_table: pd.DataFrame | None = None,
+) -> pd.DataFrame:
+    """
+    Yearly mean of one ecospectrum metric: columns year, eco. Cached on disk and in memory.
+    bootstrap (see core.bootstrap.bootstrap_options): adds eco_lo / eco_hi CI columns.
+    eco_table: already loaded load_eco_table() for the same (filters, scale); on a cache miss
+    the yearly series is derived from it (by default from the cached load_eco_table).
+    """
+    eco_filters = filters or {}
+    boot = bootstrap_options(bootstrap)
+    eco_cache_key = eco_year_cache_key(eco_filters, scale, metric_name, bootstrap)
+
+    def _compute_eco_year() -> pd.DataFrame:
+        # ecospectrum per description + metadata (need year), cached per (filters, scale)
+        eco2 = eco_table if eco_table is not None else load_eco_table(eco_filters, scale)
+
+        # aggregate eco by year
+        eco_year_local = (
+            eco2.groupby(["year"], as_index=False)[metric_name]
+            .mean()
+            .rename(columns={metric_name: "eco"})
+            .sort_values("year")
         )
-    df = pd.read_csv(path)
-    required = {"year", "period", "t_mean_c", "precip_mm", "pedya"}
-    missing = required - set(df.columns)
-    if missing:
-        raise KeyError(f"Missing columns in meteo periods CSV: {sorted(missing)}")
+        if boot:
+            eco_year_local = add_bootstrap_ci(
+                eco_year_local, eco2, by="year", value_col=metric_name, out_prefix="eco", **boot
+            )
+        return eco_year_local
+
+    return get_or_compute_df(
+        namespace="eco_year",
+        payload=eco_cache_key,
+        input_paths=SPECTRUM_INPUT_PATHS,
+        compute_fn=_compute_eco_year,
+        use_disk=True,
+        use_memory=True,
+    )
+
+
+@traced("aggregate")
+def aggregate_ecospectrum(spec: ScenarioSpec, eco2: pd.DataFrame):
+    """
+    "ecospectrum" from the describe_eco() table: mean of spec.eco_metric by spec.groupby
+    (usually year), optional bootstrap CI, optional plot. Returns (result, plot_path).
+    """
+    # (G) aggregate by scenario groupby (usually year)
+    metric_name = getattr(spec, "eco_metric", "cwm")
+    groupby = spec.groupby or ["year"]
+
+    result = (
+        eco2.groupby(groupby, as_index=False)[metric_name]
+        .mean()
+        .sort_values(groupby)
+    )
+
+    # (H) optional bootstrap CI: descriptions resampled within each group
+    boot = bootstrap_options(getattr(spec, "bootstrap", None))
+    if boot:
+        result = add_bootstrap_ci(result, eco2, by=groupby, value_col=metric_name, **boot)
+
+    plot_path = None
+    if spec.plot:
+        plot_spec = dict(spec.plot)
+        if boot and plot_spec.get("y") == metric_name:
+            plot_spec.setdefault("y_lo", f"{metric_name}_lo")
+            plot_spec.setdefault("y_hi", f"{metric_name}_hi")
+        plot_path = plot_timeseries(result, plot_spec)
+
+    return result, plot_path
+
+
+def _run_ecospectrum_schemes(spec: ScenarioSpec, scale: str, schemes: list[str]):
+    """
+    "ecospectrum" with spec.weight_schemes: the same yearly aggregate, one column per
+    scheme ({metric}_{scheme}), plus optional bootstrap bands per scheme.
+    """
+    eco, df = eco_by_description_schemes(spec.filters, scale, schemes)
+
+    eco2 = describe_eco(eco, df)
+
+    metric_name = getattr(spec, "eco_metric", "cwm")
+    groupby = spec.groupby or ["year"]
 
-    df["year"] = pd.to_numeric(df["year"], errors="coerce")
-    df["period"] = df["period"].astype("string")
-    for c in ["t_mean_c", "precip_mm", "pedya"]:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
-    df = df.dropna(subset=["year", "period"]).copy()
-    df["year"] = df["year"].astype(int)
-    return df
+    result = (
+        eco2.pivot_table(index=groupby, columns="weights", values=metric_name, aggfunc="mean", dropna=False)
+        .reindex(columns=schemes)
+        .add_prefix(f"{metric_name}_")
+        .reset_index()
+        .sort_values(groupby)
+    )
+    result.columns.name = None
+    y_cols = [f"{metric_name}_{s}" for s in schemes]
+
+    boot = bootstrap_options(getattr(spec, "bootstrap", None))
+    if boot:
+        for s, col in zip(schemes, y_cols):
+            per_scheme = eco2[eco2["weights"] == s]
+            result = add_bootstrap_ci(result, per_scheme, by=groupby, value_col=metric_name, out_prefix=col, **boot)
+
+    plot_path = None
+    if spec.plot:
+        plot_spec = dict(spec.plot)
+        if plot_spec.get("y") in (None, metric_name):
+            plot_spec["y"] = y_cols
+        plot_spec.setdefault("ylabel", metric_name)
+        plot_path = plot_timeseries(result, plot_spec)
+
+    return result, plot_path
 
 
 def run_scenario(spec: ScenarioSpec):
@@ -83,11 +414,17 @@ def run_scenario(spec: ScenarioSpec):
 
     2) "ecospectrum"
        Ellenberg ecospectrum metrics computed from species abundances:
-         - per description: CWM, sigma, weighted median, min/max
+         - per description: CWM, sigma, weighted median, min/max,
+           skewness, kurtosis, FDis, Rao's Q (one scale or all scales, Gower)
          - then aggregated by year (and filtered by geomorph/impact/river etc.)
        Controls:
          - spec.trait_scale: "M", "T", "N", "R" (Ellenberg scale)
-         - spec.eco_metric: "cwm", "sigma", "w_median", "w_min", "w_max"
+         - spec.eco_metric: one of ECO_METRICS ("cwm", "sigma", ..., "fdis", "rao_q_multi")
+         - spec.bootstrap: optional CI band ({metric}_lo/_hi), see core.bootstrap
+         - spec.weight_schemes: optional "all" or list of core.abundance.WEIGHT_SCHEMES
+           ("registry", "presence", "ordinal", "cover_midpoint", "log_cover"):
+           the metric under every scheme side by side ({metric}_{scheme} columns),
+           computed in one pass
          - spec.filters: dict passed to apply_filters()
 
     3) "climate"
@@ -105,6 +442,15 @@ def run_scenario(spec: ScenarioSpec):
        Output:
          DataFrame with at least ["year", "pedya"] (currently plotted variable is pedya).
 
+    2b) "spectrum"
+       Full Ellenberg spectrum per year: description x bin weight matrices
+       (load_spectra) pooled by year as mean relative spectra.
+       Controls:
+         - spec.trait_scale, spec.filters as in "ecospectrum"
+         - spec.plot: {"kind": "spectrum"} -> heatmap year x trait value + CWM line
+       Output:
+         DataFrame: year | n_desc | "1" | "2" | ... (share of weight per trait value)
+
     4) "eco_vs_climate"
        Scatter / correlation between yearly ecospectrum metric and a climate variable
        aggregated by period.
@@ -112,24 +458,51 @@ def run_scenario(spec: ScenarioSpec):
          data/processed/meteo_periods_1991_2020.csv
        Controls:
          - spec.trait_scale: Ellenberg scale for eco side ("M","T","N","R")
-         - spec.eco_metric: ecospectrum metric ("cwm","sigma","w_median","w_min","w_max")
+         - spec.eco_metric: ecospectrum metric (ECO_METRICS: "cwm","sigma",...,"fdis","rao_q")
+         - spec.bootstrap: optional CI of yearly eco (eco_lo/eco_hi, error bars), see core.bootstrap
          - spec.period: climate period (default "JJA")
          - spec.climate_var: "pedya" | "t_mean_c" | "precip_mm" (default "pedya")
          - spec.lag: int >= 0, shift climate signal by lag years (default 0)
          - spec.window: int >= 1, rolling mean window (years) for climate signal (default 1)
+           (window and lag are calendar years: signal(t) = mean of years t-lag-window+1 .. t-lag,
+            undefined if any of them is missing; sliced from core.climate_cube)
          - spec.filters: filters applied to eco data before yearly aggregation
          - spec.climate_csv: optional override path to meteo_periods csv
        Output:
          DataFrame with columns:
-           year, eco, clim, clim_signal, pearson_r, spearman_rho, climate_var, period, lag, window
+           year, eco, clim, clim_signal, pearson_r, spearman_rho, climate_var, period, lag, window,
+           plus autocorrelation-aware p-values: ac1_eco, ac1_clim, n_eff / pearson_p_eff (Bretherton),
+           n_eff_pp / pearson_p_pp (Pyper-Peterman), see core.kernels.effective_n
 
     Notes:
       - DJF and cold_half_year are computed with year-shift:
           DJF(t) = Dec(t-1) + Jan(t) + Feb(t)
           cold_half_year(t) includes Oct-Dec of (t-1) and Jan-Mar of t
       - Spearman correlation uses SciPy (required dependency).
+
+    Tracing (core.trace):
+      - spec.trace: True | "trace.json" | {"json_path", "chrome_path", "memory", "profile", "profile_path"}
+        -> wall time, rows in/out and peak memory per stage (load_processed, apply_filters,
+           attach_weights, attach_trait, ecospectrum, merge, stats, plot, ...) in df.attrs["trace"]
+      - inside an active core.trace.tracing() block the whole run is recorded as one nested stage
     """
+    opts = trace_options(getattr(spec, "trace", None))
+    stage_name = f"run_scenario:{getattr(spec, 'name', '')}"
+    if opts is None:
+        if current_trace() is None:
+            return _run_scenario(spec)
+        with trace_stage(stage_name) as st:
+            result, plot_path = _run_scenario(spec)
+            st.rows_out = len(result)
+        return result, plot_path
+
+    with tracing(stage_name, **opts) as tr:
+        out = _run_scenario(spec)
+    return attach_trace(out, tr)
 
+
+def _run_scenario(spec: ScenarioSpec):
+    """run_scenario without the tracing wrapper."""
     analysis_kind = getattr(spec, "analysis", "aggregate")
 
     # ------------------------------------------------------------
@@ -148,99 +521,29 @@ def run_scenario(spec: ScenarioSpec):
         scale = getattr(spec, "trait_scale", "M")
         metric_name = getattr(spec, "eco_metric", "cwm")
 
-        # ключ кеша — ТОЛЬКО eco-постановка (без period/lag/window/climate_var!)
-        eco_cache_key = {
-            "analysis": "eco_vs_climate",
-            "filters": eco_filters,
-            "trait_scale": scale,
-            "eco_metric": metric_name,
-        }
-
-        # какие файлы определяют eco_year (если поменяются — кеш инвалидируется)
-        eco_input_paths = [
-            PROJECT_ROOT / "data" / "processed" / "observations.csv",
-            PROJECT_ROOT / "data" / "processed" / "descriptions.csv",
-            PROJECT_ROOT / "data" / "processed" / "profiles.csv",  # если нет — ок, будет MISSING
-        ]
-
-        def _compute_eco_year() -> pd.DataFrame:
-            df = load_processed()
-
-            if eco_filters:
-                df = apply_filters(df, eco_filters)
-
-            # only abundance rows
-            df = df[df["abundance_class"].notna()].copy()
-
-            # weights
-            df = attach_weights(df, abundance_col="abundance_class", out_col="w")
-            df = df[df["w"].notna() & (df["w"] > 0)].copy()
-
-            # attach trait scale (default M)
-            df = attach_trait(df, scale=scale)
-
-            # ecospectrum per description
-            eco = compute_ecospectrum_by_description(df, trait_col=scale, weight_col="w")
-
-            # merge description metadata (need year)
-            meta_cols = ["description_id", "year"]
-            meta = df[meta_cols].drop_duplicates("description_id")
-            eco2 = eco.merge(meta, on="description_id", how="left")
-
-            # aggregate eco by year
-            eco_year_local = (
-                eco2.groupby(["year"], as_index=False)[metric_name]
-                .mean()
-                .rename(columns={metric_name: "eco"})
-                .sort_values("year")
-            )
-            return eco_year_local
-
-        # ВОТ ОНА — “одна строка” по смыслу: eco_year теперь берётся из кеша
-        eco_year = get_or_compute_df(
-            namespace="eco_year",
-            payload=eco_cache_key,
-            input_paths=eco_input_paths,
-            compute_fn=_compute_eco_year,
-            use_disk=True,
-            use_memory=True,
-        )
+        # eco_year берётся из кеша (см. load_eco_year)
+        eco_year = load_eco_year(eco_filters, scale, metric_name, getattr(spec, "bootstrap", None))
 
-        # ---- (B) load climate from unified meteo_periods CSV ----
+        # ---- (B) climate signal from the cached climate cube ----
         csv_path = Path(getattr(spec, "climate_csv", None) or METEO_PERIODS_CSV)
         period = getattr(spec, "period", None) or "JJA"
         climate_var = getattr(spec, "climate_var", "pedya")  # pedya / t_mean_c / precip_mm
-
-        dfc = load_meteo_periods(csv_path)
-        dfc = dfc[dfc["period"] == period].copy()
-
-        if climate_var not in dfc.columns:
+        if climate_var not in CLIMATE_VARS:
             raise KeyError(
                 f"Unknown climate_var='{climate_var}'. "
-                f"Expected one of: pedya, t_mean_c, precip_mm. "
-                f"Found columns: {list(dfc.columns)}"
+                f"Expected one of: {', '.join(CLIMATE_VARS)}."
             )
 
-        clim = (
-            dfc[["year", climate_var]]
-            .rename(columns={climate_var: "clim"})
-            .dropna(subset=["year", "clim"])
-            .sort_values("year")
-        )
-
-        # ---- (C) join on year ----
-        joined = eco_year.merge(clim, on="year", how="inner").sort_values("year")
-
-        # ---- (D) apply window + lag to climate signal ----
+        # ---- (C) window + lag in calendar years (gaps stay gaps), see core.climate_cube ----
         window = int(getattr(spec, "window", 1) or 1)
         lag = int(getattr(spec, "lag", 0) or 0)
+        clim = climate_signal(climate_var, period, window=window, lag=lag, csv_path=csv_path)
 
-        # rolling mean over window years (aligned at current year), then shift by lag
-        clim_roll = joined["clim"].rolling(window=window, min_periods=window).mean()
-        joined["clim_signal"] = clim_roll.shift(lag)
-
-        # drop rows where signal undefined
-        joined = joined.dropna(subset=["eco", "clim_signal"]).copy()
+        # ---- (D) join on year, drop rows where eco or signal undefined ----
+        with trace_stage("join", eco_year) as st:
+            joined = eco_year.merge(clim, on="year", how="inner").sort_values("year")
+            joined = joined.dropna(subset=["eco", "clim_signal"]).copy()
+            st.rows_out = len(joined)
 
         # ---- (E) correlation numbers + p-values ----
         n_years = int(len(joined))
@@ -252,61 +555,59 @@ def run_scenario(spec: ScenarioSpec):
         pearson_p = float("nan")
         spearman_p = float("nan")
         pearson_p_shift = float("nan")
+        # поправка на автокорреляцию (как в core.grid_engine): лаг-1 автокорреляции,
+        # эффективный n и p по Bretherton (n_eff) и Pyper-Peterman (n_eff_pp)
+        ess = dict.fromkeys(["ac1_eco", "ac1_clim", "n_eff", "pearson_p_eff", "n_eff_pp", "pearson_p_pp"], float("nan"))
+
+        with trace_stage("stats", n_years):
+            if n_years >= 3:
+                x = joined["eco"].to_numpy(dtype=float)
+                y = joined["clim_signal"].to_numpy(dtype=float)
 
-        if n_years >= 3:
-            x = joined["eco"].to_numpy(dtype=float)
-            y = joined["clim_signal"].to_numpy(dtype=float)
-
-            # SciPy: r and p-values
-            pear = stats.pearsonr(x, y)
-            spear = stats.spearmanr(x, y)
-
-            pearson = float(pear.statistic)
-            pearson_p = float(pear.pvalue)
-
-            spearman = float(spear.statistic)
-            spearman_p = float(spear.pvalue)
-
-            # Robust p-value: circular shift permutation (keeps temporal structure of y)
-            def circular_shift_pvalue(x, y, n_perm=999, seed=42):
-                x = np.asarray(x, float)
-                y = np.asarray(y, float)
-                n = len(x)
-                if n < 4:
-                    return float("nan")
-                rng = np.random.default_rng(seed)
-                r_obs = stats.pearsonr(x, y).statistic
-                shifts = rng.integers(1, n, size=n_perm)  # exclude 0 shift
-                cnt = 0
-                for k in shifts:
-                    r_k = stats.pearsonr(x, np.roll(y, k)).statistic
-                    if abs(r_k) >= abs(r_obs):
-                        cnt += 1
-                return (cnt + 1) / (n_perm + 1)  # add-one smoothing
-
-            pearson_p_shift = circular_shift_pvalue(x, y, n_perm=999, seed=42)
+                # SciPy: r and p-values
+                pear = stats.pearsonr(x, y)
+                spear = stats.spearmanr(x, y)
+
+                pearson = float(pear.statistic)
+                pearson_p = float(pear.pvalue)
+
+                spearman = float(spear.statistic)
+                spearman_p = float(spear.pvalue)
+
+                # Robust p-value: circular shift permutation (keeps temporal structure of y)
+                pearson_p_shift = circular_shift_pvalue(x, y, n_perm=999, seed=42, mode=getattr(spec, "shift_mode", SHIFT_MODE_DEFAULT))
+
+                X, Y = x[None, :], y[None, :]
+                ess["ac1_eco"] = float(autocorrelations(X, 1)[0, 0])
+                ess["ac1_clim"] = float(autocorrelations(Y, 1)[0, 0])
+                for n_col, p_col, method in (("n_eff", "pearson_p_eff", "bretherton"), ("n_eff_pp", "pearson_p_pp", "pyper_peterman")):
+                    n_eff = effective_n(X, Y, method)
+                    ess[n_col] = float(n_eff[0])
+                    ess[p_col] = float(effective_n_pvalues(np.array([pearson]), n_eff)[0])
 
         # ---- (F) plot scatter ----
         plot_path = None
         if getattr(spec, "plot", None):
-            # allow auto-title if none provided
-            if not spec.plot.get("title"):
-                spec.plot["title"] = (
-                    f"{metric_name}({scale}) vs {climate_var}({period}) | "
-                    f"lag={lag}, window={window} | "
-                    f"r={pearson:.2f} (p={pearson_p:.3g}, p_shift={pearson_p_shift:.3g}), "
-                    f"ρ={spearman:.2f} (p={spearman_p:.3g}), n={n_years}"
-                )
+            # allow auto-title if none provided (spec.plot не меняем: одна спека/словарь
+            # может одновременно обрабатываться в нескольких потоках, см. core.async_runner)
+            title = spec.plot.get("title") or (
+                f"{metric_name}({scale}) vs {climate_var}({period}) | "
+                f"lag={lag}, window={window} | "
+                f"r={pearson:.2f} (p={pearson_p:.3g}, p_shift={pearson_p_shift:.3g}), "
+                f"ρ={spearman:.2f} (p={spearman_p:.3g}), n={n_years}"
+            )
 
             out_name_default = f"eco_vs_{climate_var}_{period}_lag{lag}_win{window}"
 
             plot_path = plot_timeseries(
-                joined.rename(columns={"clim_signal": "x", "eco": "y"}),
+                joined.rename(columns={"clim_signal": "x", "eco": "y", "eco_lo": "y_lo", "eco_hi": "y_hi"}),
                 {
                     "kind": "scatter",
                     "x": "x",
                     "y": "y",
-                    "title": spec.plot.get("title", ""),
+                    "y_lo": "y_lo",
+                    "y_hi": "y_hi",
+                    "title": title,
                     "out_name": spec.plot.get("out_name", out_name_default),
                 },
             )
@@ -319,6 +620,9 @@ def run_scenario(spec: ScenarioSpec):
         joined["spearman_rho"] = spearman
         joined["spearman_p"] = spearman_p
 
+        for c, v in ess.items():
+            joined[c] = v
+
         joined["n_years"] = n_years
         joined["year_min"] = year_min
         joined["year_max"] = year_max
@@ -353,44 +657,37 @@ def run_scenario(spec: ScenarioSpec):
     # 2) ECOSPECTRUM (Ellenberg)
     # -------------------------
     if analysis_kind == "ecospectrum":
-        df = load_processed()
-
-        # (A) filters before ecospectrum (river/geomorph/impact/year...)
-        if spec.filters:
-            df = apply_filters(df, spec.filters)
-
-        # (B) only abundance rows
-        df = df[df["abundance_class"].notna()].copy()
-
-        # (C) weights
-        df = attach_weights(df, abundance_col="abundance_class", out_col="w")
-        df = df[df["w"].notna() & (df["w"] > 0)].copy()
-
-        # (D) attach trait scale (default M)
+        # (A)-(E) filters, abundance rows, weights, traits -> ecospectrum per description
         scale = getattr(spec, "trait_scale", "M")
-        df = attach_trait(df, scale=scale)
+        schemes = resolve_weight_schemes(getattr(spec, "weight_schemes", None))
+        if schemes:
+            return _run_ecospectrum_schemes(spec, scale, schemes)
+        # (F) per-description table with metadata (cached per filters, scale)
+        eco2 = load_eco_table(spec.filters, scale)
 
-        # (E) ecospectrum per description
-        eco = compute_ecospectrum_by_description(df, trait_col=scale, weight_col="w")
+        # (G)-(H) aggregate + optional CI + plot
+        return aggregate_ecospectrum(spec, eco2)
 
-        # (F) merge description metadata
-        meta_cols = ["description_id", "year", "geomorph_level", "impact_type", "source_file"]
-        meta = df[meta_cols].drop_duplicates("description_id")
-        eco2 = eco.merge(meta, on="description_id", how="left")
+    # -------------------------
+    # 2b) SPECTRUM (full histogram per year)
+    # -------------------------
+    if analysis_kind == "spectrum":
+        scale = getattr(spec, "trait_scale", "M")
+        spectra = load_spectra(scale)
 
-        # (G) aggregate by scenario groupby (usually year)
-        metric_name = getattr(spec, "eco_metric", "cwm")
-        groupby = spec.groupby or ["year"]
+        # фильтры — на уровне описаний: берём только их id и год, строки видов не нужны
+        meta = load_processed()
+        if spec.filters:
+            meta = apply_filters(meta, spec.filters)
+        meta = meta[["description_id", "year"]].drop_duplicates("description_id")
+        sel = spectra.merge(meta, on="description_id", how="inner")
 
-        result = (
-            eco2.groupby(groupby, as_index=False)[metric_name]
-            .mean()
-            .sort_values(groupby)
-        )
+        result = pool_spectra(sel.drop(columns="year"), sel["year"].to_numpy(), normalize=True)
 
         plot_path = None
         if spec.plot:
-            plot_path = plot_timeseries(result, spec.plot)
+            plot_spec = {"kind": "spectrum", "x": "year", "y": scale, **spec.plot}
+            plot_path = plot_timeseries(result, plot_spec)
 
         return result, plot_path
 
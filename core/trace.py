@@ -0,0 +1,339 @@
+# core/trace.py
+"""
+Трассировка стадий сценария: время, строки на входе/выходе, пик памяти.
+
+    with tracing("my_run", json_path="trace.json", chrome_path="trace.chrome.json") as tr:
+        df, plot = run_scenario(spec)
+    print(tr.summary())
+
+или просто spec.trace = True (см. run_scenario / run_panel_model): трасса кладётся
+в df.attrs["trace"] (dict, см. Trace.to_dict).
+
+Стадии размечаются декоратором @traced("name") или блоком `with trace_stage("name") as st:
+st.rows_out = len(df)`. Без активной трассы (contextvar) разметка почти ничего не
+стоит — одна проверка ContextVar. Вложенные стадии допускаются (depth).
+
+Память — tracemalloc (только аллокации Python/NumPy/pandas после старта трассы):
+peak_bytes — пик сверх уровня на входе в стадию. tracemalloc заметно замедляет
+расчёт, поэтому memory=False отключает его (остаются время и строки). tracemalloc
+общий на процесс: он работает, пока открыта хотя бы одна трасса с memory=True, а
+при нескольких трассах одновременно (потоки) пики стадий — по всему процессу.
+profile=True — дополнительно cProfile на всё время трассы (Trace.profile_text,
+profile_path — .prof для snakeviz / pstats).
+
+Chrome-trace (chrome_path) открывается в chrome://tracing или https://ui.perfetto.dev.
+Трасса живёт в контексте текущего потока/задачи: стадии, выполняемые в чужих
+потоках (пулы scenario_dag / async_runner), в неё не попадают.
+"""
+from __future__ import annotations
+
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+import pandas as pd
+
+_CURRENT: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("scenario_trace", default=None)
+
+PROFILE_TOP = 30  # строк pstats в Trace.profile_text
+
+# tracemalloc глобален: запускаем его при первой трассе с memory=True (если он ещё не
+# запущен кем-то другим) и останавливаем только при выходе последней такой трассы
+_TM_LOCK = threading.Lock()
+_TM_USERS = 0
+_TM_OWNED = False
+
+
+def _tracemalloc_acquire() -> None:
+    global _TM_USERS, _TM_OWNED
+    with _TM_LOCK:
+        if _TM_USERS == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _TM_OWNED = True
+        _TM_USERS += 1
+
+
+def _tracemalloc_release() -> None:
+    global _TM_USERS, _TM_OWNED
+    with _TM_LOCK:
+        _TM_USERS -= 1
+        if _TM_USERS == 0 and _TM_OWNED:
+            tracemalloc.stop()
+            _TM_OWNED = False
+
+
+def _n_rows(obj: Any) -> Optional[int]:
+    """Строки результата/аргумента: DataFrame / Series / ndarray, либо первый элемент кортежа (df, plot_path)."""
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(len(obj))
+    shape = getattr(obj, "shape", None)
+    if shape:
+        return int(shape[0])
+    return None
+
+
+@dataclass
+class TraceEvent:
+    name: str
+    start: float                      # с от начала трассы
+    seconds: float = 0.0
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    peak_bytes: Optional[int] = None  # пик памяти сверх уровня на входе (tracemalloc)
+    depth: int = 0
+    thread: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class _OpenStage:
+    event: TraceEvent
+    t0: float
+    mem0: int = 0
+    peak: int = 0
+
+
+@dataclass
+class Trace:
+    name: str
+    memory: bool = True
+    events: list[TraceEvent] = field(default_factory=list)
+    seconds: float = 0.0
+    profile_text: Optional[str] = None
+    _t0: float = field(default_factory=time.perf_counter, repr=False)
+    _stack: list[_OpenStage] = field(default_factory=list, repr=False)
+
+    # --- память: пик tracemalloc сбрасывается на каждой границе стадии,
+    #     поэтому перед сбросом раздаём его всем открытым стадиям
+    def _collect_peak(self) -> None:
+        if not (self.memory and tracemalloc.is_tracing()):
+            return
+        _, peak = tracemalloc.get_traced_memory()
+        for st in self._stack:
+            st.peak = max(st.peak, peak)
+        tracemalloc.reset_peak()
+
+    def _open(self, name: str, rows_in: Optional[int]) -> _OpenStage:
+        self._collect_peak()
+        now = time.perf_counter()
+        ev = TraceEvent(name, now - self._t0, rows_in=rows_in, depth=len(self._stack), thread=threading.get_ident())
+        st = _OpenStage(ev, now)
+        if self.memory and tracemalloc.is_tracing():
+            st.mem0 = st.peak = tracemalloc.get_traced_memory()[0]
+        self._stack.append(st)
+        return st
+
+    def _close(self, st: _OpenStage) -> None:
+        self._collect_peak()
+        st.event.seconds = time.perf_counter() - st.t0
+        if self.memory and tracemalloc.is_tracing():
+            st.event.peak_bytes = max(0, st.peak - st.mem0)
+        if self._stack and self._stack[-1] is st:
+            self._stack.pop()
+        self.events.append(st.event)
+
+    # --- выгрузка
+    def to_dict(self) -> dict:
+        events = sorted(self.events, key=lambda e: e.start)
+        out = {"name": self.name, "seconds": self.seconds, "events": [asdict(e) for e in events]}
+        if self.profile_text:
+            out["profile"] = self.profile_text
+        return out
+
+    def summary(self) -> pd.DataFrame:
+        """Стадии в порядке старта: name | depth | seconds | rows_in | rows_out | peak_mb | error."""
+        cols = ["name", "depth", "start", "seconds", "rows_in", "rows_out", "peak_mb", "error"]
+        rows = [
+            {**asdict(e), "peak_mb": None if e.peak_bytes is None else e.peak_bytes / 2**20}
+            for e in sorted(self.events, key=lambda e: e.start)
+        ]
+        return pd.DataFrame(rows, columns=cols) if rows else pd.DataFrame(columns=cols)
+
+    def write_json(self, path: str | Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), ensure_ascii=False, indent=2), encoding="utf-8")
+        return path
+
+    def write_chrome(self, path: str | Path) -> Path:
+        """Chrome Trace Event format: complete events ("ph": "X"), время в микросекундах."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pid = os.getpid()
+        events = [
+            {
+                "name": e.name,
+                "cat": "stage",
+                "ph": "X",
+                "ts": round(e.start * 1e6, 3),
+                "dur": round(e.seconds * 1e6, 3),
+                "pid": pid,
+                "tid": e.thread,
+                "args": {k: v for k, v in (
+                    ("rows_in", e.rows_in), ("rows_out", e.rows_out),
+                    ("peak_bytes", e.peak_bytes), ("error", e.error),
+                ) if v is not None},
+            }
+            for e in self.events
+        ]
+        meta = {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.name}}
+        path.write_text(json.dumps({"traceEvents": [meta] + events}, ensure_ascii=False), encoding="utf-8")
+        return path
+
+
+def current_trace() -> Optional[Trace]:
+    return _CURRENT.get()
+
+
+class _Stage:
+    """Ручка открытой стадии: st.rows_out = ... внутри with trace_stage(...)."""
+
+    __slots__ = ("rows_in", "rows_out")
+
+    def __init__(self, rows_in: Optional[int]) -> None:
+        self.rows_in = rows_in
+        self.rows_out: Optional[int] = None
+
+
+@contextmanager
+def trace_stage(name: str, rows_in: Any = None) -> Iterator[_Stage]:
+    """
+    Стадия активной трассы (без трассы — пустой блок). rows_in — число или объект
+    (DataFrame и т.п., берётся len); rows_out выставляется внутри блока.
+    """
+    stage = _Stage(rows_in if isinstance(rows_in, int) or rows_in is None else _n_rows(rows_in))
+    tr = _CURRENT.get()
+    if tr is None:
+        yield stage
+        return
+
+    st = tr._open(name, stage.rows_in)
+    try:
+        yield stage
+    except BaseException as e:
+        st.event.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        st.event.rows_in = stage.rows_in
+        st.event.rows_out = stage.rows_out
+        tr._close(st)
+
+
+def traced(name: Optional[str] = None) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Декоратор стадии: rows_in — длина первого аргумента-таблицы, rows_out — длина результата.
+    Ставить снаружи @memoize, чтобы попадание в кеш тоже было видно как короткая стадия.
+    """
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        stage_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _CURRENT.get() is None:
+                return fn(*args, **kwargs)
+            rows_in = next((n for n in map(_n_rows, args) if n is not None), None)
+            with trace_stage(stage_name, rows_in) as st:
+                out = fn(*args, **kwargs)
+                st.rows_out = _n_rows(out)
+            return out
+
+        return wrapper
+
+    return decorator
+
+
+def trace_options(value: Any) -> Optional[dict]:
+    """
+    spec.trace -> kwargs для tracing() или None:
+      None / False -> None; True -> {}; "path.json" -> {"json_path": ...};
+      dict -> как есть ({"json_path", "chrome_path", "memory", "profile", "profile_path"}).
+    """
+    if value is None or value is False:
+        return None
+    if value is True:
+        return {}
+    if isinstance(value, (str, Path)):
+        return {"json_path": value}
+    if isinstance(value, dict):
+        unknown = set(value) - {"json_path", "chrome_path", "memory", "profile", "profile_path"}
+        if unknown:
+            raise KeyError(f"Unknown trace options: {sorted(unknown)}")
+        return dict(value)
+    raise TypeError(f"trace must be bool, path or dict, got {type(value).__name__}")
+
+
+@contextmanager
+def tracing(
+    name: str,
+    *,
+    memory: bool = True,
+    profile: bool = False,
+    json_path: str | Path | None = None,
+    chrome_path: str | Path | None = None,
+    profile_path: str | Path | None = None,
+) -> Iterator[Trace]:
+    """
+    Активная трасса на время блока (в текущем контексте). По выходу — запись в json_path /
+    chrome_path (если заданы). tracemalloc запускается, если ещё не запущен, и
+    останавливается, когда закрылась последняя трасса с memory=True.
+    """
+    tr = Trace(name, memory=memory)
+    if memory:
+        _tracemalloc_acquire()
+    prof = cProfile.Profile() if profile else None
+    token = _CURRENT.set(tr)
+    root = tr._open(name, None)
+    if prof is not None:
+        prof.enable()
+    try:
+        yield tr
+    except BaseException as e:
+        root.event.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if prof is not None:
+            prof.disable()
+        tr._close(root)
+        tr.seconds = root.event.seconds
+        _CURRENT.reset(token)
+        if memory:
+            _tracemalloc_release()
+        if prof is not None:
+            buf = io.StringIO()
+            pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            tr.profile_text = buf.getvalue()
+            if profile_path:
+                Path(profile_path).parent.mkdir(parents=True, exist_ok=True)
+                prof.dump_stats(str(profile_path))
+        if json_path:
+            tr.write_json(json_path)
+        if chrome_path:
+            tr.write_chrome(chrome_path)
+
+
+def attach_trace(result: Any, tr: Trace) -> Any:
+    """
+    Трасса в df.attrs["trace"] (df — сам результат или первый элемент (df, plot_path)).
+    attrs пишутся в неглубокую копию: df может быть объектом из кеша (memoize / _MEM),
+    и трасса не должна всплывать в следующих попаданиях.
+    """
+    is_tuple = isinstance(result, tuple) and bool(result)
+    df = result[0] if is_tuple else result
+    if not isinstance(df, pd.DataFrame):
+        return result
+    df = df.copy(deep=False)
+    df.attrs = {**df.attrs, "trace": tr.to_dict()}
+    return (df,) + result[1:] if is_tuple else df
@@ -1,37 +1,91 @@
 from pathlib import Path
 import pandas as pd
 
+from core.cache import memoize
+from core.trace import traced
+from core.registry_store import ELLENBERG_VALUES_SHEET, ELLENBERG_XLSX, read_ellenberg_values, registry_table
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
-ELLENBERG_XLSX = PROJECT_ROOT / "data" / "external" / "Indicator_values_Tichy_et_al.xlsx"
+
+# Шкалы Элленберга для "всех сразу": свет, температура, влажность, реакция, азот, засолённость
+TRAIT_SCALES = ("L", "T", "M", "R", "N", "S")
+# влажность в разных источниках обозначают M или F
+SCALE_ALIASES = {"F": "M", "M": "F"}
 
 
+def _ellenberg_values(xlsx_path: Path) -> pd.DataFrame:
+    """
+    Лист 'Tab-OriginalNamesValues' как species | шкалы: стандартный файл — из
+    скомпилированного реестра (core.registry_store), другой путь — читаем напрямую.
+    """
+    if Path(xlsx_path) == ELLENBERG_XLSX:
+        return registry_table("ellenberg")
+    return read_ellenberg_values(xlsx_path)
+
+
+# Кешируются справочники "вид -> значения шкал" (маленькие, ключ — шкалы + сигнатура xlsx),
+# а не результат attach_trait(s): иначе каждый вызов хешировал бы всю таблицу наблюдений,
+# а каждый набор фильтров писал бы на диск свою копию объединённой таблицы.
+@memoize(
+    "ellenberg_scale",
+    input_paths=lambda scale="M", xlsx_path=ELLENBERG_XLSX: [xlsx_path],
+    use_disk=False,
+)
 def load_ellenberg_scale(scale: str = "M", xlsx_path: Path = ELLENBERG_XLSX) -> pd.DataFrame:
     """
     Tichy et al. файл: берём лист 'Tab-OriginalNamesValues'.
     Возвращает: species | M (или L/T/R/N/S)
     """
-    sheet = "Tab-OriginalNamesValues"
-    df = pd.read_excel(xlsx_path, sheet_name=sheet)
+    df = _ellenberg_values(xlsx_path)
 
-    if "Taxon" not in df.columns:
-        raise KeyError(f"Не нашёл 'Taxon' на листе '{sheet}'.")
     if scale not in df.columns:
-        raise KeyError(f"Не нашёл шкалу '{scale}' на листе '{sheet}'.")
-
-    out = df[["Taxon", scale]].copy()
-    out.columns = ["species", scale]
-
-    out["species"] = (
-        out["species"].astype("string")
-        .str.replace("\u00A0", " ", regex=False)
-        .str.replace(r"\s+", " ", regex=True)
-        .str.strip()
-    )
-    out[scale] = pd.to_numeric(out[scale], errors="coerce")
+        raise KeyError(f"Не нашёл шкалу '{scale}' на листе '{ELLENBERG_VALUES_SHEET}'.")
+
+    out = df[["species", scale]].copy()
     out = out.dropna(subset=[scale]).drop_duplicates(subset=["species"])
     return out
 
 
+@memoize(
+    "ellenberg_scales",
+    input_paths=lambda scales=TRAIT_SCALES, xlsx_path=ELLENBERG_XLSX: [xlsx_path],
+    use_disk=False,
+)
+def load_ellenberg_scales(
+    scales: tuple[str, ...] | list[str] = TRAIT_SCALES,
+    xlsx_path: Path = ELLENBERG_XLSX,
+) -> pd.DataFrame:
+    """
+    Все нужные шкалы за одно чтение листа 'Tab-OriginalNamesValues'.
+    Возвращает: species | L | T | M | ... (только шкалы, которые есть в файле;
+    F/M подставляются друг за друга). Для каждой шкалы — те же правила, что в
+    load_ellenberg_scale (NaN выкидываем, один вид = одно значение).
+    """
+    df = _ellenberg_values(xlsx_path)
+
+    out = None
+    for scale in scales:
+        src = scale if scale in df.columns else SCALE_ALIASES.get(scale)
+        if src not in df.columns:
+            continue
+        one = pd.DataFrame({"species": df["species"], scale: df[src]})
+        one = one.dropna(subset=[scale]).drop_duplicates(subset=["species"])
+        out = one if out is None else out.merge(one, on="species", how="outer")
+
+    if out is None:
+        raise KeyError(f"Не нашёл ни одной из шкал {list(scales)} на листе '{ELLENBERG_VALUES_SHEET}'.")
+    return out
+
+
+def available_scales(
+    scales: tuple[str, ...] | list[str] = TRAIT_SCALES,
+    xlsx_path: Path = ELLENBERG_XLSX,
+) -> list[str]:
+    """Шкалы из scales, которые есть на листе (сами или через F/M), в исходном порядке."""
+    cols = set(_ellenberg_values(xlsx_path).columns) - {"species"}
+    return [s for s in scales if s in cols or SCALE_ALIASES.get(s) in cols]
+
+
 def simplify_species_name(s: pd.Series) -> pd.Series:
     """
     Простая эвристика для матчинга: убираем agg./s.l./subsp./ssp./cf.
@@ -41,8 +95,25 @@ def simplify_species_name(s: pd.Series) -> pd.Series:
     return s
 
 
-def attach_trait(df: pd.DataFrame, scale: str = "M") -> pd.DataFrame:
-    ell = load_ellenberg_scale(scale=scale)
+def _merge_traits(df: pd.DataFrame, ell: pd.DataFrame) -> pd.DataFrame:
     out = df.copy()
     out["species"] = simplify_species_name(out["species"])
     return out.merge(ell, on="species", how="left")
+
+
+@traced("attach_trait")
+def attach_trait(df: pd.DataFrame, scale: str = "M") -> pd.DataFrame:
+    return _merge_traits(df, load_ellenberg_scale(scale=scale))
+
+
+@traced("attach_traits")
+def attach_traits(df: pd.DataFrame, scales: tuple[str, ...] = TRAIT_SCALES) -> pd.DataFrame:
+    """
+    Как attach_trait, но присоединяет сразу матрицу признаков (по колонке на шкалу).
+    """
+    return _merge_traits(df, load_ellenberg_scales(scales=tuple(scales)))
+
+
+def scales_with(scale: str) -> tuple[str, ...]:
+    """TRAIT_SCALES + scale (если её там нет) — чтобы один проход покрывал и запрошенную шкалу."""
+    return TRAIT_SCALES if scale in TRAIT_SCALES else TRAIT_SCALES + (scale,)
@@ -0,0 +1,244 @@
+# core/warmup.py
+"""
+Прогрев кеша: заранее считаем то, что UI посчитал бы на первом клике
+(eco_year, экоспектры по описаниям, panel-eco датасеты) для доменов
+выпадающих списков MainWindow.
+
+Запуск: python scripts/warm_cache.py --workers 4
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+
+import pandas as pd
+
+from core.analysis_engine import load_processed
+from core.cache import DEFAULT_CACHE_DIR, file_signature, make_cache_key
+from core.eco_store import STORE_VERSION
+from core.panel_dataset import PANEL_ECO_INPUT_PATHS, PANEL_ECO_VERSION
+from core.scenario_runner import (
+    AFFORESTATION_CHOICES,
+    ECO_METRICS,
+    ECO_TABLE_VERSION,
+    ELLENBERG_SCALES,
+    SPECTRUM_INPUT_PATHS,
+    build_ui_filters,
+    load_eco_table,
+    load_eco_year,
+)
+from core.traits import available_scales
+
+WARMUP_STATE = DEFAULT_CACHE_DIR / "warmup_done.jsonl"
+
+
+@dataclass(frozen=True)
+class WarmupTask:
+    kind: str                      # "eco" (экоспектр + eco_year по метрикам) | "panel"
+    scale: str
+    metrics: tuple[str, ...]
+    filters: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def task_id(self) -> str:
+        return json.dumps(
+            {"kind": self.kind, "scale": self.scale, "metrics": list(self.metrics), "filters": self.filters},
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+
+
+def ui_filter_domains(df: pd.DataFrame) -> dict[str, list]:
+    """
+    Значения выпадающих списков фильтров (как в MainWindow.populate_dropdowns).
+    """
+    def _values(col: str) -> list[str]:
+        vals = df[col].astype("string").dropna().unique().tolist()
+        return sorted(x for x in vals if x and x != "nan")
+
+    return {
+        "profile": _values("source_file"),
+        "geomorph_level": _values("geomorph_level"),
+        "impact_type": _values("impact_type"),
+        "afforestation": [codes for _, codes in AFFORESTATION_CHOICES if codes is not None],
+    }
+
+
+def plan_warmup(
+    domains: dict[str, list],
+    *,
+    scales: Iterable[str] = ELLENBERG_SCALES,
+    metrics: Iterable[str] = ECO_METRICS,
+    full_grid: bool = False,
+    include_panel: bool = True,
+) -> list[WarmupTask]:
+    """
+    full_grid=False: "All" + каждое значение каждого фильтра по отдельности
+                     (типичные первые клики в UI);
+    full_grid=True:  полное декартово произведение фильтров (может быть очень много).
+    """
+    scales = list(scales)
+    metrics = tuple(metrics)
+
+    dims = ["profile", "geomorph_level", "impact_type", "afforestation"]
+    all_value = {"profile": "All", "geomorph_level": "All", "impact_type": "All", "afforestation": None}
+
+    combos: list[dict[str, Any]] = [dict(all_value)]
+    if full_grid:
+        axes = [[all_value[d]] + list(domains.get(d, [])) for d in dims]
+        combos = [dict(zip(dims, values)) for values in itertools.product(*axes)]
+    else:
+        for d in dims:
+            for v in domains.get(d, []):
+                combos.append(dict(all_value, **{d: v}))
+
+    tasks: list[WarmupTask] = []
+    seen: set[str] = set()
+    for combo in combos:
+        filters = build_ui_filters(
+            profile=combo["profile"],
+            geomorph_level=combo["geomorph_level"],
+            impact_type=combo["impact_type"],
+            afforestation=combo["afforestation"],
+        )
+        for scale in scales:
+            t = WarmupTask(kind="eco", scale=scale, metrics=metrics, filters=filters)
+            if t.task_id not in seen:
+                seen.add(t.task_id)
+                tasks.append(t)
+
+    if include_panel:
+        # panel-eco строится по полным данным, фильтры UI применяются потом (см. panel_model)
+        for scale in scales:
+            for m in metrics:
+                tasks.append(WarmupTask(kind="panel", scale=scale, metrics=(m,)))
+
+    return tasks
+
+
+def run_task(task: WarmupTask) -> str:
+    """
+    Выполняет одну задачу прогрева (в отдельном процессе). Все результаты
+    оседают в data/cache через те же функции, что вызывает UI.
+    """
+    if task.kind == "eco":
+        # те же вызовы, что и в run_scenario: таблица по описаниям (все метрики) + годовые ряды из неё
+        eco_table = load_eco_table(task.filters, task.scale)
+        for m in task.metrics:
+            load_eco_year(task.filters, task.scale, m, eco_table=eco_table)
+        return task.task_id
+
+    if task.kind == "panel":
+        from core.panel_model import _ensure_panel_eco
+
+        _ensure_panel_eco(task.scale, task.metrics[0])
+        return task.task_id
+
+    raise ValueError(f"Unknown warmup task kind: {task.kind}")
+
+
+def warmup_signature() -> str:
+    """
+    Подпись входных файлов (размер + mtime) и версий расчёта, под которыми задачи
+    помечаются выполненными: пришли новые данные или сменилась версия — прогрев
+    считается заново без --restart.
+    """
+    paths = list(dict.fromkeys(map(str, SPECTRUM_INPUT_PATHS + PANEL_ECO_INPUT_PATHS)))
+    versions = {"eco_table": ECO_TABLE_VERSION, "store": STORE_VERSION, "panel_eco": PANEL_ECO_VERSION}
+    return make_cache_key("warmup", versions, data_sig=file_signature(paths))
+
+
+def _load_done(state_path: Path, signature: str) -> set[str]:
+    """task_id, выполненные под той же подписью данных (строки старых прогонов не считаются)."""
+    if not state_path.exists():
+        return set()
+    done = set()
+    for line in state_path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line:
+            rec = json.loads(line)
+            if rec.get("signature") == signature:
+                done.add(rec["task_id"])
+    return done
+
+
+def run_warmup(
+    tasks: list[WarmupTask],
+    *,
+    workers: int = 1,
+    state_path: Path = WARMUP_STATE,
+    restart: bool = False,
+    on_progress: Optional[Callable[[int, int, WarmupTask, Optional[str]], None]] = None,
+) -> dict[str, int]:
+    """
+    Прогоняет задачи (параллельно при workers > 1) и дописывает выполненные в state_path
+    вместе с warmup_signature(), чтобы повторный запуск на тех же данных продолжил с места
+    остановки (после обновления данных — всё заново). Ошибка одной задачи
+    не останавливает остальные. on_progress(k, total, task, error_or_None).
+    """
+    state_path = Path(state_path)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    if restart and state_path.exists():
+        state_path.unlink()
+
+    signature = warmup_signature()
+    done = _load_done(state_path, signature)
+    todo = [t for t in tasks if t.task_id not in done]
+    summary = {"total": len(tasks), "skipped": len(tasks) - len(todo), "ok": 0, "failed": 0}
+
+    def _record(task: WarmupTask, error: Optional[str], k: int) -> None:
+        if error is None:
+            summary["ok"] += 1
+            with state_path.open("a", encoding="utf-8") as f:
+                rec = {"task_id": task.task_id, "signature": signature, "ts": time.time()}
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        else:
+            summary["failed"] += 1
+        if on_progress:
+            on_progress(k, len(todo), task, error)
+
+    if workers <= 1:
+        for k, task in enumerate(todo, start=1):
+            try:
+                run_task(task)
+                _record(task, None, k)
+            except Exception as e:
+                _record(task, f"{type(e).__name__}: {e}", k)
+        return summary
+
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futures = {ex.submit(run_task, t): t for t in todo}
+        for k, fut in enumerate(as_completed(futures), start=1):
+            task = futures[fut]
+            try:
+                fut.result()
+                _record(task, None, k)
+            except Exception as e:
+                _record(task, f"{type(e).__name__}: {e}", k)
+    return summary
+
+
+def warmup_from_processed(**kwargs: Any) -> dict[str, Any]:
+    """
+    План по доменам из processed-данных + прогон. kwargs делятся между plan_warmup и run_warmup.
+    Шкалы, которых нет в таблице Элленберга, в план не попадают (их задачи падали бы
+    KeyError при каждом повторном запуске) — они возвращаются в summary["missing_scales"].
+    """
+    plan_keys = {"scales", "metrics", "full_grid", "include_panel"}
+    plan_kwargs = {k: v for k, v in kwargs.items() if k in plan_keys}
+    run_kwargs = {k: v for k, v in kwargs.items() if k not in plan_keys}
+
+    scales = list(plan_kwargs.get("scales", ELLENBERG_SCALES))
+    plan_kwargs["scales"] = available_scales(scales)
+    missing = [s for s in scales if s not in plan_kwargs["scales"]]
+
+    domains = ui_filter_domains(load_processed())
+    tasks = plan_warmup(domains, **plan_kwargs)
+    summary: dict[str, Any] = dict(run_warmup(tasks, **run_kwargs))
+    summary["missing_scales"] = missing
+    return summary
@@ -0,0 +1,88 @@
+"""
+Бенчмарк core.kernels на синтетике: 10^5 описаний, экоспектр + circular-shift p-value.
+Сравнивает бэкенды numpy / numba (если установлена) и старый цикл по описаниям.
+
+python scripts/bench_kernels.py [--descriptions 100000] [--repeat 3] [--with-loop]
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+import time
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from core import kernels  # noqa: E402
+from core.ecospectrum import compute_ecospectrum_by_description, compute_ecospectrum_stats  # noqa: E402
+
+
+def synthetic_rows(n_desc: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(5, 60, n_desc)
+    ids = np.repeat(np.arange(n_desc), sizes)
+    n = len(ids)
+    return pd.DataFrame({
+        "description_id": ids,
+        "M": rng.integers(1, 13, n).astype(float),
+        "w": rng.choice([0.5, 1.0, 3.0, 7.0, 15.0, 37.5, 62.5, 87.5], n),
+    })
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark ecospectrum / circular-shift kernels.")
+    p.add_argument("--descriptions", type=int, default=100_000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--with-loop", action="store_true", help="Also time the per-description loop (slow)")
+    args = p.parse_args()
+
+    df = synthetic_rows(args.descriptions)
+    rng = np.random.default_rng(1)
+    years = 60
+    x, y = rng.normal(size=years), np.cumsum(rng.normal(size=years))
+    print(f"rows={len(df):,} descriptions={args.descriptions:,}  shift series n={years}, n_perm=999")
+
+    backends = ["numpy"] + (["numba"] if kernels.HAVE_NUMBA else [])
+    timings = {}
+    for name in backends:
+        kernels.set_backend(name)
+        # первый вызов — JIT-компиляция (numba), в замер не входит
+        compute_ecospectrum_by_description.uncached(df.head(1000), trait_col="M")
+        kernels.circular_shift_pvalue(x, y)
+
+        t_eco = best_of(lambda: compute_ecospectrum_by_description.uncached(df, trait_col="M"), args.repeat)
+        t_shift = best_of(lambda: kernels.circular_shift_pvalue(x, y, mode="sampled"), args.repeat * 10)
+        t_exact = best_of(lambda: kernels.circular_shift_pvalue(x, y, mode="exact"), args.repeat * 10)
+        timings[name] = (t_eco, t_shift)
+        print(f"{name:>6}: ecospectrum {t_eco:8.3f} s   circular_shift_pvalue {t_shift * 1e3:8.2f} ms"
+              f" (exact, {years} shifts: {t_exact * 1e3:8.2f} ms)")
+
+    if "numba" in timings:
+        (e0, s0), (e1, s1) = timings["numpy"], timings["numba"]
+        print(f"speedup numba/numpy: ecospectrum x{e0 / e1:.1f}, circular shift x{s0 / s1:.1f}")
+    else:
+        print("numba not installed: only the numpy backend was timed (pip install numba)")
+
+    if args.with_loop:
+        t0 = time.perf_counter()
+        for _, g in df.groupby("description_id", sort=False):
+            compute_ecospectrum_stats(g, trait_col="M", weight_col="w")
+        t_loop = time.perf_counter() - t0
+        print(f"  loop: ecospectrum {t_loop:8.3f} s   (x{t_loop / timings['numpy'][0]:.0f} vs numpy kernel)")
+
+
+if __name__ == "__main__":
+    main()
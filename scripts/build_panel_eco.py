@@ -7,7 +7,7 @@ from core.panel_dataset import PanelEcoSpec, build_panel_eco_dataset, save_panel
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("--scale", required=True, help="Ellenberg scale, e.g. N, R, T, L")
-    p.add_argument("--metric", required=True, help="Eco metric, e.g. cwm or sigma")
+    p.add_argument("--metric", required=True, help="Eco metric, e.g. cwm, sigma, fdis, rao_q, rao_q_multi")
     p.add_argument("--out", default=None, help="Optional output path for CSV")
     args = p.parse_args()
 
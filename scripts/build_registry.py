@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+import time
+
+# чтобы импорт core работал при запуске как файла (на всякий случай)
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from core.registry_store import REGISTRY_SOURCES, load_registry  # noqa: E402
+
+
+def main():
+    # компиляция (или проверка, что хранилище актуально) — дальше процессы берут его с диска
+    t0 = time.perf_counter()
+    tables = load_registry()
+    print(f"Registry ready in {time.perf_counter() - t0:.2f} s; sources:")
+    for p in REGISTRY_SOURCES:
+        print(f"  {p} ({'ok' if Path(p).exists() else 'MISSING'})")
+    for name, t in tables.items():
+        print(f"  {name}: {'-' if t is None else f'{len(t)} rows x {t.shape[1]} cols'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+
+# чтобы импорт core работал при запуске как файла (на всякий случай)
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from core.ecospectrum import build_spectrum_matrix, save_spectra  # noqa: E402
+from core.scenario_runner import prepare_eco_rows  # noqa: E402
+from core.traits import TRAIT_SCALES  # noqa: E402
+
+
+def main():
+    p = argparse.ArgumentParser(description="Build description x bin spectrum matrices (data/processed/spectra_*.parquet).")
+    p.add_argument("--scales", default=",".join(TRAIT_SCALES), help="Ellenberg scales, comma-separated")
+    args = p.parse_args()
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+
+    # одна таблица строк с матрицей признаков для всех шкал
+    rows = prepare_eco_rows(None, tuple(scales))
+
+    spectra = {}
+    for scale in scales:
+        if scale not in rows.columns:
+            print(f"skip {scale}: not in trait table")
+            continue
+        spectra[scale] = build_spectrum_matrix(rows, trait_col=scale, weight_col="w")
+        exact = "exact" if spectra[scale].attrs.get("exact") else "interpolated bins"
+        print(f"{scale}: {spectra[scale].shape[0]} descriptions x {spectra[scale].shape[1] - 1} bins ({exact})")
+
+    for path in save_spectra(spectra):
+        print(f"Saved: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import argparse
 from pathlib import Path
 import sys
 from types import SimpleNamespace
@@ -10,58 +11,40 @@ import pandas as pd
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(PROJECT_ROOT))
 
-from core.scenario_runner import run_scenario  # noqa: E402
+from core.batch_executor import run_batch  # noqa: E402
+from core.grid_engine import run_grid_spec  # noqa: E402
 
 
 OUT_CSV = PROJECT_ROOT / "data" / "processed" / "grid_eco_vs_climate_results.csv"
 
 
-def run_one(trait_scale: str, eco_metric: str, period: str, lag: int, window: int, year_between=None):
-    filters = {}
-    if year_between:
-        filters = {"year": {"between": list(year_between)}}
-
-    spec = SimpleNamespace(
-        name=f"grid_{trait_scale}_{eco_metric}_{period}_lag{lag}_win{window}",
-        analysis="eco_vs_climate",
-        filters=filters,
-        trait_scale=trait_scale,
-        eco_metric=eco_metric,
-        period=period,
-        lag=lag,
-        window=window,
-        plot=None,  # в гриде картинки не строим
-    )
-    df, _ = run_scenario(spec)
-
-    n = len(df)
-    pearson = float(df["pearson_r"].iloc[0]) if n > 0 and "pearson_r" in df.columns else float("nan")
-    spearman = float(df["spearman_rho"].iloc[0]) if n > 0 and "spearman_rho" in df.columns else float("nan")
-
-    years = sorted(df["year"].unique().tolist()) if n > 0 and "year" in df.columns else []
-    year_min = years[0] if years else None
-    year_max = years[-1] if years else None
-
-    return {
-        "trait_scale": trait_scale,
-        "eco_metric": eco_metric,
-        "period": period,
-        "lag": lag,
-        "window": window,
-        "n": n,
-        "year_min": year_min,
-        "year_max": year_max,
-        "pearson_r": pearson,
-        "spearman_rho": spearman,
-        "abs_pearson_r": abs(pearson) if pd.notna(pearson) else float("nan"),
-        "abs_spearman_rho": abs(spearman) if pd.notna(spearman) else float("nan"),
-    }
+def _year_filters(year_between=None) -> dict:
+    return {"year": {"between": list(year_between)}} if year_between else {}
+
+
+def _add_abs_columns(out: pd.DataFrame) -> pd.DataFrame:
+    out["n"] = out["n_years"]
+    out["abs_pearson_r"] = out["pearson_r"].abs()
+    out["abs_spearman_rho"] = out["spearman_rho"].abs()
+    return out
+
+
+def _csv_list(s: str) -> list[str]:
+    return [x.strip() for x in s.split(",") if x.strip()]
 
 
 def main():
+    p = argparse.ArgumentParser(description="Eco metric vs Pedya grid (period x lag x window) for scales x metrics.")
+    p.add_argument("--scales", default="M", help="Ellenberg scales, comma-separated (M = влажность)")
+    p.add_argument("--metrics", default="cwm,sigma", help="Eco metrics, comma-separated")
+    p.add_argument("--workers", type=int, default=1, help="Parallel worker processes (one grid per scale x metric)")
+    p.add_argument("--shift-mode", default="sampled", choices=["sampled", "exact", "auto"],
+                   help="pearson_p_shift: random shifts (default) or exact p over all circular shifts")
+    args = p.parse_args()
+
     # что гоняем
-    trait_scale = "M"  # влажность (у тебя в таблице это M)
-    eco_metrics = ["cwm", "sigma"]  # попробуем среднее и разброс
+    trait_scales = _csv_list(args.scales)
+    eco_metrics = _csv_list(args.metrics)  # по умолчанию среднее и разброс
     periods = ["JJA", "warm_half_year", "MAM", "DJF", "cold_half_year"]
     lags = [0, 1, 2]
     windows = [1, 2, 3]
@@ -69,36 +52,54 @@ def main():
     # если хочешь жёстко ограничить годами полевых данных:
     year_between = (2009, 2019)
 
+    specs = [
+        SimpleNamespace(
+            filters=_year_filters(year_between),
+            trait_scale=scale,
+            eco_metric=eco_metric,
+            periods=periods,
+            lags=lags,
+            windows=windows,
+            climate_vars=["pedya"],
+            shift_mode=args.shift_mode,
+        )
+        for scale in trait_scales
+        for eco_metric in eco_metrics
+    ]
+
     rows = []
-    total = len(eco_metrics) * len(periods) * len(lags) * len(windows)
-    k = 0
-
-    for eco_metric in eco_metrics:
-        for period in periods:
-            for lag in lags:
-                for window in windows:
-                    k += 1
-                    try:
-                        res = run_one(
-                            trait_scale=trait_scale,
-                            eco_metric=eco_metric,
-                            period=period,
-                            lag=lag,
-                            window=window,
-                            year_between=year_between,
-                        )
-                        rows.append(res)
-                        print(f"[{k:>3}/{total}] OK  {eco_metric:>5} {trait_scale} vs Pedya({period}) lag={lag} win={window} "
-                              f"n={res['n']} r={res['pearson_r']:.3f} rho={res['spearman_rho']:.3f}")
-                    except Exception as e:
-                        print(f"[{k:>3}/{total}] ERR {eco_metric:>5} {trait_scale} vs Pedya({period}) lag={lag} win={window}: {e}")
-
-    out = pd.DataFrame(rows)
+    for r in run_batch(specs, run_grid_spec, workers=args.workers, on_progress=lambda pr: print(pr)):
+        scale, eco_metric = r.spec.trait_scale, r.spec.eco_metric
+        if r.error is not None:
+            print(f"ERR {eco_metric:>5} {scale}: {r.error}")
+            continue
+        # режим p_shift — рядом с результатом: exact / sampled дают разные числа
+        res = _add_abs_columns(r.result).assign(shift_mode=args.shift_mode)
+        rows.append(res)
+        for g in res.itertuples(index=False):
+            if g.error:
+                print(f"ERR {eco_metric:>5} {scale} vs Pedya({g.period}) lag={g.lag} win={g.window}: {g.error}")
+                continue
+            print(f"OK  {eco_metric:>5} {scale} vs Pedya({g.period}) lag={g.lag} win={g.window} "
+                  f"n={g.n} r={g.pearson_r:.3f} rho={g.spearman_rho:.3f}")
+
+    out = pd.concat(rows, ignore_index=True) if rows else pd.DataFrame()
+    if not out.empty:
+        # порядок строк не зависит от того, какая сетка досчиталась первой
+        order = {(s, m): i for i, (s, m) in enumerate((x.trait_scale, x.eco_metric) for x in specs)}
+        out = (
+            out.assign(_o=[order[k] for k in zip(out["trait_scale"], out["eco_metric"])])
+            .sort_values("_o", kind="stable")
+            .drop(columns="_o")
+            .reset_index(drop=True)
+        )
 
     OUT_CSV.parent.mkdir(parents=True, exist_ok=True)
     out.to_csv(OUT_CSV, index=False)
 
     print("\nSaved:", OUT_CSV)
+    if out.empty:
+        return
     # топ-10 по |r|
     top = out.dropna(subset=["abs_pearson_r"]).sort_values("abs_pearson_r", ascending=False).head(10)
     print("\nTOP-10 by |pearson_r|:\n", top[[
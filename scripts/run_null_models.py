@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+import sys
+import time
+
+# чтобы импорт core работал при запуске как файла (на всякий случай)
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from core.null_models import DEFAULT_N_ITER, DEFAULT_SEED, NULL_METRICS, NULL_MODELS, null_model_ses  # noqa: E402
+from core.scenario_runner import prepare_eco_rows  # noqa: E402
+
+OUT_DIR = PROJECT_ROOT / "data" / "processed"
+
+
+def main():
+    p = argparse.ArgumentParser(description="Null-model SES of community trait metrics (per description and per year).")
+    p.add_argument("--scale", default="M", help="Ellenberg scale")
+    p.add_argument("--null", default="trait_shuffle", choices=sorted(NULL_MODELS))
+    p.add_argument("--n-iter", type=int, default=DEFAULT_N_ITER)
+    p.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    p.add_argument("--workers", type=int, default=1, help="Parallel worker processes (result does not depend on it)")
+    p.add_argument("--metrics", default=",".join(NULL_METRICS), help="comma-separated: " + ",".join(NULL_METRICS))
+    p.add_argument("--filters", default=None, help='JSON dict for apply_filters, e.g. {"geomorph_level": "low_floodplain"}')
+    args = p.parse_args()
+
+    filters = json.loads(args.filters) if args.filters else None
+    metrics = [m.strip() for m in args.metrics.split(",") if m.strip()]
+
+    rows = prepare_eco_rows(filters, args.scale)
+
+    t0 = time.perf_counter()
+    per_desc, per_year = null_model_ses(
+        rows,
+        trait_col=args.scale,
+        weight_col="w",
+        null=args.null,
+        n_iter=args.n_iter,
+        seed=args.seed,
+        workers=args.workers,
+        metrics=metrics,
+    )
+    print(f"{args.null}, {args.n_iter} iterations, {per_desc['description_id'].nunique()} descriptions: "
+          f"{time.perf_counter() - t0:.1f} s")
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    stem = f"null_{args.null}_{args.scale}"
+    desc_path = OUT_DIR / f"{stem}_descriptions.csv"
+    year_path = OUT_DIR / f"{stem}_years.csv"
+    per_desc.to_csv(desc_path, index=False)
+    per_year.to_csv(year_path, index=False)
+
+    print(per_year.to_string(index=False))
+    print(f"Saved: {desc_path}")
+    print(f"Saved: {year_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import re
+import sys
+import time
+
+import pandas as pd
+
+# чтобы импорт core работал при запуске как файла (на всякий случай)
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from core.scenario_dag import DEFAULT_WORKERS, compile_plan, explain_plan, load_scenario_file, run_plan  # noqa: E402
+
+OUT_DIR = PROJECT_ROOT / "data" / "processed" / "scenarios"
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^\w.=,-]+", "_", name).strip("_")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Run declarative YAML/JSON scenarios as one DAG with shared stages.")
+    p.add_argument("command", choices=["explain", "run"], help="explain: show the plan and cache reuse; run: execute it")
+    p.add_argument("files", nargs="+", type=Path, help="scenario files (.yaml/.yml/.json)")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="threads for independent stages")
+    p.add_argument("--out-dir", type=Path, default=OUT_DIR, help="where run writes one CSV per scenario")
+    args = p.parse_args()
+
+    specs = [s for f in args.files for s in load_scenario_file(f)]
+    plan = compile_plan(specs)
+    table = explain_plan(plan)
+
+    if args.command == "explain":
+        print(f"{len(specs)} scenarios -> {len(plan.nodes)} nodes")
+        with pd.option_context("display.max_colwidth", 80, "display.width", 200):
+            print(table.to_string(index=False))
+        print("\nstatus:", ", ".join(f"{k}={v}" for k, v in table["status"].value_counts().items()))
+        return
+
+    t0 = time.perf_counter()
+
+    def _progress(r):
+        msg = f"{r.status:>7} {r.node_id:<28} {r.seconds:6.2f} s"
+        print(msg + (f"  {r.error}" if r.error else ""))
+
+    results, _ = run_plan(plan, workers=args.workers, on_node=_progress)
+
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    n_err = 0
+    for name, res in results.items():
+        if isinstance(res, Exception):
+            n_err += 1
+            print(f"ERR {name}: {res}")
+            continue
+        df, plot_path = res
+        path = args.out_dir / f"{_safe_name(name)}.csv"
+        df.to_csv(path, index=False)
+        print(f"OK  {name}: {len(df)} rows -> {path}" + (f" (plot: {plot_path})" if plot_path else ""))
+    print(f"\n{len(results) - n_err}/{len(results)} scenarios in {time.perf_counter() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Сверка core.grid_engine с поштучным run_scenario(analysis="eco_vs_climate")
+по всей сетке (period x lag x window) для нескольких climate_var и метрик.
+
+Числа должны совпадать до округления (rtol 1e-9): r/rho считаются матрично,
+p-значения — теми же распределениями, что в scipy, p_shift — теми же сдвигами.
+
+python scripts/test_grid_engine.py
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+import time
+from types import SimpleNamespace
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import core.grid_engine as grid_engine  # noqa: E402
+from core.grid_engine import ERROR_COLUMN, GRID_COLUMNS, run_eco_climate_grid  # noqa: E402
+from core.scenario_runner import run_scenario  # noqa: E402
+
+PERIODS = ["JJA", "warm_half_year", "MAM", "DJF", "cold_half_year", "SON"]
+LAGS = [0, 1, 2, 3]
+WINDOWS = [1, 2, 3, 5, 12]  # 12 > числа лет -> пустые комбинации тоже проверяются
+FILTERS = {"year": {"between": [2009, 2019]}}
+
+
+def reference_grid(metric: str, climate_var: str) -> pd.DataFrame:
+    rows = []
+    for period in PERIODS:
+        for lag in LAGS:
+            for window in WINDOWS:
+                spec = SimpleNamespace(
+                    name="parity", analysis="eco_vs_climate", filters=FILTERS,
+                    trait_scale="M", eco_metric=metric, period=period, lag=lag, window=window,
+                    climate_var=climate_var, plot=None,
+                )
+                df, _ = run_scenario(spec)
+                row = {"climate_var": climate_var, "period": period, "lag": lag, "window": window}
+                for c in GRID_COLUMNS[4:]:
+                    row[c] = df[c].iloc[0] if len(df) else (0 if c == "n_years" else np.nan)
+                rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def compare(got: pd.DataFrame, ref: pd.DataFrame) -> list[str]:
+    errors = []
+    for c in GRID_COLUMNS:
+        a, b = got[c], ref[c]
+        if c in ("climate_var", "period"):
+            same = (a.to_numpy() == b.to_numpy()).all()
+        else:
+            a = pd.to_numeric(a, errors="coerce").astype(float)
+            b = pd.to_numeric(b, errors="coerce").astype(float)
+            same = np.allclose(a, b, rtol=1e-9, atol=1e-12, equal_nan=True)
+        if not same:
+            errors.append(c)
+    return errors
+
+
+def check_block_errors() -> list[str]:
+    """Ошибка в одном (climate_var, period) — строки этого блока с "error", остальные посчитаны."""
+    orig = grid_engine.climate_signal_matrix
+
+    def failing(climate_var, period, *args, **kwargs):
+        if period == "MAM":
+            raise RuntimeError("boom")
+        return orig(climate_var, period, *args, **kwargs)
+
+    grid_engine.climate_signal_matrix = failing
+    try:
+        got = run_eco_climate_grid(FILTERS, "M", "cwm", PERIODS, LAGS, WINDOWS, ["pedya"])
+    finally:
+        grid_engine.climate_signal_matrix = orig
+    ok = run_eco_climate_grid(FILTERS, "M", "cwm", PERIODS, LAGS, WINDOWS, ["pedya"])
+
+    errors = []
+    bad = got["period"] == "MAM"
+    if len(got) != len(PERIODS) * len(LAGS) * len(WINDOWS):
+        errors.append("row count")
+    if not (got.loc[bad, ERROR_COLUMN] == "RuntimeError: boom").all() or got.loc[~bad, ERROR_COLUMN].notna().any():
+        errors.append(ERROR_COLUMN)
+    if got.loc[bad, "pearson_r"].notna().any() or (got.loc[bad, "n_years"] != 0).any():
+        errors.append("failed block values")
+    if compare(got[~bad].reset_index(drop=True), ok[~bad].reset_index(drop=True)):
+        errors.append("other blocks changed")
+    return errors
+
+
+def main():
+    errors = []
+    for climate_var in ("pedya", "precip_mm"):
+        for metric in ("cwm", "sigma"):
+            t0 = time.perf_counter()
+            ref = reference_grid(metric, climate_var)
+            t_loop = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            got = run_eco_climate_grid(FILTERS, "M", metric, PERIODS, LAGS, WINDOWS, [climate_var])
+            t_grid = time.perf_counter() - t0
+
+            errs = compare(got, ref)
+            status = "OK" if not errs else "FAILED: " + ", ".join(errs)
+            print(f"{metric:>5} vs {climate_var:<9} {len(got)} combos: loop {t_loop:6.2f} s, "
+                  f"grid {t_grid * 1e3:7.1f} ms  {status}")
+            errors += errs
+
+    errs = check_block_errors()
+    print(f"failing block isolated: {'OK' if not errs else 'FAILED: ' + ', '.join(errs)}")
+    errors += errs
+
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Сверка бэкендов core.kernels (numpy / numba, если установлена) с эталоном:
+  - экоспектр по описаниям vs compute_ecospectrum_stats по одному описанию
+    (skew/kurt/fdis/rao_q — vs прямой счёт по парам),
+  - circular-shift p-value vs цикл со scipy.stats.pearsonr (постоянный ряд -> NaN).
+
+Квантили, n_rows_used и p-value должны совпадать точно, суммы/cwm/sigma — до
+округления (порядок суммирования разный, rtol 1e-9).
+
+python scripts/test_kernel_parity.py
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from scipy import stats  # noqa: E402
+
+from core import kernels  # noqa: E402
+from core.ecospectrum import (  # noqa: E402
+    compute_ecospectrum_by_description,
+    compute_ecospectrum_stats,
+    weighted_quantile,
+)
+
+EXACT = ["n_rows_used", "w_median", "w_min", "w_max", "w_q25", "w_q75"]
+CLOSE = ["sum_w", "cwm", "sigma", "skew", "kurt", "fdis", "rao_q"]
+
+
+def synthetic_rows(n_desc: int = 400, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(0, 40, n_desc)
+    ids = np.repeat(np.arange(n_desc), sizes)
+    n = len(ids)
+    x = rng.integers(1, 10, n).astype(float)
+    x[rng.random(n) < 0.1] = np.nan
+    w = rng.choice([0.0, 0.5, 1.0, 3.0, 7.0], n)
+    w[rng.random(n) < 0.05] = np.nan
+    return pd.DataFrame({"description_id": ids, "M": x, "w": w})
+
+
+def reference_eco(df: pd.DataFrame) -> pd.DataFrame:
+    rows = []
+    for desc_id, g in df.groupby("description_id", sort=False):
+        st = compute_ecospectrum_stats(g, trait_col="M", weight_col="w")
+        xv, wv = g["M"].to_numpy(float), g["w"].to_numpy(float)
+        ok = ~np.isnan(xv) & ~np.isnan(wv) & (wv > 0)
+        for q in (0.25, 0.75):
+            st[f"w_q{q * 100:g}"] = weighted_quantile(xv[ok], wv[ok], q) if ok.any() else np.nan
+        st.update(reference_fd(xv[ok], wv[ok]))
+        rows.append({"description_id": desc_id, **st})
+    return pd.DataFrame(rows)
+
+
+def reference_fd(x: np.ndarray, w: np.ndarray) -> dict:
+    if len(x) == 0:
+        return {"skew": np.nan, "kurt": np.nan, "fdis": np.nan, "rao_q": np.nan}
+    p = w / w.sum()
+    mu = np.sum(p * x)
+    sd = np.sqrt(np.sum(p * (x - mu) ** 2))
+    return {
+        "skew": np.sum(p * (x - mu) ** 3) / sd ** 3 if sd > 0 else np.nan,
+        "kurt": np.sum(p * (x - mu) ** 4) / sd ** 4 - 3.0 if sd > 0 else np.nan,
+        "fdis": np.sum(p * np.abs(x - mu)),
+        "rao_q": np.sum(p[:, None] * p[None, :] * np.abs(x[:, None] - x[None, :])),
+    }
+
+
+def reference_shift_pvalue(x, y, n_perm=999, seed=42):
+    n = len(x)
+    rng = np.random.default_rng(seed)
+    r_obs = stats.pearsonr(x, y).statistic
+    shifts = rng.integers(1, n, size=n_perm)
+    cnt = sum(abs(stats.pearsonr(x, np.roll(y, k)).statistic) >= abs(r_obs) for k in shifts)
+    return (cnt + 1) / (n_perm + 1)
+
+
+def reference_shift_pvalue_exact(x, y):
+    # точный перестановочный p: доля всех n круговых сдвигов (включая нулевой) с |r_k| >= |r_obs|
+    n = len(x)
+    r_obs = stats.pearsonr(x, y).statistic
+    return np.mean([abs(stats.pearsonr(x, np.roll(y, k)).statistic) >= abs(r_obs) for k in range(n)])
+
+
+def check_backend(name: str, df: pd.DataFrame, ref: pd.DataFrame) -> list[str]:
+    kernels.set_backend(name)
+    errors = []
+
+    got = compute_ecospectrum_by_description.uncached(df, trait_col="M", quantiles=(0.25, 0.75))
+    got = got.set_index("description_id").loc[ref["description_id"]].reset_index()
+    for col in EXACT:
+        if not np.array_equal(got[col].to_numpy(float), ref[col].to_numpy(float), equal_nan=True):
+            errors.append(f"{name}: {col} differs")
+    for col in CLOSE:
+        if not np.allclose(got[col], ref[col], rtol=1e-9, atol=1e-12, equal_nan=True):
+            errors.append(f"{name}: {col} differs beyond rounding")
+
+    rng = np.random.default_rng(1)
+    for n in (4, 7, 25, 60):
+        for _ in range(5):
+            x = rng.normal(size=n)
+            y = np.cumsum(rng.normal(size=n))
+            p_ref = reference_shift_pvalue(x, y)
+            p_got = kernels.circular_shift_pvalue(x, y, mode="sampled")
+            if p_ref != p_got:
+                errors.append(f"{name}: shift p-value n={n}: {p_got} != {p_ref}")
+            p_ref = reference_shift_pvalue_exact(x, y)
+            p_got = kernels.circular_shift_pvalue(x, y, mode="exact")
+            if not np.isclose(p_ref, p_got, rtol=1e-12):
+                errors.append(f"{name}: exact shift p-value n={n}: {p_got} != {p_ref}")
+
+    # постоянный ряд: корреляция не определена -> NaN (а не деление на ноль / p = 1/(n_perm+1))
+    x = rng.normal(size=25)
+    y = np.full(25, 3.0)
+    r = kernels.shift_correlations(x, y, np.arange(25))
+    if not np.isnan(r).all():
+        errors.append(f"{name}: constant series: shift correlations {r[:3]}... are not NaN")
+    for mode in ("sampled", "exact"):
+        p_got = kernels.circular_shift_pvalue(x, y, mode=mode)
+        if not np.isnan(p_got):
+            errors.append(f"{name}: constant series ({mode}): p-value {p_got} is not NaN")
+    p_got = kernels.circular_shift_pvalues(np.stack([x, x]), np.stack([y, np.cumsum(x)]))
+    if not (np.isnan(p_got[0]) and not np.isnan(p_got[1])):
+        errors.append(f"{name}: constant series (batch): p-values {p_got}")
+    return errors
+
+
+def main():
+    df = synthetic_rows()
+    ref = reference_eco(df)
+
+    backends = ["numpy"] + (["numba"] if kernels.HAVE_NUMBA else [])
+    if not kernels.HAVE_NUMBA:
+        print("numba not installed: checking numpy backend only")
+
+    errors = []
+    for name in backends:
+        errs = check_backend(name, df, ref)
+        print(f"{name:>6}: {'OK' if not errs else 'FAILED'}")
+        errors += errs
+
+    for e in errors:
+        print("  ", e)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
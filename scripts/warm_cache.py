@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+
+# чтобы импорт core работал при запуске как файла (на всякий случай)
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from core.scenario_runner import ECO_METRICS, ELLENBERG_SCALES  # noqa: E402
+from core.warmup import WARMUP_STATE, warmup_from_processed  # noqa: E402
+
+
+def _csv_list(s: str) -> list[str]:
+    return [x.strip() for x in s.split(",") if x.strip()]
+
+
+def main():
+    p = argparse.ArgumentParser(description="Precompute cache entries for UI dropdown combinations.")
+    p.add_argument("--scales", default=",".join(ELLENBERG_SCALES), help="Ellenberg scales, comma-separated")
+    p.add_argument("--metrics", default=",".join(ECO_METRICS), help="Eco metrics, comma-separated")
+    p.add_argument("--workers", type=int, default=1, help="Parallel worker processes")
+    p.add_argument("--full-grid", action="store_true", help="Full cartesian product of filters (slow)")
+    p.add_argument("--no-panel", action="store_true", help="Skip panel eco datasets")
+    p.add_argument("--restart", action="store_true", help=f"Ignore progress saved in {WARMUP_STATE}")
+    args = p.parse_args()
+
+    def on_progress(k, total, task, error):
+        status = "OK " if error is None else "ERR"
+        what = f"{task.kind:>5} {task.scale} {','.join(task.metrics)} filters={task.filters}"
+        tail = "" if error is None else f": {error}"
+        print(f"[{k:>4}/{total}] {status} {what}{tail}")
+
+    summary = warmup_from_processed(
+        scales=_csv_list(args.scales),
+        metrics=_csv_list(args.metrics),
+        full_grid=args.full_grid,
+        include_panel=not args.no_panel,
+        workers=args.workers,
+        restart=args.restart,
+        on_progress=on_progress,
+    )
+
+    if summary["missing_scales"]:
+        print(f"Skipped scales not in the Ellenberg table: {','.join(summary['missing_scales'])}")
+    print(
+        f"\nWarm-up done: total={summary['total']} skipped(already done)={summary['skipped']} "
+        f"ok={summary['ok']} failed={summary['failed']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
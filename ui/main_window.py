@@ -1,13 +1,17 @@
 from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QComboBox,
-    QSplitter, QScrollArea, QSizePolicy, QHeaderView
+    QSplitter, QScrollArea, QSizePolicy, QHeaderView, QCheckBox
 )
 from core.analysis_engine import load_processed, apply_filters
 from PySide6.QtGui import QPixmap
 from PySide6.QtCore import Qt
-from core.scenario_runner import run_scenario, ScenarioSpec
+from core.scenario_runner import (
+    run_scenario, ScenarioSpec,
+    ELLENBERG_SCALES, ECO_METRICS, AFFORESTATION_CHOICES, build_ui_filters,
+)
 from core.analysis_engine import load_processed
+from core.grid_engine import run_eco_climate_grid
 from PySide6.QtWidgets import QLineEdit, QTableWidget, QTableWidgetItem
 from types import SimpleNamespace
 from ui.panel_tab import PanelTab
@@ -34,6 +38,7 @@ class MainWindow(QMainWindow):
         self.affor = QComboBox()
         self.lag_combo = QComboBox()
         self.window_combo = QComboBox()
+        self.bootstrap_check = QCheckBox("Bootstrap CI (descriptions within year)")
 
         self.periods_edit = QLineEdit()
         self.lags_edit = QLineEdit()
@@ -42,10 +47,10 @@ class MainWindow(QMainWindow):
         self.run_btn = QPushButton("Run")
         self.run_batch_btn = QPushButton("Run batch")
 
-        self.batch_table = QTableWidget(0, 12)
+        self.batch_table = QTableWidget(0, 14)
         self.batch_table.setHorizontalHeaderLabels([
             "period", "lag", "window", "n_years",
-            "pearson_r", "|r|", "p", "p_shift",
+            "pearson_r", "|r|", "p", "p_shift", "n_eff", "p_eff",
             "spearman_rho", "p_s",
             "years", "plot"
         ])
@@ -72,6 +77,7 @@ class MainWindow(QMainWindow):
         # modes
         self.mode.addItem("Classic", "classic")
         self.mode.addItem("Ecospectrum", "ecospectrum")
+        self.mode.addItem("Ecospectrum (full spectrum by year)", "spectrum")
         self.mode.addItem("Climate", "climate")
         self.mode.addItem("Eco vs Climate (batch)", "eco_vs_climate_batch")
         self.mode.addItem("Panel climate", "panel_climate")
@@ -79,11 +85,11 @@ class MainWindow(QMainWindow):
 
 
         # ellenberg scales
-        for s in ["L", "T", "K", "F", "R", "N", "S", "M"]:
+        for s in ELLENBERG_SCALES:
             self.scale.addItem(s)
 
         # eco metrics
-        for m in ["cwm", "sigma", "w_median", "w_min", "w_max"]:
+        for m in ECO_METRICS:
             self.eco_metric.addItem(m)
 
         # climate var
@@ -99,12 +105,8 @@ class MainWindow(QMainWindow):
 
 
         # afforestation (облесённость)
-        self.affor.addItem("All", None)
-        self.affor.addItem("Луг (0)", [0])
-        self.affor.addItem("Редколесье (1)", [1])
-        self.affor.addItem("Лес (2)", [2])
-        self.affor.addItem("Луг + редколесье (0,1)", [0, 1])
-        self.affor.addItem("Редколесье + лес (1,2)", [1, 2])
+        for label, codes in AFFORESTATION_CHOICES:
+            self.affor.addItem(label, codes)
 
         self.lag_combo.addItems(["0", "1", "2"])
         self.window_combo.addItems(["1", "2", "3"])
@@ -157,6 +159,7 @@ class MainWindow(QMainWindow):
 
         left_layout.addWidget(QLabel("Eco metric (for ecospectrum mode)"))
         left_layout.addWidget(self.eco_metric)
+        left_layout.addWidget(self.bootstrap_check)
 
         left_layout.addWidget(self.run_btn)
         left_layout.addStretch(1)
@@ -274,6 +277,10 @@ class MainWindow(QMainWindow):
 
         r = self._batch_rows[src_i]
 
+        if r.get("error"):
+            self.output.setText(f"BLOCKED\nКомбинация не посчитана: {r['error']}")
+            return
+
         alpha = 0.05
         ny = int(r.get("n_years", r.get("n", 0)) or 0)
         pps = r.get("pearson_p_shift", float("nan"))
@@ -318,30 +325,17 @@ class MainWindow(QMainWindow):
     def run_batch(self):
         try:
             # 1) Eco-настройки из UI
-            river = self.river.currentText()
-            geom = self.geom.currentText()
-            impact = self.impact.currentText()
-
             scale = self.scale.currentText()
             eco_metric = self.eco_metric.currentText()
-
-            filters = {}
-
-            aff = self.affor.currentData()
-            if aff is not None:
-                filters["afforestation"] = {"in": aff}
-
-            geom_value = self.geom.currentText()
-            if geom_value != "All":
-                filters["geomorph_level"] = geom_value
-
-            profile_value = self.profile.currentText()
-            if profile_value != "All":
-                filters["source_file"] = profile_value
-
-            impact_value = self.impact.currentText()
-            if impact_value != "All":
-                filters["impact_type"] = impact_value
+            climate_var = self.climate_var.currentText()
+            bootstrap = self.bootstrap_check.isChecked()  # eco_year с CI кешируется один раз
+
+            filters = build_ui_filters(
+                profile=self.profile.currentText(),
+                geomorph_level=self.geom.currentText(),
+                impact_type=self.impact.currentText(),
+                afforestation=self.affor.currentData(),
+            )
 
             periods = self._parse_str_list(self.periods_edit.text())
             lags = self._parse_int_list(self.lags_edit.text())
@@ -351,89 +345,58 @@ class MainWindow(QMainWindow):
             df1 = apply_filters(df0, filters)
             self.output.setText(self.output.text() + f"\nAfter filters: rows={len(df1)}")
 
-            # 2) Прогон
+            # 2) Прогон: вся сетка period x lag x window одним вызовом grid_engine
+            grid = run_eco_climate_grid(
+                filters, scale, eco_metric, periods, lags, windows,
+                climate_vars=[climate_var], bootstrap=bootstrap,
+            )
+
             rows = []
-            total = len(periods) * len(lags) * len(windows)
-            k = 0
-
-            for period in periods:
-                for lag in lags:
-                    for window in windows:
-                        k += 1
-                        spec = SimpleNamespace(
-                            name=f"ui_batch_{scale}_{eco_metric}_{period}_lag{lag}_win{window}",
-                            analysis="eco_vs_climate",
-                            filters=filters,
-                            trait_scale=scale,
-                            eco_metric=eco_metric,
-                            period=period,
-                            lag=lag,
-                            window=window,
-                            climate_var = self.climate_var.currentText(),
-                            plot=None,  # в батче картинки не строим
-                        )
-                        try:
-                            df, _ = run_scenario(spec)
-                            n = len(df)
-                            if n > 0:
-                                pearson = float(df["pearson_r"].iloc[0])
-                                spearman = float(df["spearman_rho"].iloc[0])
-                                absr = abs(pearson) if not math.isnan(pearson) else float("nan")
-                            else:
-                                pearson = float("nan")
-                                spearman = float("nan")
-                                absr = float("nan")
-
-                            # df — это joined по годам, но r/p лежат одинаковыми во всех строках
-                            if len(df) == 0:
-                                pearson_r = float("nan");
-                                spearman_rho = float("nan")
-                                pearson_p = float("nan");
-                                pearson_p_shift = float("nan")
-                                spearman_p = float("nan")
-                                n_years = 0;
-                                year_min = None;
-                                year_max = None
-                            else:
-                                pearson_r = float(df["pearson_r"].iloc[0])
-                                spearman_rho = float(df["spearman_rho"].iloc[0])
-                                pearson_p = float(df["pearson_p"].iloc[0])
-                                pearson_p_shift = float(df["pearson_p_shift"].iloc[0])
-                                spearman_p = float(df["spearman_p"].iloc[0])
-                                n_years = int(df["n_years"].iloc[0])
-                                year_min = int(df["year_min"].iloc[0]) if pd.notna(df["year_min"].iloc[0]) else None
-                                year_max = int(df["year_max"].iloc[0]) if pd.notna(df["year_max"].iloc[0]) else None
-
-                            years_txt = "" if (year_min is None or year_max is None) else f"{year_min}–{year_max}"
-
-                            rows.append({
-                                "period": period, "lag": lag, "window": window, "n": n,
-                                "pearson_r": pearson, "spearman_rho": spearman, "abs_r": absr,
-                                "spec": spec,  # сохраним spec для клика по строке
-                                "n_years": n_years,
-                                "pearson_p": pearson_p,
-                                "pearson_p_shift": pearson_p_shift,
-                                "spearman_p": spearman_p,
-                                "years": years_txt,
-                            })
-
-                        except Exception as e:
-                            rows.append({
-                                "period": period, "lag": lag, "window": window, "n": 0,
-                                "pearson_r": float("nan"), "spearman_rho": float("nan"), "abs_r": float("nan"),
-                                "spec": spec,
-                                "error": str(e),
-                            })
+            for g in grid.itertuples(index=False):
+                # spec сохраняем для клика по строке (там строится scatter через run_scenario)
+                spec = SimpleNamespace(
+                    name=f"ui_batch_{scale}_{eco_metric}_{g.period}_lag{g.lag}_win{g.window}",
+                    analysis="eco_vs_climate",
+                    filters=filters,
+                    trait_scale=scale,
+                    eco_metric=eco_metric,
+                    period=g.period,
+                    lag=int(g.lag),
+                    window=int(g.window),
+                    climate_var=climate_var,
+                    bootstrap=bootstrap,
+                    plot=None,
+                )
+                pearson = float(g.pearson_r)
+                year_min = None if pd.isna(g.year_min) else int(g.year_min)
+                year_max = None if pd.isna(g.year_max) else int(g.year_max)
+                years_txt = "" if (year_min is None or year_max is None) else f"{year_min}–{year_max}"
+
+                rows.append({
+                    "period": g.period, "lag": int(g.lag), "window": int(g.window), "n": int(g.n_years),
+                    "pearson_r": pearson, "spearman_rho": float(g.spearman_rho),
+                    "abs_r": abs(pearson) if not math.isnan(pearson) else float("nan"),
+                    "spec": spec,
+                    "n_years": int(g.n_years),
+                    "pearson_p": float(g.pearson_p),
+                    "pearson_p_shift": float(g.pearson_p_shift),
+                    "n_eff": float(g.n_eff),
+                    "pearson_p_eff": float(g.pearson_p_eff),
+                    "spearman_p": float(g.spearman_p),
+                    "years": years_txt,
+                    "error": g.error,
+                })
 
             # 3) Заполняем таблицу
             self._batch_rows = rows
+            n_failed = sum(1 for r in rows if r.get("error"))
             # гарантируем, что таблица в корректном состоянии
             self.batch_table.setVisible(True)
 
-            self.batch_table.setColumnCount(12)
+            self.batch_table.setColumnCount(14)
             self.batch_table.setHorizontalHeaderLabels([
                 "period", "lag", "window", "n_years",
-                "pearson_r", "|r|", "p", "p_shift",
+                "pearson_r", "|r|", "p", "p_shift", "n_eff", "p_eff",
                 "spearman_rho", "p_s",
                 "years", "plot"
             ])
@@ -484,20 +447,26 @@ class MainWindow(QMainWindow):
                 pps = r.get("pearson_p_shift", float("nan"))
                 put(7, "" if not isinstance(pps, float) or math.isnan(pps) else f"{pps:.3g}", sort_value=pps)
 
-                # 8 spearman_rho
+                # 8 n_eff (Bretherton), 9 p_eff (pearson, поправка на автокорреляцию)
+                ne = r.get("n_eff", float("nan"))
+                put(8, "" if not isinstance(ne, float) or math.isnan(ne) else f"{ne:.1f}", sort_value=ne)
+                pe = r.get("pearson_p_eff", float("nan"))
+                put(9, "" if not isinstance(pe, float) or math.isnan(pe) else f"{pe:.3g}", sort_value=pe)
+
+                # 10 spearman_rho
                 sr = r.get("spearman_rho", float("nan"))
-                put(8, "" if not isinstance(sr, float) or math.isnan(sr) else f"{sr:.3f}", sort_value=sr)
+                put(10, "" if not isinstance(sr, float) or math.isnan(sr) else f"{sr:.3f}", sort_value=sr)
 
-                # 9 p_s (spearman)
+                # 11 p_s (spearman)
                 sp = r.get("spearman_p", float("nan"))
-                put(9, "" if not isinstance(sp, float) or math.isnan(sp) else f"{sp:.3g}", sort_value=sp)
+                put(11, "" if not isinstance(sp, float) or math.isnan(sp) else f"{sp:.3g}", sort_value=sp)
 
-                # 10 years
-                years_txt = r.get("years", "")
-                put(10, years_txt)
+                # 12 years (для упавшей комбинации — ERR, текст ошибки во всплывающей подсказке)
+                err = r.get("error")
+                put(12, "ERR" if err else r.get("years", ""))
 
-                # 11 plot
-                put(11, "click")
+                # 13 plot
+                put(13, "click")
 
                 alpha = 0.05
                 ny = int(r.get("n_years", r.get("n", 0)) or 0)
@@ -506,11 +475,13 @@ class MainWindow(QMainWindow):
                 bad_p = (not isinstance(pps, float)) or math.isnan(pps) or (pps > alpha)
                 low_n = ny < 6
 
-                if low_n or bad_p:
+                if low_n or bad_p or err:
                     for c in range(self.batch_table.columnCount()):
                         it = self.batch_table.item(i, c)
                         if it:
                             it.setFlags(it.flags() & ~Qt.ItemIsSelectable)
+                            if err:
+                                it.setToolTip(str(err))
 
 
                 # индекс исходной строки для корректного клика после сортировки
@@ -533,7 +504,8 @@ class MainWindow(QMainWindow):
                 f"BATCH DONE\n"
                 f"Eco: scale={scale}, metric={eco_metric}\n"
                 f"Filters: {filters}\n"
-                f"Combos: {total}\n"
+                f"Combos: {len(rows)}"
+                + (f" (failed: {n_failed}, see ERR rows)" if n_failed else "") + "\n"
                 f"Tip: click a row to plot scatter."
             )
         except Exception as e:
@@ -562,6 +534,7 @@ class MainWindow(QMainWindow):
     def on_mode_changed(self):
         mode_code = self.mode.currentData()
         is_eco = (mode_code == "ecospectrum")
+        is_spectrum = (mode_code == "spectrum")
         is_climate = (mode_code == "climate")
         is_batch = (mode_code == "eco_vs_climate_batch")
         is_panel = (mode_code == "panel_climate")
@@ -573,7 +546,8 @@ class MainWindow(QMainWindow):
 
         # eco controls (нужны и в panel тоже)
         self.eco_metric.setEnabled(is_eco or is_batch or is_panel or is_panel_batch)
-        self.scale.setEnabled(is_eco or is_batch or is_panel or is_panel_batch)
+        self.scale.setEnabled(is_eco or is_spectrum or is_batch or is_panel or is_panel_batch)
+        self.bootstrap_check.setEnabled(is_eco or is_batch)
 
         # main run buttons
         self.run_btn.setVisible(not (is_batch or is_panel_batch))
@@ -695,23 +669,12 @@ class MainWindow(QMainWindow):
         #     self.output.setText(msg)
 
         # 1) Собираем фильтры из UI
-        filters = {}
-
-        aff = self.affor.currentData()
-        if aff is not None:
-            filters["afforestation"] = {"in": aff}
-
-        geom_value = self.geom.currentText()
-        if geom_value != "All":
-            filters["geomorph_level"] = geom_value
-
-        profile_value = self.profile.currentText()
-        if profile_value != "All":
-            filters["source_file"] = profile_value
-
-        impact_value = self.impact.currentText()
-        if impact_value != "All":
-            filters["impact_type"] = impact_value
+        filters = build_ui_filters(
+            profile=self.profile.currentText(),
+            geomorph_level=self.geom.currentText(),
+            impact_type=self.impact.currentText(),
+            afforestation=self.affor.currentData(),
+        )
 
         msg = (
             "RUN\n"
@@ -727,7 +690,7 @@ class MainWindow(QMainWindow):
 
         # --- ECO SPECTRUM MODE ---
         if mode_code == "ecospectrum":
-            metric_name = self.eco_metric.currentText()  # cwm/sigma/w_median/w_min/w_max
+            metric_name = self.eco_metric.currentText()  # один из ECO_METRICS
 
             scale = self.scale.currentText()
 
@@ -739,6 +702,7 @@ class MainWindow(QMainWindow):
                 filters=filters,
                 groupby=["year"],
                 metric=None,
+                bootstrap=self.bootstrap_check.isChecked(),
                 plot={
                     "kind": "line",
                     "x": "year",
@@ -758,6 +722,34 @@ class MainWindow(QMainWindow):
             )
             return
 
+        # --- FULL SPECTRUM MODE ---
+        if mode_code == "spectrum":
+            scale = self.scale.currentText()
+
+            spec = SimpleNamespace(
+                name="ui_spectrum",
+                analysis="spectrum",
+                trait_scale=scale,
+                filters=filters,
+                groupby=["year"],
+                metric=None,
+                plot={
+                    "kind": "spectrum",
+                    "title": f"Ellenberg {scale} spectrum by year",
+                    "out_name": f"ui_spectrum_{scale}",
+                },
+            )
+
+            df, plot_path = run_scenario(spec)
+            self.show_plot(plot_path)
+            self.output.setText(
+                f"MODE: spectrum (Ellenberg {scale})\n"
+                f"Filters used: {filters}\n"
+                f"Years: {len(df)}, descriptions: {int(df['n_desc'].sum()) if len(df) else 0}\n"
+                f"Plot: {plot_path}"
+            )
+            return
+
         # --- CLIMATE MODE (Pedya) ---
         if mode_code == "climate":
             period = self.period_combo.currentText()